@@ -0,0 +1,198 @@
+"""
+Admission control for CPU bound requests (parse + convert).
+
+Every request is weighted by its estimated parse cost and admitted while
+the total weight in flight stays within the capacity (one slot per core by
+default). Requests beyond that wait in a bounded FIFO queue; when the queue
+is full or the wait exceeds the timeout they get 503 with a Retry-After.
+The controller is per process, each uvicorn worker has its own.
+"""
+import asyncio
+import io
+import logging
+import math
+import os
+import time
+import zipfile
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, List
+
+logger = logging.getLogger(__name__)
+
+CAPACITY = int(os.environ.get("GP2MIDI_ADMISSION_CAPACITY", "0")) or os.cpu_count() or 1
+# Requests allowed to wait for a slot, on top of the ones running
+MAX_WAITING = int(os.environ.get("GP2MIDI_ADMISSION_MAX_WAITING", "0")) or CAPACITY * 4
+QUEUE_TIMEOUT = float(os.environ.get("GP2MIDI_ADMISSION_TIMEOUT", "10"))
+
+# One slot is roughly half a second of parsing. Binary files parse at about
+# 0.5 MB/s, GPIF XML about ten times faster per uncompressed byte.
+BYTES_PER_SLOT = 256 * 1024
+XML_BYTES_PER_BINARY_BYTE = 12
+
+MAX_RETRY_AFTER = 60
+# Wait samples kept for the percentiles in the metrics
+WAIT_SAMPLES = 1024
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def estimate_weight(content: bytes, capacity: int = CAPACITY) -> int:
+    """Parse cost of an upload in slots, between 1 and the capacity."""
+    cost = len(content)
+    if content[:2] == b"PK":
+        # GP7 / zipped GPIF: the XML size drives the parse time, and the zip
+        # directory gives it without decompressing anything
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as z:
+                xml_size = sum(
+                    i.file_size for i in z.infolist() if i.filename.endswith(".gpif")
+                )
+            cost = max(cost, xml_size // XML_BYTES_PER_BINARY_BYTE)
+        except zipfile.BadZipFile:
+            pass
+    return max(1, min(capacity, math.ceil(cost / BYTES_PER_SLOT)))
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        capacity: int = CAPACITY,
+        max_waiting: int = MAX_WAITING,
+        timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[List] = deque()  # [weight, future]
+
+        # Metrics
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds_total = 0.0
+        self._wait_samples: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._service_seconds = 0.0  # moving average of time holding a slot
+
+    @asynccontextmanager
+    async def admit(self, weight: int = 1):
+        weight = max(1, min(weight, self.capacity))
+        await self._acquire(weight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_seconds = (
+                elapsed if not self._service_seconds
+                else 0.9 * self._service_seconds + 0.1 * elapsed
+            )
+            self._release(weight)
+
+    @asynccontextmanager
+    async def admit_nowait(self, weight: int = 1):
+        """
+        admit() for optional work: only takes slots that are free right now
+        and nobody is waiting for, raises AdmissionRejected otherwise.
+        """
+        weight = max(1, min(weight, self.capacity))
+        if self._waiters or self.in_flight + weight > self.capacity:
+            raise AdmissionRejected("No idle capacity.", self.retry_after())
+        self.in_flight += weight
+        try:
+            yield
+        finally:
+            self._release(weight)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire(self, weight: int):
+        queued_at = time.monotonic()
+        # FIFO: nobody overtakes a waiting request, big ones don't starve
+        if not self._waiters and self.in_flight + weight <= self.capacity:
+            self.in_flight += weight
+            self._record_wait(0.0)
+            return
+
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected_full += 1
+            raise AdmissionRejected(
+                "Server is busy, admission queue is full.", self.retry_after()
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [weight, future]
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up, hand the slots back
+                self._release(weight)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                # Leaving the head of the queue may let smaller requests in
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                raise AdmissionRejected(
+                    f"Server is busy, no capacity within {self.timeout:g}s.",
+                    self.retry_after(),
+                )
+            raise
+        self._record_wait(time.monotonic() - queued_at)
+
+    def _release(self, weight: int):
+        self.in_flight -= weight
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight + self._waiters[0][0] <= self.capacity:
+            weight, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += weight
+            future.set_result(None)
+
+    def _record_wait(self, seconds: float):
+        self.admitted += 1
+        self.wait_seconds_total += seconds
+        self._wait_samples.append(seconds)
+
+    def retry_after(self) -> int:
+        # Time for the running and waiting work to drain at the recent pace
+        backlog = len(self._waiters) + 1
+        seconds = (self._service_seconds or 1.0) * backlog / self.capacity
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(seconds)))
+
+    def metrics(self) -> dict:
+        samples = sorted(self._wait_samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "max_waiting": self.max_waiting,
+            "admitted_total": self.admitted,
+            "rejected_full_total": self.rejected_full,
+            "rejected_timeout_total": self.rejected_timeout,
+            "queue_wait_seconds_total": self.wait_seconds_total,
+            "queue_wait_seconds_p50": percentile(0.5),
+            "queue_wait_seconds_p95": percentile(0.95),
+            "queue_wait_seconds_max": samples[-1] if samples else 0.0,
+        }
+
+
+admission = AdmissionController()
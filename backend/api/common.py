@@ -0,0 +1,171 @@
+"""
+Helpers shared by the API routers: parser lookup, track selection,
+cancellation scopes, MIDI rendering from the track cache, and the mapping
+of admission, cancellation and budget errors to HTTP responses.
+"""
+import asyncio
+import io
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import quote
+
+from backend.api.admission import AdmissionRejected
+from backend.core.budget import BudgetExceeded
+from backend.core.cancellation import Cancelled, CancelToken, DeadlineExceeded
+from backend.core.imports import timed_import
+from backend.core.parser.registry import parser_for_content
+from backend.core.storage.note_index import NoteIndex
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# CPU time a single request may spend parsing and writing, 0 disables it
+REQUEST_DEADLINE_SECONDS = float(
+    os.environ.get("GP2MIDI_REQUEST_DEADLINE_SECONDS", "60")
+)
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+def get_parser(filename: str, content: bytes):
+    # Identify parser from the magic bytes, the extension is a fallback
+    parser = parser_for_content(content, filename)
+    if parser is None:
+        logger.warning(f"Unsupported file format: {filename}")
+        raise HTTPException(status_code=400, detail="Unsupported file format.")
+    logger.info(f"Using {type(parser).__name__}")
+    return parser
+
+
+def parse_selected_tracks(selected_tracks: str) -> list:
+    if not selected_tracks:
+        return []
+    try:
+        # expecting "1,2,3"
+        return [int(tid.strip()) for tid in selected_tracks.split(",") if tid.strip()]
+    except Exception as e:
+        # Proceed with all tracks rather than failing the request
+        logger.warning(f"Failed to parse selected_tracks: {e}")
+        return []
+
+
+@asynccontextmanager
+async def cancel_scope(request: Request):
+    # The parse/write checkpoints see the token from the threadpool; it is
+    # cancelled when the client goes away and expires with the deadline
+    token = CancelToken(timeout=REQUEST_DEADLINE_SECONDS or None)
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    try:
+        yield token
+    finally:
+        watcher.cancel()
+
+
+async def _watch_disconnect(request: Request, token: CancelToken):
+    while not token.cancelled:
+        if await request.is_disconnected():
+            logger.info("Client disconnected, cancelling its conversion")
+            token.cancel("Client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+def busy(e: AdmissionRejected) -> HTTPException:
+    logger.warning(f"Request rejected: {e}")
+    return HTTPException(
+        status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def cancelled(e: Cancelled) -> HTTPException:
+    if isinstance(e, DeadlineExceeded):
+        logger.warning(f"Request aborted: {e}")
+        return HTTPException(status_code=504, detail=f"Conversion took too long. {e}.")
+    # Nobody is listening anymore, 499 only shows up in the access log
+    logger.info(f"Request cancelled: {e}")
+    return HTTPException(status_code=499, detail=str(e))
+
+
+def over_budget(e: BudgetExceeded) -> HTTPException:
+    logger.warning(f"Request rejected: {e}")
+    # Too much data is 413, a small file expanding into too much work is 422
+    status = 413 if e.resource == "decompressed_bytes" else 422
+    return HTTPException(
+        status_code=status, detail={"message": str(e), "limit": e.resource}
+    )
+
+
+def render_midi(
+    song,
+    high_fidelity: bool,
+    cancel: CancelToken = None,
+    song_key: str = None,
+    compact: bool = False,
+    allocation: str = "strings",
+) -> bytes:
+    # Convert
+    logger.info("Converting to MIDI...")
+    # mido is imported with the first conversion, not at startup
+    midi_writer = timed_import("backend.core.converter.midi_writer")
+    # With the file's key, encoded tracks are cached for later conversions
+    writer = midi_writer.MidiWriter(
+        song,
+        high_fidelity=high_fidelity,
+        cache=track_cache(),
+        song_key=song_key,
+        compact=compact,
+        allocation=allocation,
+    )
+
+    # Write to in-memory buffer
+    midi_buffer = io.BytesIO()
+    writer.write(file=midi_buffer, cancel=cancel)
+
+    midi_content = midi_buffer.getvalue()
+    logger.info(f"MIDI generated in memory. Size: {len(midi_content)} bytes")
+    return midi_content
+
+
+def track_cache():
+    return timed_import("backend.core.converter.track_cache").track_cache
+
+
+def cached_midi(
+    song_key: str, high_fidelity: bool, selected_ids: list, compact: bool = False
+):
+    midi_writer = timed_import("backend.core.converter.midi_writer")
+    return midi_writer.MidiWriter.from_cache(
+        track_cache(), song_key, high_fidelity, selected_ids, compact
+    )
+
+
+def midi_response(midi_content: bytes, download_name: str):
+    # RFC 5987 compliant encoding
+    encoded_filename = quote(download_name)
+
+    return StreamingResponse(
+        io.BytesIO(midi_content),
+        media_type="audio/midi",
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
+        },
+    )
+
+
+def notes_response(
+    index: NoteIndex,
+    track_id: int,
+    first_measure: int,
+    measures: int,
+    start_tick: Optional[int],
+    end_tick: Optional[int],
+    format: str,
+):
+    if track_id not in index.tracks:
+        raise HTTPException(status_code=404, detail="Track not found.")
+    page = index.page(track_id, first_measure, measures, start_tick, end_tick)
+    if format == "binary":
+        return Response(page.to_bytes(), media_type="application/octet-stream")
+    return page.to_json()
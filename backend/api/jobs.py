@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+from functools import lru_cache
+from typing import Literal, Optional
+from urllib.parse import quote
+
+from backend.api.common import get_parser, over_budget, parse_selected_tracks
+from backend.api.uploads import read_upload
+from backend.core.budget import BudgetExceeded
+from backend.jobs.store import JobStore, QueueFull
+from backend.models.job_model import JobOptions, JobStatus
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+router = APIRouter(prefix="/jobs")
+logger = logging.getLogger(__name__)
+
+EVENT_POLL_SECONDS = 0.25
+# Comment lines keep proxies from closing an idle event stream
+KEEPALIVE_SECONDS = 15.0
+
+
+@lru_cache(maxsize=1)
+def get_job_store() -> JobStore:
+    return JobStore()
+
+
+@router.post("", status_code=202)
+async def submit_job(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    high_fidelity: bool = True,
+    selected_tracks: str = None, # Comma-separated list of track IDs
+    filename: Optional[str] = None, # For raw application/octet-stream bodies
+    compact: bool = False, # Drop events that don't change playback
+    allocation: Literal["strings", "interval"] = "strings", # Channel allocation
+    store: JobStore = Depends(get_job_store),
+):
+    try:
+        upload_name, content = await read_upload(request, file, filename)
+    except BudgetExceeded as e:
+        raise over_budget(e)
+    filename = upload_name.lower()
+    # Reject unknown formats now rather than in the worker
+    get_parser(filename, content)
+
+    options = JobOptions(
+        high_fidelity=high_fidelity,
+        selected_tracks=parse_selected_tracks(selected_tracks),
+        compact=compact,
+        allocation=allocation,
+    )
+    try:
+        job = await run_in_threadpool(store.submit, upload_name, content, options)
+    except QueueFull as e:
+        logger.warning(f"Rejecting job for {filename}: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    return {"job_id": job.id, "status": job.status.value}
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, store: JobStore = Depends(get_job_store)):
+    job = await run_in_threadpool(_require_job, store, job_id)
+    return job.model_dump(mode="json")
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, store: JobStore = Depends(get_job_store)):
+    job = await run_in_threadpool(_require_job, store, job_id)
+    if job.status == JobStatus.FAILED:
+        raise HTTPException(status_code=422, detail={"message": job.error})
+    if job.status != JobStatus.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}.")
+
+    midi_content = await run_in_threadpool(store.get_result, job_id)
+    encoded_filename = quote(f"{job.filename}.mid")
+    return Response(
+        midi_content,
+        media_type="audio/midi",
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
+        },
+    )
+
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    last_event_id: Optional[str] = Header(None),
+    store: JobStore = Depends(get_job_store),
+):
+    await run_in_threadpool(_require_job, store, job_id)
+    # EventSource sends Last-Event-ID when it reconnects
+    after_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def stream():
+        nonlocal after_id
+        idle = 0.0
+        while True:
+            events = await run_in_threadpool(store.events_since, job_id, after_id)
+            for event in events:
+                after_id = event.id
+                yield (
+                    f"id: {event.id}\nevent: {event.event}\n"
+                    f"data: {json.dumps(event.data)}\n\n"
+                )
+                if event.event in ("done", "failed"):
+                    return
+
+            if events:
+                idle = 0.0
+            elif idle >= KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+            idle += EVENT_POLL_SECONDS
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _require_job(store: JobStore, job_id: str):
+    job = store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
@@ -0,0 +1,175 @@
+import logging
+from functools import lru_cache
+from typing import Literal, Optional
+
+from backend.api.admission import AdmissionRejected, admission
+from backend.api.common import (
+    busy,
+    cached_midi,
+    cancel_scope,
+    cancelled,
+    midi_response,
+    notes_response,
+    over_budget,
+    parse_selected_tracks,
+    render_midi,
+    track_cache,
+)
+from backend.core.budget import BudgetExceeded
+from backend.core.cancellation import Cancelled
+from backend.core.storage.note_index import DEFAULT_PAGE_MEASURES, NoteIndex
+from backend.library.store import LibraryStore
+from backend.models.library_model import LibrarySong
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+router = APIRouter(prefix="/library")
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_library_store() -> LibraryStore:
+    return LibraryStore()
+
+
+@router.get("/songs")
+async def search_songs(
+    q: Optional[str] = None, # Part of the title, artist or a track name
+    artist: Optional[str] = None,
+    program: Optional[int] = None, # GM program one of the tracks plays
+    limit: int = 50,
+    offset: int = 0,
+    store: LibraryStore = Depends(get_library_store),
+):
+    songs = await run_in_threadpool(store.search, q, artist, program, limit, offset)
+    return {"songs": [_song_summary(song) for song in songs]}
+
+
+@router.get("/songs/{song_id}")
+async def get_song(song_id: int, store: LibraryStore = Depends(get_library_store)):
+    song = await run_in_threadpool(_require_song, store, song_id)
+    return _song_summary(song)
+
+
+@router.post("/songs/{song_id}/convert")
+async def convert_song(
+    request: Request,
+    song_id: int,
+    high_fidelity: bool = True,
+    selected_tracks: str = None, # Comma-separated list of track IDs
+    compact: bool = False, # Drop events that don't change playback
+    allocation: Literal["strings", "interval"] = "strings", # Channel allocation
+    store: LibraryStore = Depends(get_library_store),
+):
+    entry = await run_in_threadpool(_require_song, store, song_id)
+    if entry.error:
+        raise HTTPException(status_code=422, detail={"message": entry.error})
+    download_name = f"{entry.title or entry.id}.mid"
+    logger.info(
+        f"Received library conversion request for song {song_id} "
+        f"(High Fidelity: {high_fidelity}, Selected Tracks: {selected_tracks}, "
+        f"Compact: {compact}, Allocation: {allocation})"
+    )
+
+    try:
+        # Songs are keyed by content hash like uploads, converting a catalogue
+        # song after uploading the same file (or the other way) hits the cache
+        selected_ids = parse_selected_tracks(selected_tracks)
+        if allocation == "strings":
+            midi_content = cached_midi(
+                entry.content_hash, high_fidelity, selected_ids, compact
+            )
+            if midi_content is not None:
+                logger.info("Serving conversion from cached tracks.")
+                return midi_response(midi_content, download_name)
+
+        # Reading the packed IR is cheap, a single slot is enough
+        async with admission.admit(1), cancel_scope(request) as cancel:
+            song = await run_in_threadpool(store.load_song, entry)
+            track_cache().remember_song(entry.content_hash, song)
+            if selected_ids:
+                song.tracks = [t for t in song.tracks if t.number in selected_ids]
+            midi_content = await run_in_threadpool(
+                render_midi,
+                song,
+                high_fidelity,
+                cancel,
+                entry.content_hash,
+                compact,
+                allocation,
+            )
+        return midi_response(midi_content, download_name)
+
+    except AdmissionRejected as e:
+        raise busy(e)
+    except Cancelled as e:
+        raise cancelled(e)
+    except BudgetExceeded as e:
+        raise over_budget(e)
+    except FileNotFoundError:
+        # Re-ingested or pruned since it was looked up
+        raise HTTPException(status_code=404, detail="Song not found.")
+
+
+@router.get("/songs/{song_id}/tracks/{track_id}/notes")
+async def get_song_notes(
+    song_id: int,
+    track_id: int,
+    first_measure: int = 0, # 0-based
+    measures: int = DEFAULT_PAGE_MEASURES,
+    start_tick: Optional[int] = None, # Notes sounding in [start_tick, end_tick)
+    end_tick: Optional[int] = None,
+    format: Literal["json", "binary"] = "json",
+    store: LibraryStore = Depends(get_library_store),
+):
+    entry = await run_in_threadpool(_require_song, store, song_id)
+    if entry.error:
+        raise HTTPException(status_code=422, detail={"message": entry.error})
+    return await run_in_threadpool(
+        _library_notes,
+        store,
+        entry,
+        track_id,
+        first_measure,
+        measures,
+        start_tick,
+        end_tick,
+        format,
+    )
+
+
+def _library_notes(store: LibraryStore, entry: LibrarySong, *page_args):
+    # The packed IR is mapped, a page only touches the pages it reads
+    try:
+        index = NoteIndex.open(store.ir_path(entry.content_hash))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Song not found.")
+    with index:
+        return notes_response(index, *page_args)
+
+
+def _require_song(store: LibraryStore, song_id: int) -> LibrarySong:
+    song = store.get(song_id)
+    if song is None:
+        raise HTTPException(status_code=404, detail="Song not found.")
+    return song
+
+
+def _song_summary(song: LibrarySong) -> dict:
+    # Tracks in the /analyze shape, ids work with selected_tracks
+    return {
+        "id": song.id,
+        "title": song.title,
+        "artist": song.artist,
+        "path": song.path,
+        "error": song.error,
+        "tracks": [
+            {
+                "id": track.number,
+                "name": track.name,
+                "program": track.program,
+                "is_percussion": track.is_percussion,
+            }
+            for track in song.tracks
+        ],
+    }
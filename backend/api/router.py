@@ -1,26 +1,55 @@
-import io
 import logging
 import traceback
-from urllib.parse import quote
+from typing import Literal, Optional
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
-from fastapi.responses import StreamingResponse
-
-from backend.core.parser.binary_parser import BinaryParser
-from backend.core.parser.xml_parser import XmlParser
-from backend.core.converter.midi_writer import MidiWriter
+from backend.api.admission import AdmissionRejected, admission, estimate_weight
+from backend.api.common import (
+    busy,
+    cached_midi,
+    cancel_scope,
+    cancelled,
+    get_parser,
+    midi_response,
+    notes_response,
+    over_budget,
+    parse_selected_tracks,
+    render_midi,
+    track_cache,
+)
+from backend.api.speculation import SPECULATION_ENABLED, content_key, speculation
+from backend.api.uploads import read_upload
+from backend.core.budget import BudgetExceeded
+from backend.core.cancellation import Cancelled, CancelToken
+from backend.core.imports import import_timings
+from backend.core.storage.note_index import DEFAULT_PAGE_MEASURES, note_index_cache
+from fastapi import APIRouter, BackgroundTasks, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/analyze")
-async def analyze_file(file: UploadFile = File(...)):
-    filename = file.filename.lower()
-    logger.info(f"Received analysis request for file: {filename}")
+DEFAULT_PREVIEW_SECONDS = 15.0
+MAX_PREVIEW_SECONDS = 60.0
 
+@router.post("/analyze")
+async def analyze_file(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: Optional[UploadFile] = File(None),
+    filename: Optional[str] = None, # For raw application/octet-stream bodies
+    speculate: bool = True, # Pre-convert with the default options in the background
+):
     try:
-        content = await file.read()
-        song = _parse_file_content(filename, content)
+        upload_name, content = await read_upload(request, file, filename)
+        filename = upload_name.lower()
+        logger.info(f"Received analysis request for file: {filename}")
+
+        weight = estimate_weight(content)
+        song_key = content_key(content)
+        async with admission.admit(weight), cancel_scope(request) as cancel:
+            song = await run_in_threadpool(
+                _parse_file_content, filename, content, cancel, song_key
+            )
         
         tracks = []
         for track in song.tracks:
@@ -31,11 +60,26 @@ async def analyze_file(file: UploadFile = File(...)):
                 "is_percussion": track.is_percussion,
                 "channel": track.channel
             })
+
+        # The convert that usually follows can then be served from memory
+        if speculate and SPECULATION_ENABLED:
+            speculation.schedule(
+                content, lambda token: render_midi(song, True, token, song_key), weight
+            )
+        # Packed for the piano roll (GET /songs/{song_key}/tracks/{id}/notes)
+        # once the response is out, off the admission slot
+        background_tasks.add_task(note_index_cache.remember_song, song_key, song)
             
-        return {"tracks": tracks}
+        return {"tracks": tracks, "song_key": song_key}
 
     except HTTPException as he:
         raise he
+    except AdmissionRejected as e:
+        raise busy(e)
+    except Cancelled as e:
+        raise cancelled(e)
+    except BudgetExceeded as e:
+        raise over_budget(e)
     except Exception as e:
         error_trace = traceback.format_exc()
         logger.error(f"Error during analysis: {e}")
@@ -45,60 +89,70 @@ async def analyze_file(file: UploadFile = File(...)):
 
 @router.post("/convert")
 async def convert_file(
-    file: UploadFile = File(...), 
+    request: Request,
+    file: Optional[UploadFile] = File(None),
     high_fidelity: bool = True,
-    selected_tracks: str = None # Comma-separated list of track IDs
+    selected_tracks: str = None, # Comma-separated list of track IDs
+    filename: Optional[str] = None, # For raw application/octet-stream bodies
+    compact: bool = False, # Drop events that don't change playback
+    allocation: Literal["strings", "interval"] = "strings", # Channel allocation
 ):
-    filename = file.filename.lower()
-    logger.info(
-        f"Received conversion request for file: {filename} "
-        f"(High Fidelity: {high_fidelity}, Selected Tracks: {selected_tracks})"
-    )
-
     try:
-        content = await file.read()
-        song = _parse_file_content(filename, content)
-
-        # Filter tracks if selection is provided
-        if selected_tracks:
-            try:
-                # expecting "1,2,3"
-                selected_ids = [int(tid.strip()) for tid in selected_tracks.split(",") if tid.strip()]
-                if selected_ids:
-                    # Filter existing tracks. Keep order.
-                    # Note: Track.number is 1-based index assigned during parse
-                    song.tracks = [t for t in song.tracks if t.number in selected_ids]
-                    logger.info(f"Filtered to {len(song.tracks)} tracks.")
-            except Exception as e:
-                logger.warning(f"Failed to parse selected_tracks: {e}")
-                # Fallback to all tracks or raise error? 
-                # Let's log and proceed with all tracks to be safe, or maybe just ignore the filter.
-
-        # Convert
-        logger.info("Converting to MIDI...")
-        writer = MidiWriter(song, high_fidelity=high_fidelity)
-
-        # Write to in-memory buffer
-        midi_buffer = io.BytesIO()
-        writer.write(file=midi_buffer)
-        midi_buffer.seek(0)
-        
-        midi_content = midi_buffer.getvalue()
-        logger.info(f"MIDI generated in memory. Size: {len(midi_content)} bytes")
-
-        # RFC 5987 compliant encoding
-        encoded_filename = quote(f"{file.filename}.mid")
-
-        return StreamingResponse(
-            io.BytesIO(midi_content),
-            media_type="audio/midi",
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            },
+        upload_name, content = await read_upload(request, file, filename)
+        filename = upload_name.lower()
+        logger.info(
+            f"Received conversion request for file: {filename} "
+            f"(High Fidelity: {high_fidelity}, Selected Tracks: {selected_tracks}, "
+            f"Compact: {compact}, Allocation: {allocation})"
         )
 
+        selected_ids = parse_selected_tracks(selected_tracks)
+        default_options = not compact and allocation == "strings"
+        speculative = high_fidelity and not selected_ids and default_options
+        if SPECULATION_ENABLED and speculative:
+            # Rendered in the background after /analyze
+            midi_content = await speculation.get(content)
+            if midi_content is not None:
+                logger.info("Serving speculative conversion.")
+                return midi_response(midi_content, f"{upload_name}.mid")
+
+        # Converted before with other options: the tracks are cached already
+        # (interval allocations are planned for the whole song, not cached)
+        song_key = content_key(content)
+        midi_content = None
+        if allocation == "strings":
+            midi_content = cached_midi(song_key, high_fidelity, selected_ids, compact)
+        if midi_content is not None:
+            logger.info("Serving conversion from cached tracks.")
+            return midi_response(midi_content, f"{upload_name}.mid")
+
+        weight = estimate_weight(content)
+        async with admission.admit(weight), cancel_scope(request) as cancel:
+            song = await run_in_threadpool(
+                _parse_file_content, filename, content, cancel, song_key
+            )
+
+            # Filter tracks if selection is provided
+            if selected_ids:
+                # Filter existing tracks. Keep order.
+                # Note: Track.number is 1-based index assigned during parse
+                song.tracks = [t for t in song.tracks if t.number in selected_ids]
+                logger.info(f"Filtered to {len(song.tracks)} tracks.")
+
+            midi_content = await run_in_threadpool(
+                render_midi, song, high_fidelity, cancel, song_key, compact, allocation
+            )
+
+        return midi_response(midi_content, f"{upload_name}.mid")
+
     except HTTPException as he:
         raise he
+    except AdmissionRejected as e:
+        raise busy(e)
+    except Cancelled as e:
+        raise cancelled(e)
+    except BudgetExceeded as e:
+        raise over_budget(e)
     except Exception as e:
         error_trace = traceback.format_exc()
         logger.error(f"Error during conversion: {e}")
@@ -106,23 +160,114 @@ async def convert_file(
         raise HTTPException(status_code=500, detail={"message": str(e), "trace": error_trace})
 
 
-def _parse_file_content(filename: str, content: bytes):
-    logger.info(f"File size: {len(content)} bytes")
+@router.post("/preview")
+async def preview_file(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    seconds: float = DEFAULT_PREVIEW_SECONDS,
+    high_fidelity: bool = True,
+    selected_tracks: str = None, # Comma-separated list of track IDs
+    filename: Optional[str] = None, # For raw application/octet-stream bodies
+):
+    if not 0 < seconds <= MAX_PREVIEW_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be between 0 and {MAX_PREVIEW_SECONDS}.",
+        )
 
-    # Identify parser
-    parser = None
-    if filename.endswith((".gp3", ".gp4", ".gp5")):
-        logger.info("Using BinaryParser")
-        parser = BinaryParser()
-    elif filename.endswith((".gpx", ".gp")):
-        logger.info("Using XmlParser")
-        parser = XmlParser()
-    else:
-        logger.warning(f"Unsupported file format: {filename}")
-        raise HTTPException(status_code=400, detail="Unsupported file format.")
+    try:
+        upload_name, content = await read_upload(request, file, filename)
+        filename = upload_name.lower()
+        logger.info(
+            f"Received preview request for file: {filename} "
+            f"(Seconds: {seconds}, Selected Tracks: {selected_tracks})"
+        )
+        parser = get_parser(filename, content)
+
+        # Only the measures covering the first `seconds` are parsed, a
+        # single slot is enough whatever the file size
+        selected_ids = parse_selected_tracks(selected_tracks)
+        async with admission.admit(1), cancel_scope(request) as cancel:
+            song = await run_in_threadpool(
+                parser.parse_preview_bytes, content, seconds, selected_ids, cancel
+            )
+            logger.info(
+                f"Preview parsed: {len(song.tracks)} tracks, "
+                f"{max((len(t.measures) for t in song.tracks), default=0)} measures."
+            )
+            midi_content = await run_in_threadpool(
+                render_midi, song, high_fidelity, cancel
+            )
+
+        return midi_response(midi_content, f"{upload_name}.preview.mid")
+
+    except HTTPException as he:
+        raise he
+    except AdmissionRejected as e:
+        raise busy(e)
+    except Cancelled as e:
+        raise cancelled(e)
+    except BudgetExceeded as e:
+        raise over_budget(e)
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        logger.error(f"Error during preview: {e}")
+        logger.error(error_trace)
+        raise HTTPException(
+            status_code=500, detail={"message": str(e), "trace": error_trace}
+        )
+
+
+@router.get("/songs/{song_key}/tracks/{track_id}/notes")
+async def get_notes(
+    song_key: str,
+    track_id: int,
+    first_measure: int = 0, # 0-based
+    measures: int = DEFAULT_PAGE_MEASURES,
+    start_tick: Optional[int] = None, # Notes sounding in [start_tick, end_tick)
+    end_tick: Optional[int] = None,
+    format: Literal["json", "binary"] = "json",
+):
+    # Songs analyzed recently, by the song_key /analyze returned
+    index = note_index_cache.get(song_key)
+    if index is None:
+        raise HTTPException(
+            status_code=404, detail="Song not analyzed recently, analyze it again."
+        )
+    return await run_in_threadpool(
+        notes_response,
+        index,
+        track_id,
+        first_measure,
+        measures,
+        start_tick,
+        end_tick,
+        format,
+    )
+
+
+@router.get("/metrics")
+async def metrics():
+    return {
+        "admission": admission.metrics(),
+        "speculation": speculation.metrics(),
+        "track_cache": track_cache().metrics(),
+        "note_index": note_index_cache.metrics(),
+        "imports": import_timings(),
+    }
+
+
+def _parse_file_content(
+    filename: str, content: bytes, cancel: CancelToken = None, song_key: str = None
+):
+    logger.info(f"File size: {len(content)} bytes")
+    parser = get_parser(filename, content)
 
     # Parse
     logger.info("Parsing file...")
-    song = parser.parse_bytes(content)
+    song = parser.parse_bytes(content, cancel)
     logger.info("Parsing complete.")
+    if song_key:
+        # Lets a later conversion be assembled from cached tracks
+        track_cache().remember_song(song_key, song)
     return song
@@ -0,0 +1,159 @@
+"""
+Speculative conversion after /api/analyze.
+
+Nearly every analyze is followed by a convert of the same file with the
+default options (high fidelity, all tracks). While the song parsed for the
+analysis is still in memory, it is rendered in the background and the MIDI
+kept in a small LRU cache keyed by the file's hash, so that convert answers
+without parsing anything.
+
+Speculation never competes with real requests: it only runs on admission
+slots that are idle right now, is cancelled as soon as a request has to
+wait for a slot, and its results are bounded in bytes.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from backend.api.admission import AdmissionController, AdmissionRejected, admission
+from backend.core.cancellation import Cancelled, CancelToken
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_ENABLED = os.environ.get("GP2MIDI_SPECULATION", "1") == "1"
+# Memory for speculative results, least recently used ones are dropped first
+CACHE_BYTES = int(
+    os.environ.get("GP2MIDI_SPECULATION_CACHE_BYTES", str(64 * 1024 * 1024))
+)
+# Background renders running at once
+MAX_TASKS = int(os.environ.get("GP2MIDI_SPECULATION_MAX_TASKS", "1"))
+LOAD_POLL_SECONDS = 0.05
+
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class SpeculativeConverter:
+    def __init__(
+        self,
+        controller: AdmissionController,
+        max_bytes: int = CACHE_BYTES,
+        max_tasks: int = MAX_TASKS,
+    ):
+        self.controller = controller
+        self.max_bytes = max_bytes
+        self.max_tasks = max_tasks
+        self._results: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self.started = 0
+        self.completed = 0
+        self.dropped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(
+        self, content: bytes, render: Callable[[CancelToken], bytes], weight: int = 1
+    ) -> bool:
+        """
+        Starts `render(cancel)` in the background unless the result is
+        already known or being computed, or there is no room for it. Must be
+        called from the event loop.
+        """
+        key = content_key(content)
+        if key in self._results or key in self._pending:
+            return False
+        if len(self._pending) >= self.max_tasks or self.controller.waiting:
+            self.dropped += 1
+            return False
+        self.started += 1
+        self._pending[key] = asyncio.create_task(self._run(key, render, weight))
+        return True
+
+    async def get(self, content: bytes) -> Optional[bytes]:
+        """The speculative result for `content`, waits for it while it renders."""
+        key = content_key(content)
+        midi = self._results.get(key)
+        if midi is None and key in self._pending:
+            # Shielded: a client giving up must not cancel the render for others
+            midi = await asyncio.shield(self._pending[key])
+        if midi is None:
+            self.misses += 1
+            return None
+        if key in self._results:
+            self._results.move_to_end(key)
+        self.hits += 1
+        return midi
+
+    async def _run(
+        self, key: str, render: Callable[[CancelToken], bytes], weight: int
+    ) -> Optional[bytes]:
+        token = CancelToken()
+        watcher = asyncio.create_task(self._watch_load(token))
+        try:
+            async with self.controller.admit_nowait(weight):
+                midi = await run_in_threadpool(render, token)
+        except (AdmissionRejected, Cancelled) as e:
+            logger.info(f"Speculative conversion dropped: {e}")
+            self.dropped += 1
+            return None
+        except Exception as e:
+            # The real convert will report the error if there is one
+            logger.warning(f"Speculative conversion failed: {e}")
+            self.dropped += 1
+            return None
+        finally:
+            # Also stops the render if this task itself is cancelled
+            token.cancel("Speculation stopped")
+            watcher.cancel()
+            self._pending.pop(key, None)
+
+        self.completed += 1
+        self._store(key, midi)
+        return midi
+
+    async def _watch_load(self, token: CancelToken):
+        while not token.cancelled:
+            if self.controller.waiting:
+                token.cancel("Requests are waiting for capacity")
+                return
+            await asyncio.sleep(LOAD_POLL_SECONDS)
+
+    def _store(self, key: str, midi: bytes):
+        # A result taking more than a quarter of the cache would flush
+        # everything else for a single file
+        if len(midi) > self.max_bytes // 4:
+            return
+        self._results[key] = midi
+        self._bytes += len(midi)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._results.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def clear(self):
+        self._results.clear()
+        self._bytes = 0
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": SPECULATION_ENABLED,
+            "cached": len(self._results),
+            "cached_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "running": len(self._pending),
+            "started_total": self.started,
+            "completed_total": self.completed,
+            "dropped_total": self.dropped,
+            "hits_total": self.hits,
+            "misses_total": self.misses,
+        }
+
+
+speculation = SpeculativeConverter(admission)
@@ -0,0 +1,105 @@
+"""
+Reading uploads from either a multipart form or a raw request body.
+
+Browsers post multipart forms with a `file` field. API clients can instead
+send the file itself as the body:
+
+    POST /api/convert?filename=song.gp
+    Content-Type: application/octet-stream
+    Content-Encoding: gzip            (optional)
+
+The name can also be given in an X-Filename header; it is only used for
+logs and the download name, the format is sniffed from the content. Gzip
+bodies are decompressed as they arrive and count against the same
+decompressed size limit as the zip inside a .gp file.
+"""
+import logging
+import zlib
+from typing import Optional, Tuple
+
+from backend.core import budget
+from backend.core.budget import BudgetExceeded
+from fastapi import HTTPException, Request, UploadFile
+
+logger = logging.getLogger(__name__)
+
+RAW_CONTENT_TYPES = ("application/octet-stream", "")
+IDENTITY_ENCODINGS = ("", "identity")
+GZIP_ENCODINGS = ("gzip", "x-gzip")
+FILENAME_HEADER = "x-filename"
+DEFAULT_FILENAME = "upload"
+
+
+async def read_upload(
+    request: Request,
+    file: Optional[UploadFile],
+    filename: Optional[str] = None,
+) -> Tuple[str, bytes]:
+    """Returns (filename, content) of the uploaded file, however it was sent."""
+    if file is not None:
+        return file.filename or DEFAULT_FILENAME, await file.read()
+
+    content_type = request.headers.get("content-type", "").split(";", 1)[0]
+    content_type = content_type.strip().lower()
+    if content_type not in RAW_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail=(
+                "Send a multipart form with a `file` field "
+                "or an application/octet-stream body."
+            ),
+        )
+
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    if encoding in IDENTITY_ENCODINGS:
+        content = await _read_body(request)
+    elif encoding in GZIP_ENCODINGS:
+        content = await _read_gzip_body(request, budget.MAX_DECOMPRESSED_BYTES)
+    else:
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported Content-Encoding: {encoding}"
+        )
+
+    if not content:
+        raise HTTPException(status_code=400, detail="No file uploaded.")
+    name = filename or request.headers.get(FILENAME_HEADER) or DEFAULT_FILENAME
+    logger.info(
+        f"Raw upload {name}: {len(content)} bytes "
+        f"(encoding: {encoding or 'identity'})"
+    )
+    return name, content
+
+
+async def _read_body(request: Request) -> bytes:
+    chunks = bytearray()
+    async for chunk in request.stream():
+        chunks += chunk
+    return bytes(chunks)
+
+
+async def _read_gzip_body(request: Request, max_size: int) -> bytes:
+    # Decompressed a chunk at a time so a gzip bomb is stopped at `max_size`
+    # instead of being inflated in full. Concatenated members are valid gzip.
+    out = bytearray()
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    in_member = False
+    try:
+        async for chunk in request.stream():
+            while chunk:
+                in_member = True
+                # +1 to tell "exactly max_size" from "more than max_size"
+                out += decompressor.decompress(chunk, max_size - len(out) + 1)
+                if len(out) > max_size:
+                    raise BudgetExceeded("decompressed_bytes", max_size)
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                    in_member = False
+                else:
+                    chunk = decompressor.unconsumed_tail
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+
+    if in_member:
+        raise HTTPException(status_code=400, detail="Truncated gzip body.")
+    return bytes(out)
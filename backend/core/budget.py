@@ -0,0 +1,135 @@
+"""
+Resource budgets for parsing untrusted files.
+
+A .gp file is a zip whose score.gpif can decompress to any size, and its
+id-referenced sections can point at the same Voice/Beat/Note over and over,
+so a small upload can expand into an enormous song. Parsers charge what
+they read and build against a ParseBudget while streaming, and stop with
+BudgetExceeded as soon as one limit is crossed.
+"""
+import os
+import xml.etree.ElementTree as ET
+from typing import Iterable, Optional
+
+MAX_DECOMPRESSED_BYTES = int(
+    os.environ.get("GP2MIDI_MAX_DECOMPRESSED_BYTES", str(128 * 1024 * 1024))
+)
+MAX_XML_ELEMENTS = int(os.environ.get("GP2MIDI_MAX_XML_ELEMENTS", "4000000"))
+# Beats and notes created in the IR, after resolving references
+MAX_NOTES = int(os.environ.get("GP2MIDI_MAX_NOTES", "1000000"))
+# MIDI events (notes, pitch bends...) rendered for a single track
+MAX_EVENTS_PER_TRACK = int(os.environ.get("GP2MIDI_MAX_EVENTS_PER_TRACK", "2000000"))
+
+READ_CHUNK = 64 * 1024
+
+
+class BudgetExceeded(ValueError):
+    def __init__(self, resource: str, limit: int):
+        name = resource.replace("_", " ")
+        super().__init__(f"File exceeds the {name} limit ({limit})")
+        self.resource = resource
+        self.limit = limit
+
+
+class ParseBudget:
+    """Limits plus what has been used so far, use one per parse."""
+
+    def __init__(
+        self,
+        max_decompressed_bytes: Optional[int] = None,
+        max_elements: Optional[int] = None,
+        max_notes: Optional[int] = None,
+        max_events_per_track: Optional[int] = None,
+    ):
+        self.max_decompressed_bytes = _or(
+            max_decompressed_bytes, MAX_DECOMPRESSED_BYTES
+        )
+        self.max_elements = _or(max_elements, MAX_XML_ELEMENTS)
+        self.max_notes = _or(max_notes, MAX_NOTES)
+        self.max_events_per_track = _or(max_events_per_track, MAX_EVENTS_PER_TRACK)
+
+        self.decompressed_bytes = 0
+        self.elements = 0
+        self.notes = 0
+
+    def check_declared_size(self, size: int):
+        # Zip headers can lie, this only rejects honest bombs early;
+        # BudgetedReader enforces the real size
+        if size > self.max_decompressed_bytes:
+            raise BudgetExceeded("decompressed_bytes", self.max_decompressed_bytes)
+
+    def charge_bytes(self, count: int):
+        self.decompressed_bytes += count
+        if self.decompressed_bytes > self.max_decompressed_bytes:
+            raise BudgetExceeded("decompressed_bytes", self.max_decompressed_bytes)
+
+    def charge_element(self):
+        self.elements += 1
+        if self.elements > self.max_elements:
+            raise BudgetExceeded("xml_elements", self.max_elements)
+
+    def charge_notes(self, count: int = 1):
+        self.notes += count
+        if self.notes > self.max_notes:
+            raise BudgetExceeded("notes", self.max_notes)
+
+    def check_events(self, count: int):
+        if count > self.max_events_per_track:
+            raise BudgetExceeded("events_per_track", self.max_events_per_track)
+
+    def reader(self, f) -> "BudgetedReader":
+        return BudgetedReader(f, self)
+
+    def parse_xml(self, f) -> ET.Element:
+        """ET.parse() that counts bytes and elements while streaming."""
+        root = None
+        for _, elem in ET.iterparse(self.reader(f), events=("start",)):
+            self.charge_element()
+            if root is None:
+                root = elem
+        if root is None:
+            raise ValueError("Invalid GPX/GP file: empty score.gpif")
+        return root
+
+    def feed_xml(self, chunks: Iterable) -> ET.Element:
+        """parse_xml() for a document already split in buffers (memoryviews
+        are fed to expat as they are)."""
+        parser = ET.XMLPullParser(events=("start",))
+        root = None
+        for chunk in chunks:
+            self.charge_bytes(len(chunk))
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                self.charge_element()
+                if root is None:
+                    root = elem
+        parser.close()
+        if root is None:
+            raise ValueError("Invalid GPX/GP file: empty score.gpif")
+        return root
+
+
+class BudgetedReader:
+    """Read-only file wrapper charging every byte read to a budget."""
+
+    def __init__(self, f, budget: ParseBudget):
+        self.f = f
+        self.budget = budget
+
+    def read(self, size: int = -1) -> bytes:
+        # An unbounded read() is done in chunks so a bomb is stopped before
+        # it is fully decompressed
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(READ_CHUNK)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        data = self.f.read(size)
+        self.budget.charge_bytes(len(data))
+        return data
+
+
+def _or(value: Optional[int], default: int) -> int:
+    return default if value is None else value
@@ -0,0 +1,47 @@
+"""
+Cooperative cancellation for the parse and write pipeline.
+
+Long running loops call token.check() at natural boundaries (a MasterBar,
+a measure, a track). The token is cancelled from another thread when the
+client goes away, or expires on its own once its deadline has passed.
+"""
+import threading
+import time
+from typing import Optional
+
+
+class Cancelled(Exception):
+    pass
+
+
+class DeadlineExceeded(Cancelled):
+    pass
+
+
+class CancelToken:
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.timeout = timeout
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "Cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded(f"Deadline of {self.timeout:g}s exceeded")
+
+
+def check(token: Optional[CancelToken]):
+    """token.check() that accepts None, for optional tokens."""
+    if token is not None:
+        token.check()
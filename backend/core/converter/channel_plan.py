@@ -0,0 +1,243 @@
+"""
+Channel plans: which MIDI channel plays each note.
+
+The default allocation (ChannelManager) gives every high fidelity track one
+channel per string for the whole song, so after two guitars the other
+tracks fall back to a single channel. plan_channels() looks at when notes
+actually sound instead:
+
+- within a track, notes go to lanes. A bent note needs a lane to itself
+  while it sounds (a bend moves every note of its channel), notes without
+  bends share lanes freely. Each note takes the first lane free at its
+  start, whatever its string, like MPE hands out channels per note.
+- across tracks, lanes never in use at the same time share a channel. The
+  track taking a channel over sets it up again (bank, program, bend range)
+  right before its first note there.
+
+When the 15 melodic channels are not enough, the tracks with the most
+lanes get fewer, down to one per track, and then lanes share channels.
+"""
+import logging
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from backend.core.converter.channel_manager import ChannelManager
+from backend.core.converter.effects import changes_pitch
+from backend.core.converter.ties import TieChains, resolve_ties
+from backend.models.song_model import Note, NoteType, Song, Track
+
+logger = logging.getLogger(__name__)
+
+STRINGS = "strings"
+INTERVAL = "interval"
+ALLOCATIONS = (STRINGS, INTERVAL)
+
+MELODIC_CHANNELS = [ch for ch in range(16) if ch != ChannelManager.PERCUSSION_CHANNEL]
+# Lanes per high fidelity track, as many channels as the strings allocation
+MAX_LANES = 6
+
+
+class TrackChannels(NamedTuple):
+    # Channel of each lane
+    lanes: List[int]
+    # id(note) -> channel, tied notes included
+    note_channels: Dict[int, int]
+    # (tick, channel) where the track sets a channel up, 0 for the header
+    setups: List[Tuple[int, int]]
+    ties: TieChains
+
+    @property
+    def channels(self) -> List[int]:
+        return list(dict.fromkeys(self.lanes))
+
+    @property
+    def header_channels(self) -> List[int]:
+        return [channel for tick, channel in self.setups if tick == 0]
+
+    @property
+    def reusable(self) -> bool:
+        # Output that a doubled track can copy with remapped channels
+        distinct = len(set(self.lanes)) == len(self.lanes)
+        return distinct and all(tick == 0 for tick, _ in self.setups)
+
+
+class _Sounding(NamedTuple):
+    start: int
+    end: int
+    bends: bool
+    voice: int
+    note_ids: List[int]
+
+
+class _Lanes(NamedTuple):
+    # id(note) -> lane
+    note_lanes: Dict[int, int]
+    # (first start, last end) of each lane
+    spans: List[Tuple[int, int]]
+
+
+def plan_channels(
+    song: Song, high_fidelity: bool, pitch: Callable[[Track, Note], int]
+) -> Dict[int, TrackChannels]:
+    """Channels of every track of `song`, by track number."""
+    ties = {}
+    sounding = {}
+    for track in song.tracks:
+        ties[track.number] = resolve_ties(
+            track, lambda note, track=track: pitch(track, note)
+        )
+        sounding[track.number] = _sounding_notes(track, ties[track.number])
+
+    melodic = [track.number for track in song.tracks if not track.is_percussion]
+    caps = {number: MAX_LANES if high_fidelity else 1 for number in melodic}
+    lanes = {
+        number: _assign_lanes(sounding[number], caps[number]) for number in melodic
+    }
+    while True:
+        channels, shared = _assign_channels(lanes)
+        if not shared:
+            break
+        widest = max(melodic, key=lambda number: (len(lanes[number].spans), number))
+        if len(lanes[widest].spans) <= 1:
+            logger.warning(
+                f"{shared} lanes share channels: too many tracks play at once."
+            )
+            break
+        caps[widest] = len(lanes[widest].spans) - 1
+        lanes[widest] = _assign_lanes(sounding[widest], caps[widest])
+
+    setups = _setups(lanes, channels)
+    plan = {}
+    for track in song.tracks:
+        number = track.number
+        if track.is_percussion:
+            lane_channels = [ChannelManager.PERCUSSION_CHANNEL]
+            note_lanes = {
+                note_id: 0 for s in sounding[number] for note_id in s.note_ids
+            }
+            track_setups = [(0, ChannelManager.PERCUSSION_CHANNEL)]
+        else:
+            lane_count = len(lanes[number].spans)
+            lane_channels = [channels[(number, lane)] for lane in range(lane_count)]
+            note_lanes = lanes[number].note_lanes
+            track_setups = setups.get(number, [])
+        note_channels = {
+            note_id: lane_channels[lane] for note_id, lane in note_lanes.items()
+        }
+        plan[number] = TrackChannels(
+            lanes=lane_channels,
+            note_channels=note_channels,
+            setups=track_setups,
+            ties=ties[number],
+        )
+    return plan
+
+
+def _sounding_notes(track: Track, ties: TieChains) -> List[_Sounding]:
+    # Tie chains sound as one note, bent if any of its notes is (slides
+    # and vibrato included)
+    chains = {}
+    for measure in track.measures:
+        for beat in measure.beats:
+            for note in beat.notes:
+                if note.type in (NoteType.REST, NoteType.DEAD):
+                    continue
+                bends = changes_pitch(note)
+                head = ties.heads.get(id(note), id(note))
+                chain = chains.get(head)
+                if chain is None:
+                    end = ties.ends.get(id(note), int(beat.start_time + beat.duration))
+                    chains[head] = _Sounding(
+                        beat.start_time, end, bends, beat.voice, [id(note)]
+                    )
+                else:
+                    chain.note_ids.append(id(note))
+                    if bends and not chain.bends:
+                        chains[head] = chain._replace(bends=True)
+    return sorted(chains.values(), key=lambda s: s.start)
+
+
+def _assign_lanes(sounding: List[_Sounding], cap: int) -> _Lanes:
+    note_lanes = {}
+    spans = []
+    # Per lane: end of its last note, end of its last bent note, voice of
+    # its last note
+    busy = []
+    for s in sounding:
+        lane = None
+        for i, (until, bent_until, voice) in enumerate(busy):
+            if s.bends:
+                # Alone on the lane. Within a voice the previous note's bend
+                # reset is written before this note starts, across voices
+                # it might come after it.
+                free = until < s.start or (until == s.start and voice == s.voice)
+            else:
+                free = bent_until <= s.start
+            if free:
+                lane = i
+                break
+        if lane is None and len(busy) < cap:
+            lane = len(busy)
+            busy.append([0, 0, s.voice])
+            spans.append((s.start, s.end))
+        if lane is None:
+            # Full: the lane freed soonest, its bends leak into this note
+            lane = min(range(len(busy)), key=lambda i: busy[i][0 if s.bends else 1])
+
+        state = busy[lane]
+        state[0] = max(state[0], s.end)
+        if s.bends:
+            state[1] = max(state[1], s.end)
+        state[2] = s.voice
+        spans[lane] = (min(spans[lane][0], s.start), max(spans[lane][1], s.end))
+        for note_id in s.note_ids:
+            note_lanes[note_id] = lane
+    return _Lanes(note_lanes, spans)
+
+
+def _assign_channels(
+    lanes: Dict[int, _Lanes],
+) -> Tuple[Dict[Tuple[int, int], int], int]:
+    # Interval coloring in order of start: uses as many channels as lanes
+    # overlap at most. Returns (track number, lane) -> channel and the
+    # number of lanes that had to share a busy channel.
+    spans = sorted(
+        (span, number, lane)
+        for number, track_lanes in lanes.items()
+        for lane, span in enumerate(track_lanes.spans)
+    )
+    busy_until = {channel: None for channel in MELODIC_CHANNELS}
+    channels = {}
+    shared = 0
+    for (start, end), number, lane in spans:
+        # Strictly after: events of different tracks at the same tick may
+        # be played in any order
+        free = [
+            ch for ch, until in busy_until.items() if until is None or until < start
+        ]
+        if free:
+            channel = free[0]
+        else:
+            channel = min(busy_until, key=busy_until.get)
+            shared += 1
+        channels[(number, lane)] = channel
+        busy_until[channel] = max(end, busy_until[channel] or 0)
+    return channels, shared
+
+
+def _setups(
+    lanes: Dict[int, _Lanes], channels: Dict[Tuple[int, int], int]
+) -> Dict[int, list]:
+    # A track sets a channel up when it starts using it after another
+    # track, at time 0 when it is the first one
+    users = {}
+    for (number, lane), channel in channels.items():
+        users.setdefault(channel, []).append((lanes[number].spans[lane][0], number))
+    setups = {}
+    for channel, channel_users in sorted(users.items()):
+        previous = None
+        for start, number in sorted(channel_users):
+            if number != previous:
+                tick = 0 if previous is None else start
+                setups.setdefault(number, []).append((tick, channel))
+            previous = number
+    return setups
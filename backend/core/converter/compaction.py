@@ -0,0 +1,232 @@
+"""
+Removal of redundant events from rendered tracks.
+
+The writer favours simple, explicit output: every high fidelity channel gets
+a pitch bend range, every bent note ends with a pitchwheel back to center.
+compact_events() drops what cannot change what is heard:
+
+- pitch bend range setups (RPN 0) of channels that never bend,
+- pitchwheel, controller and program changes repeating the channel's
+  current value,
+- pitchwheels overridden by a later one before any note is played or
+  released on their channel (the reset after a bent note followed by the
+  next bend).
+
+verify_compaction() replays both tracks and compares what a synth would
+make of them: note events with the channel state when they start, and the
+bend of channels while notes sound.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+# Bend range until a track sets it, per General MIDI
+DEFAULT_BEND_RANGE = 2
+# RPN/NRPN selection and data entry, tracked as parameters rather than as
+# plain controller values
+_PARAMETER_CONTROLS = {6, 38, 96, 97, 98, 99, 100, 101}
+
+
+class CompactionError(ValueError):
+    pass
+
+
+def bent_channels(messages: Iterable) -> Set[int]:
+    """Channels with a pitchwheel off center."""
+    return {msg.channel for msg in messages if msg.type == "pitchwheel" and msg.pitch}
+
+
+def compact_events(messages: List, bent: Optional[Set[int]] = None) -> List:
+    """
+    `messages` (a track, delta times) without redundant events. `bent`
+    are the channels bending notes, by default those of `messages`: pass
+    them when compacting the header of a track apart from its notes.
+    """
+    if bent is None:
+        bent = bent_channels(messages)
+
+    # (absolute time, message), None once dropped
+    timed = []
+    now = 0
+    for msg in messages:
+        now += msg.time
+        timed.append([now, msg])
+
+    _drop_unused_bend_ranges(timed, bent)
+
+    pitch: Dict[int, int] = {}
+    controls: Dict[tuple, int] = {}
+    programs: Dict[int, tuple] = {}
+    sounding: Dict[int, int] = {}
+    # channel -> (index, pitch before it) of a pitchwheel no note heard yet
+    unheard: Dict[int, tuple] = {}
+    for i, entry in enumerate(timed):
+        msg = entry[1]
+        if msg is None or msg.is_meta or msg.type == "sysex":
+            continue
+        channel = msg.channel
+        if msg.type == "pitchwheel":
+            previous = unheard.pop(channel, None)
+            if previous is not None:
+                timed[previous[0]][1] = None
+                pitch[channel] = previous[1]
+            current = pitch.get(channel, 0)
+            if msg.pitch == current:
+                entry[1] = None
+                continue
+            if not sounding.get(channel):
+                unheard[channel] = (i, current)
+            pitch[channel] = msg.pitch
+        elif msg.type in ("note_on", "note_off"):
+            unheard.pop(channel, None)
+            if msg.type == "note_on" and msg.velocity:
+                sounding[channel] = sounding.get(channel, 0) + 1
+            elif sounding.get(channel):
+                sounding[channel] -= 1
+        elif msg.type == "control_change":
+            if msg.control in _PARAMETER_CONTROLS:
+                continue
+            key = (channel, msg.control)
+            if controls.get(key) == msg.value:
+                entry[1] = None
+                continue
+            controls[key] = msg.value
+        elif msg.type == "program_change":
+            # Bank select only applies with the next program change
+            bank = (controls.get((channel, 0)), controls.get((channel, 32)))
+            program = (msg.program, *bank)
+            if programs.get(channel) == program:
+                entry[1] = None
+                continue
+            programs[channel] = program
+
+    compacted = []
+    last = 0
+    for time, msg in timed:
+        if msg is None:
+            continue
+        compacted.append(msg.copy(time=time - last))
+        last = time
+    return compacted
+
+
+def _drop_unused_bend_ranges(timed: list, bent: Set[int]):
+    # Select RPN 0, data entry, null RPN: consecutive on one channel, as
+    # the writer emits them
+    i = 0
+    while i + 1 < len(timed):
+        block = _bend_range_block(timed, i)
+        if block and timed[i][1].channel not in bent:
+            for j in range(i, i + block):
+                timed[j][1] = None
+            i += block
+        else:
+            i += 1
+
+
+def _bend_range_block(timed: list, start: int) -> int:
+    def control(i):
+        if i >= len(timed) or timed[i][0] != timed[start][0]:
+            return None
+        msg = timed[i][1]
+        if msg is None or msg.type != "control_change":
+            return None
+        if msg.channel != timed[start][1].channel:
+            return None
+        return msg.control, msg.value
+
+    if control(start) != (101, 0) or control(start + 1) != (100, 0):
+        return 0
+    length = 2
+    while control(start + length) and control(start + length)[0] in (6, 38):
+        length += 1
+    null_rpn = control(start + length), control(start + length + 1)
+    if null_rpn == ((101, 127), (100, 127)):
+        return length + 2
+    # Without the null RPN the selection outlives the block
+    return 0
+
+
+def verify_compaction(original: List, compacted: List):
+    """Raise CompactionError unless both tracks sound the same."""
+    expected = _playback(original)
+    actual = _playback(compacted)
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            raise CompactionError(
+                f"Playback differs at event {i}: expected {want}, got {got}"
+            )
+    if len(expected) != len(actual):
+        raise CompactionError(
+            f"Playback has {len(actual)} events, expected {len(expected)}"
+        )
+
+
+def _playback(messages: List) -> list:
+    # What is heard, in order: meta events, notes with the state of their
+    # channel, bend changes while notes sound, and the final state
+    trace = []
+    pitch: Dict[int, int] = {}
+    controls: Dict[int, Dict[int, int]] = {}
+    programs: Dict[int, int] = {}
+    # channel -> [semitones, cents]
+    ranges: Dict[int, list] = {}
+    selected: Dict[int, list] = {}
+    sounding: Dict[int, int] = {}
+
+    def bend(channel):
+        # In semitones, a centered wheel is the same for every range
+        value = pitch.get(channel, 0)
+        if not value:
+            return 0.0
+        semitones, cents = ranges.get(channel, (DEFAULT_BEND_RANGE, 0))
+        return value / 8192 * (semitones + cents / 100)
+
+    def state(channel):
+        channel_controls = tuple(sorted(controls.get(channel, {}).items()))
+        return (programs.get(channel), channel_controls, bend(channel))
+
+    now = 0
+    for msg in messages:
+        now += msg.time
+        if msg.is_meta or msg.type == "sysex":
+            trace.append((now, _fields(msg)))
+            continue
+        channel = msg.channel
+        if msg.type == "note_on" and msg.velocity:
+            sounding[channel] = sounding.get(channel, 0) + 1
+            trace.append((now, channel, "on", msg.note, msg.velocity, state(channel)))
+        elif msg.type in ("note_on", "note_off"):
+            sounding[channel] = max(0, sounding.get(channel, 0) - 1)
+            trace.append((now, channel, "off", msg.note))
+        elif msg.type == "pitchwheel":
+            before = bend(channel)
+            pitch[channel] = msg.pitch
+            if sounding.get(channel) and bend(channel) != before:
+                trace.append((now, channel, "bend", bend(channel)))
+        elif msg.type == "program_change":
+            programs[channel] = msg.program
+        elif msg.type == "control_change":
+            parameter = selected.setdefault(channel, [None, None])
+            if msg.control in (101, 100):
+                parameter[msg.control - 100] = msg.value
+            elif msg.control in (99, 98):
+                # NRPN selection replaces the RPN one
+                parameter[:] = [None, None]
+            elif msg.control in (6, 38):
+                if parameter == [0, 0]:
+                    bend_range = ranges.setdefault(channel, [DEFAULT_BEND_RANGE, 0])
+                    bend_range[msg.control == 38] = msg.value
+            else:
+                controls.setdefault(channel, {})[msg.control] = msg.value
+        else:
+            trace.append((now, _fields(msg)))
+
+    # Channels left as they started don't count
+    untouched = (None, (), 0.0)
+    channels = sorted(set(pitch) | set(controls) | set(programs))
+    changed = tuple((ch, state(ch)) for ch in channels if state(ch) != untouched)
+    trace.append(("end", changed))
+    return trace
+
+
+def _fields(msg) -> tuple:
+    return tuple((key, value) for key, value in msg.dict().items() if key != "time")
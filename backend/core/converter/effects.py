@@ -0,0 +1,296 @@
+"""
+Articulations: slides, vibrato, trills, hammer-ons/pull-offs, palm mutes.
+
+Pitch curves come from normalized templates (one period of a sine for
+vibrato, a 0 to 1 ramp for slides), built once per resolution and cached.
+A note only scales them to its own length and depth, so long vibrato
+passages cost a few additions per point.
+
+Bends are still rendered by the writer. A bent note gets no other pitch
+effect: both would drive the same pitchwheel.
+"""
+import math
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from backend.models.song_model import (
+    SLIDE_IN_ABOVE,
+    SLIDE_IN_BELOW,
+    SLIDE_LEGATO,
+    SLIDE_OUT_DOWN,
+    SLIDE_OUT_UP,
+    SLIDE_SHIFT,
+    VIBRATO_SLIGHT,
+    EffectType,
+    Note,
+    NoteEffect,
+    NoteType,
+    Track,
+)
+
+# The bend range the writer sets up on every channel
+BEND_RANGE_SEMITONES = 12
+MAX_PITCH = 8191
+MIN_PITCH = -8192
+# Guitar Pro bend values are hundredths of a tone, 100 = 2 semitones
+BEND_VALUE_TO_SEMITONES = 1.0 / 50.0
+# Ticks between two points of a curve, as for bends
+RESOLUTION_TICKS = 30
+
+VIBRATO_PERIOD_TICKS = 240
+# Slides last at most this long, at the start or end of the note
+SLIDE_TICKS = 240
+# Slides in and out start or end this far from the note
+SLIDE_OUT_SEMITONES = 5
+# Sixteenth notes, Guitar Pro's default trill speed
+TRILL_TICKS = 240
+# Hammer-on, pull-off and legato slide destinations aren't picked
+LEGATO_VELOCITY = 0.8
+PALM_MUTE_VELOCITY = 0.85
+PALM_MUTE_LENGTH = 0.5
+
+_SLIDE_TO_NEXT = SLIDE_SHIFT | SLIDE_LEGATO
+
+
+class NoteLinks(NamedTuple):
+    # id(note) of the notes played legato (after a hammer-on, a pull-off or
+    # a legato slide)
+    legato: Set[int]
+    # id(note) -> semitones to the next note on its string, for slides to it
+    slide_targets: Dict[int, int]
+
+
+def semitones_to_pitch(semitones: float) -> int:
+    pitch = int(semitones / BEND_RANGE_SEMITONES * 8192)
+    return max(MIN_PITCH, min(MAX_PITCH, pitch))
+
+
+def bend_value_to_pitch(value: float) -> int:
+    """Pitchwheel value of a Guitar Pro bend point value."""
+    return semitones_to_pitch(value * BEND_VALUE_TO_SEMITONES)
+
+
+@lru_cache(maxsize=None)
+def vibrato_template(steps: int) -> Tuple[Tuple[float, float], ...]:
+    """One period of a sine as (fraction of the period, -1 to 1) points."""
+    return tuple((i / steps, math.sin(2 * math.pi * i / steps)) for i in range(steps))
+
+
+@lru_cache(maxsize=None)
+def ramp_template(steps: int) -> Tuple[float, ...]:
+    """0 to 1 in `steps` steps, both ends included."""
+    return tuple(i / steps for i in range(steps + 1))
+
+
+@lru_cache(maxsize=256)
+def _vibrato_curve(depth: float, steps: int) -> Tuple[Tuple[float, int], ...]:
+    return tuple(
+        (fraction, semitones_to_pitch(depth * value))
+        for fraction, value in vibrato_template(steps)
+    )
+
+
+@lru_cache(maxsize=1024)
+def _ramp_curve(start: float, end: float, steps: int) -> Tuple[Tuple[float, int], ...]:
+    return tuple(
+        (fraction, semitones_to_pitch(start + (end - start) * fraction))
+        for fraction in ramp_template(steps)
+    )
+
+
+def find_effect(note: Note, effect_type: EffectType) -> Optional[NoteEffect]:
+    for effect in note.effects:
+        if effect.type == effect_type:
+            return effect
+    return None
+
+
+def changes_pitch(note: Note) -> bool:
+    """Whether the note moves the pitchwheel of its channel."""
+    for effect in note.effects:
+        if effect.type == EffectType.BEND and effect.bend_points:
+            return True
+        if effect.type == EffectType.VIBRATO:
+            return True
+        if effect.type == EffectType.SLIDE and effect.value:
+            return True
+    return False
+
+
+def link_notes(track: Track, pitch: Callable[[Note], int]) -> NoteLinks:
+    """Pairs each note with the next one on its string, in its voice."""
+    previous = {}  # (string, voice) -> (note, pitch)
+    legato = set()
+    slide_targets = {}
+    for measure in track.measures:
+        for beat in measure.beats:
+            for note in beat.notes:
+                key = (note.string, beat.voice)
+                if note.type in (NoteType.REST, NoteType.DEAD):
+                    previous.pop(key, None)
+                    continue
+                note_pitch = pitch(note)
+                before = previous.get(key)
+                if before is not None:
+                    origin, origin_pitch = before
+                    slide = find_effect(origin, EffectType.SLIDE)
+                    flags = int(slide.value or 0) if slide else 0
+                    if (
+                        flags & SLIDE_LEGATO
+                        or find_effect(origin, EffectType.HAMMER)
+                        or find_effect(origin, EffectType.PULL)
+                    ):
+                        legato.add(id(note))
+                    if flags & _SLIDE_TO_NEXT:
+                        slide_targets[id(origin)] = note_pitch - origin_pitch
+                previous[key] = (note, note_pitch)
+    return NoteLinks(legato, slide_targets)
+
+
+def articulate(
+    note: Note, links: NoteLinks, velocity: int, start: int, end: int
+) -> Tuple[int, int]:
+    """(velocity, end) of a note after hammer-ons and palm mutes."""
+    if id(note) in links.legato:
+        velocity = max(1, int(velocity * LEGATO_VELOCITY))
+    if find_effect(note, EffectType.PALM_MUTE):
+        velocity = max(1, int(velocity * PALM_MUTE_VELOCITY))
+        end = start + max(1, int((end - start) * PALM_MUTE_LENGTH))
+    return velocity, end
+
+
+def note_events(
+    note: Note,
+    midi_note: int,
+    velocity: int,
+    start: int,
+    end: int,
+    channel: int,
+    reserve: Callable,
+) -> List[dict]:
+    """note_on/note_off events, alternating with the other note of a trill."""
+    trill = find_effect(note, EffectType.TRILL)
+    other = midi_note
+    if trill is not None and trill.value is not None:
+        other = min(127, max(0, midi_note + int(trill.value) - note.fret))
+    if other == midi_note:
+        return [
+            _note_on(start, midi_note, velocity, channel),
+            _note_off(end, midi_note, channel),
+        ]
+
+    reserve(2 * ((end - start) // TRILL_TICKS + 1))
+    events = []
+    playing = midi_note
+    time = start
+    while time < end:
+        until = min(end, time + TRILL_TICKS)
+        events.append(_note_on(time, playing, velocity, channel))
+        events.append(_note_off(until, playing, channel))
+        playing = other if playing == midi_note else midi_note
+        time = until
+    return events
+
+
+def pitch_events(
+    note: Note,
+    links: NoteLinks,
+    start: int,
+    end: int,
+    release: int,
+    channel: int,
+    reserve: Callable,
+) -> List[dict]:
+    """
+    Pitchwheel events of the slides and vibrato of a note sounding from
+    `start` to `end`, back to center at `release`.
+    """
+    bend = find_effect(note, EffectType.BEND)
+    if bend is not None and bend.bend_points:
+        return []
+    slide = find_effect(note, EffectType.SLIDE)
+    flags = int(slide.value or 0) if slide else 0
+    vibrato = find_effect(note, EffectType.VIBRATO)
+    if not flags and vibrato is None:
+        return []
+
+    length = max(0, end - start)
+    slide_in = flags & (SLIDE_IN_BELOW | SLIDE_IN_ABOVE)
+    target = links.slide_targets.get(id(note))
+    slide_out = flags & (SLIDE_OUT_DOWN | SLIDE_OUT_UP) or target
+    # Slides in and out share short notes
+    slide_length = min(SLIDE_TICKS, length // 2 if slide_in and slide_out else length)
+
+    events = []
+    sustain_start, sustain_end = start, end
+    if slide_in and slide_length > 0:
+        offset = -SLIDE_OUT_SEMITONES if flags & SLIDE_IN_BELOW else SLIDE_OUT_SEMITONES
+        curve = _ramp_curve(offset, 0, _steps(slide_length))
+        events.extend(_curve(curve, start, slide_length, channel))
+        sustain_start = start + slide_length
+    if slide_out and slide_length > 0:
+        sustain_end = end - slide_length
+
+    if vibrato is not None and sustain_end > sustain_start:
+        span = sustain_end - sustain_start
+        cycles = max(1, round(span / VIBRATO_PERIOD_TICKS))
+        depth = vibrato.value or VIBRATO_SLIGHT
+        curve = _vibrato_curve(depth, _steps(VIBRATO_PERIOD_TICKS))
+        reserve(len(events) + cycles * len(curve))
+        cycle_length = span / cycles
+        for cycle in range(cycles):
+            cycle_start = sustain_start + cycle * cycle_length
+            events.extend(_curve(curve, cycle_start, cycle_length, channel))
+
+    if slide_out and slide_length > 0:
+        if target:
+            semitones = max(-BEND_RANGE_SEMITONES, min(BEND_RANGE_SEMITONES, target))
+        elif flags & SLIDE_OUT_DOWN:
+            semitones = -SLIDE_OUT_SEMITONES
+        else:
+            semitones = SLIDE_OUT_SEMITONES
+        # The last point would be reset right away
+        curve = _ramp_curve(0, semitones, _steps(slide_length))[:-1]
+        events.extend(_curve(curve, sustain_end, slide_length, channel))
+
+    if events:
+        events.append(
+            {"time": release, "type": "pitchwheel", "pitch": 0, "channel": channel}
+        )
+    return events
+
+
+def _steps(ticks: int) -> int:
+    return max(1, ticks // RESOLUTION_TICKS)
+
+
+def _curve(curve, start: float, length: float, channel: int) -> List[dict]:
+    return [
+        {
+            "time": int(start + fraction * length),
+            "type": "pitchwheel",
+            "pitch": pitch,
+            "channel": channel,
+        }
+        for fraction, pitch in curve
+    ]
+
+
+def _note_on(time: int, note: int, velocity: int, channel: int) -> dict:
+    return {
+        "time": time,
+        "type": "note_on",
+        "note": note,
+        "velocity": velocity,
+        "channel": channel,
+    }
+
+
+def _note_off(time: int, note: int, channel: int) -> dict:
+    return {
+        "time": time,
+        "type": "note_off",
+        "note": note,
+        "velocity": 0,
+        "channel": channel,
+    }
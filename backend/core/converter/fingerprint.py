@@ -0,0 +1,22 @@
+"""
+Fingerprints of what a track plays.
+
+Arrangements often double a part (rhythm guitars left and right, a bass in
+unison) in tracks that only differ by their name, instrument or channels.
+Tracks with the same fingerprint produce the same note and bend events, the
+writer renders them once and copies the result.
+"""
+import hashlib
+
+from backend.models.song_model import Track
+
+# Everything the note/bend events depend on; name, program and banks only
+# go into the track header
+FINGERPRINT_FIELDS = {"is_percussion": True, "tuning": True, "measures": True}
+
+
+def track_fingerprint(track: Track) -> bytes:
+    # pydantic serializes the whole tree natively, much faster than walking
+    # the beats in Python
+    content = track.model_dump_json(include=FINGERPRINT_FIELDS)
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
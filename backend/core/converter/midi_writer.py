@@ -1,81 +1,299 @@
 import mido
 import math
+import os
+from typing import Iterable, List, Optional
+from backend.core.budget import ParseBudget
+from backend.core.cancellation import check
 from backend.core.converter.channel_manager import ChannelManager
+from backend.core.converter.channel_plan import INTERVAL, STRINGS, plan_channels
+from backend.core.converter.compaction import (
+    bent_channels,
+    compact_events,
+    verify_compaction,
+)
+from backend.core.converter.effects import (
+    BEND_RANGE_SEMITONES,
+    RESOLUTION_TICKS,
+    articulate,
+    bend_value_to_pitch,
+    link_notes,
+    note_events,
+    pitch_events,
+)
+from backend.core.converter.fingerprint import track_fingerprint
+from backend.core.converter.mtrk import (
+    TICKS_PER_BEAT,
+    assemble,
+    chunk,
+    encode_messages,
+    remap_channels,
+    tempo_chunk,
+)
+from backend.core.converter.ties import resolve_ties
+from backend.core.converter.track_cache import (
+    TrackChunkCache,
+    assemble_cached,
+    chunk_key,
+)
 from backend.models.song_model import EffectType, NoteType, Song, Track
 
+# Replay every compacted track against the original (debugging aid, slow)
+VERIFY_COMPACTION = os.environ.get("GP2MIDI_VERIFY_COMPACTION", "0") == "1"
+
+
+def track_channels(
+    manager: ChannelManager, number: int, is_percussion: bool, high_fidelity: bool
+) -> List[int]:
+    """Channels for the next track, allocated in track order."""
+    if is_percussion:
+        return [9]
+    channels = manager.allocate_channel(number, count=6 if high_fidelity else 1)
+    return channels or [0]  # Fallback
+
+
 class MidiWriter:
-    def __init__(self, song: Song, high_fidelity: bool = True):
+    def __init__(
+        self,
+        song: Song,
+        high_fidelity: bool = True,
+        cache: Optional[TrackChunkCache] = None,
+        song_key: Optional[str] = None,
+        compact: bool = False,
+        allocation: str = STRINGS,
+    ):
+        # With a cache and the song's key (hash of the source file), encoded
+        # tracks are reused across conversions of the same file. compact
+        # drops events that don't change playback (see compaction.py).
+        # allocation INTERVAL hands out channels by when notes sound (see
+        # channel_plan.py); the channels of a track then depend on the whole
+        # song, so its output isn't cached.
         self.song = song
         self.high_fidelity = high_fidelity
-        self.midi_file = mido.MidiFile(ticks_per_beat=960)
+        self.compact = compact
+        self.allocation = allocation
+        self.cache = cache if song_key and allocation == STRINGS else None
+        self.song_key = song_key
+        # The file is assembled from encoded chunks (see mtrk.py), there is
+        # no mido.MidiFile holding its tracks
+        self.ticks_per_beat = TICKS_PER_BEAT
+        self.charset = "latin1"
         self.channel_manager = ChannelManager()
+        self.plan = None  # track number -> TrackChannels
+        # Tracks rendered from their notes, and written as a copy of an
+        # identical one (the others come from the cache)
+        self.rendered = 0
+        self.duplicates = 0
+        # Caps the events rendered per track, replaced by write()'s budget
+        self.budget = ParseBudget()
+
+    @classmethod
+    def from_cache(
+        cls,
+        cache: TrackChunkCache,
+        song_key: str,
+        high_fidelity: bool = True,
+        track_numbers: Optional[Iterable[int]] = None,
+        compact: bool = False,
+    ) -> Optional[bytes]:
+        """
+        The MIDI file of an earlier conversion of `song_key` with the tracks
+        in `track_numbers` (all if empty), None unless every track chunk
+        is cached.
+        """
+        manager = ChannelManager()
 
-    def write(self, output_path=None, file=None):
-        # Create Tempo Track
-        tempo_track = mido.MidiTrack()
-        self.midi_file.tracks.append(tempo_track)
-        tempo_bpm = self.song.tempo
-        tempo_midi = mido.bpm2tempo(tempo_bpm)
-        tempo_track.append(mido.MetaMessage("set_tempo", tempo=tempo_midi, time=0))
-        tempo_track.append(mido.MetaMessage("end_of_track", time=0))
+        def channels(number, is_percussion):
+            return track_channels(manager, number, is_percussion, high_fidelity)
 
-        for track in self.song.tracks:
-            midi_track = self._process_track(track)
-            self.midi_file.tracks.append(midi_track)
+        return assemble_cached(
+            cache,
+            song_key,
+            high_fidelity,
+            channels,
+            track_numbers,
+            compact,
+        )
+
+    def write(
+        self,
+        output_path=None,
+        file=None,
+        progress=None,
+        cancel=None,
+        budget=None,
+        tracks=None,
+    ):
+        # progress(done, total, track) is called after each track is rendered,
+        # cancel (a CancelToken) is checked before each one and budget (a
+        # ParseBudget) caps the events rendered per track. tracks iterates
+        # the song's tracks as they get parsed (see core/pipeline.py),
+        # song.tracks when omitted.
+        if tracks is not None and self.allocation == INTERVAL:
+            raise ValueError(
+                "Interval allocation plans the whole song, its tracks can't be streamed"
+            )
+        self.budget = budget or ParseBudget()
+        # Tempo Track
+        chunks = [tempo_chunk(self.song.tempo)]
+        if self.allocation == INTERVAL:
+            self.plan = plan_channels(self.song, self.high_fidelity, self._note_pitch)
+
+        # Tracks are encoded one by one so each chunk can be cached on its
+        # own. Doubled parts (same notes and bends) are rendered once, their
+        # copies only get their own header and channels.
+        bodies = {}  # fingerprint -> (channels, encoded body, bent channels)
+        total = len(self.song.tracks)
+        for i, track in enumerate(self.song.tracks if tracks is None else tracks):
+            check(cancel)
+            channels = self._allocate_channels(track)
+            key = None
+            track_chunk = None
+            if self.cache is not None:
+                key = chunk_key(
+                    self.song_key,
+                    track.number,
+                    self.high_fidelity,
+                    channels,
+                    self.compact,
+                )
+                track_chunk = self.cache.get(key)
+            if track_chunk is None:
+                track_chunk = self._encode_track(track, channels, bodies)
+                if key is not None:
+                    self.cache.put(key, track_chunk)
+            chunks.append(track_chunk)
+            if progress:
+                progress(i + 1, total, track)
 
+        midi_bytes = assemble(chunks, self.ticks_per_beat)
         if file:
-            self.midi_file.save(file=file)
+            file.write(midi_bytes)
         elif output_path:
-            self.midi_file.save(filename=output_path)
+            with open(output_path, "wb") as f:
+                f.write(midi_bytes)
         else:
             raise ValueError("Either output_path or file must be provided")
 
-    def _process_track(self, track: Track) -> mido.MidiTrack:
-        midi_track = mido.MidiTrack()
-        midi_track.append(mido.MetaMessage("track_name", name=track.name, time=0))
+    def _encode_track(self, track: Track, channels: List[int], bodies: dict) -> bytes:
+        charset = self.charset
+        header = self._header_messages(track, channels)
+        fingerprint = track_fingerprint(track)
+        original = bodies.get(fingerprint)
+        reusable = self.plan is None or self.plan[track.number].reusable
+        if self.plan is not None:
+            # Notes are mapped to lanes rather than strings
+            channels = self.plan[track.number].lanes
+        # The string -> channel mapping depends on the number of channels
+        if original is not None and reusable and len(original[0]) == len(channels):
+            source_channels, source_body, source_bent = original
+            mapping = dict(zip(source_channels, channels))
+            body = remap_channels(source_body, mapping)
+            bent = {mapping.get(ch, ch) for ch in source_bent}
+            body_messages = None
+            self.duplicates += 1
+        else:
+            body_messages = self._body_messages(track, channels)
+            rendered = header + body_messages
+            if self.compact:
+                body_messages = compact_events(body_messages)
+            bent = bent_channels(body_messages) if self.compact else set()
+            body = encode_messages(body_messages, charset)
+            if reusable:
+                bodies[fingerprint] = (channels, body, bent)
+
+        if self.compact:
+            # Bend ranges are only kept for the channels that bend
+            header = compact_events(header, bent)
+        if body_messages is not None:
+            self.rendered += 1
+            if self.compact and VERIFY_COMPACTION:
+                verify_compaction(rendered, header + body_messages)
+        # The header ends on a control or program change and the body
+        # starts with a note or a bend, running status never spans the two
+        return chunk(encode_messages(header, charset) + body)
 
+    def _allocate_channels(self, track: Track) -> List[int]:
+        if self.plan is not None:
+            return self.plan[track.number].channels
+        return track_channels(
+            self.channel_manager, track.number, track.is_percussion, self.high_fidelity
+        )
+
+    def _process_track(
+        self, track: Track, channels: Optional[List[int]] = None
+    ) -> mido.MidiTrack:
         # Channel setup
-        channels = []
-        if track.is_percussion:
-            channels = [9]
-        elif self.high_fidelity:
-            channels = self.channel_manager.allocate_channel(track.number, count=6)
-        else:
-            channels = self.channel_manager.allocate_channel(track.number, count=1)
+        if channels is None:
+            channels = self._allocate_channels(track)
 
-        if not channels:
-            channels = [0]  # Fallback
+        midi_track = mido.MidiTrack(self._header_messages(track, channels))
+        midi_track.extend(self._body_messages(track, channels))
+        return midi_track
+
+    def _header_messages(self, track: Track, channels: List[int]) -> list:
+        # Name, bank, program and bend range: everything that isn't notes
+        midi_track = []
+        midi_track.append(mido.MetaMessage("track_name", name=track.name, time=0))
 
-        current_program = track.program
+        if self.plan is not None:
+            # Channels taken over from another track later on are set up
+            # in the body
+            channels = self.plan[track.number].header_channels
 
         # Set Program for all allocated channels
         for ch in channels:
-            # Bank Select
-            if track.bank_msb is not None:
-                midi_track.append(
-                    mido.Message("control_change", control=0, value=track.bank_msb, channel=ch, time=0)
-                )
-            if track.bank_lsb is not None:
-                midi_track.append(
-                    mido.Message("control_change", control=32, value=track.bank_lsb, channel=ch, time=0)
-                )
-            
-            midi_track.append(
-                mido.Message("program_change", program=current_program, channel=ch, time=0)
-            )
-            self._set_pitch_bend_range(midi_track, ch, semitones=12)
+            midi_track.extend(self._channel_setup(track, ch))
+        return midi_track
+
+    def _channel_setup(self, track: Track, ch: int) -> list:
+        messages = []
+        # Bank Select
+        if track.bank_msb is not None:
+            messages.append(mido.Message(
+                "control_change", control=0, value=track.bank_msb, channel=ch, time=0
+            ))
+        if track.bank_lsb is not None:
+            messages.append(mido.Message(
+                "control_change", control=32, value=track.bank_lsb, channel=ch, time=0
+            ))
 
+        messages.append(
+            mido.Message("program_change", program=track.program, channel=ch, time=0)
+        )
+        self._set_pitch_bend_range(messages, ch, semitones=BEND_RANGE_SEMITONES)
+        return messages
+
+    def _body_messages(self, track: Track, channels: List[int]) -> list:
+        # Notes and bends, ending with end_of_track
+        midi_track = []
         events = []
-        
+        plan = self.plan[track.number] if self.plan is not None else None
+        if plan is not None:
+            ties = plan.ties
+            # Set up before the first note at the same tick (the sort
+            # below is stable)
+            for tick, ch in plan.setups:
+                if tick > 0:
+                    events.append({"time": tick, "type": "setup", "channel": ch})
+        else:
+            ties = resolve_ties(track, lambda note: self._note_pitch(track, note))
+        links = link_notes(track, lambda note: self._note_pitch(track, note))
+        # Effects expanding into many events reserve them first
+        def reserve(count):
+            self.budget.check_events(len(events) + count)
+
         for measure in track.measures:
             for beat in measure.beats:
                 for note in beat.notes:
                     if note.type in [NoteType.REST, NoteType.DEAD]:
                         continue
+                    self.budget.check_events(len(events) + 2)
 
                     # Channel Selection
                     channel = channels[0]
-                    if self.high_fidelity and not track.is_percussion:
+                    if plan is not None:
+                        channel = plan.note_channels[id(note)]
+                    elif self.high_fidelity and not track.is_percussion:
                         # Map string index to channel index (safe modulo)
                         idx = (note.string - 1) % len(channels)
                         channel = channels[idx]
@@ -83,67 +301,42 @@ class MidiWriter:
                     # Velocity & Duration
                     vel = min(127, max(0, note.velocity))
                     start_abs = beat.start_time
-                    end_abs = int(start_abs + beat.duration) # Simple duration logic
-
-                    # MIDI Number calculation
-                    midi_note = note.midi_number
-                    if midi_note is None:
-                         # Fallback calculation
-                        base = note.fret
-                        if not track.is_percussion and track.tuning:
-                             # Ensure string index is within bounds of tuning array
-                            string_idx = note.string - 1
-                            if 0 <= string_idx < len(track.tuning):
-                                base += track.tuning[string_idx]
-                        midi_note = base
-                    
-                    # Clamp MIDI note
-                    midi_note = min(127, max(0, midi_note))
-
-                    events.append({
-                        "time": start_abs, "type": "note_on", 
-                        "note": midi_note, "velocity": vel, "channel": channel
-                    })
-                    events.append({
-                        "time": end_abs, "type": "note_off", 
-                        "note": midi_note, "velocity": 0, "channel": channel
-                    })
-
-                    
+                    # Tie chains sound as one note lasting to the end of the
+                    # chain, the tied notes only add their bends
+                    end_abs = ties.ends.get(id(note), int(start_abs + beat.duration))
+                    # Hammer-ons, pull-offs and palm mutes
+                    vel, end_abs = articulate(note, links, vel, start_abs, end_abs)
+
+                    midi_note = self._note_pitch(track, note)
+
+                    if id(note) not in ties.continuations:
+                        # A plain note_on/note_off pair unless trilled
+                        events.extend(note_events(
+                            note, midi_note, vel, start_abs, end_abs, channel, reserve
+                        ))
+
+                    # Slides and vibrato, over this note's part of a chain
+                    segment_end = min(end_abs, int(start_abs + beat.duration))
+                    events.extend(pitch_events(
+                        note, links, start_abs, segment_end, end_abs, channel, reserve
+                    ))
+
                     # Handle Bends
                     for effect in note.effects:
                         if effect.type == EffectType.BEND and effect.bend_points:
                             points = sorted(effect.bend_points, key=lambda p: p.position)
-                            
-                            # Constants
-                            BEND_RANGE_SEMITONES = 12
-                            GP_VALUE_TO_SEMITONES = 1.0 / 50.0 # 100 = 2 semitones
-                            CENTER_PITCH = 0
-                            MAX_PITCH = 8191
-                            MIN_PITCH = -8192
-                            
-                            def val_to_pitch(gp_val):
-                                semitones = gp_val * GP_VALUE_TO_SEMITONES
-                                # Scale to -8192..+8191 range based on bend range
-                                # unit = 8192 / BEND_RANGE_SEMITONES
-                                offset = (semitones / BEND_RANGE_SEMITONES) * 8192
-                                pitch = int(CENTER_PITCH + offset)
-                                return max(MIN_PITCH, min(MAX_PITCH, pitch))
-                            
+
                             # Generate Points
                             # We assume points positions are 0-100 where 100 = note duration?
                             # Or strict GP ticks? Let's assume 0-100 percentage for now as it's common.
                             # If positions are large (>100), treat as absolute ticks relative to note start?
                             # Standard GPX usually uses 0-100 for Position.
-                            
-                            # Interpolation
-                            # We will generate a point every X ticks
-                            resolution_ticks = 30 
-                            
+
+                            # Interpolated every RESOLUTION_TICKS, like the other curves
                             if len(points) == 1:
                                 # Constant bend?
                                 ev_time = start_abs + int(points[0].position / 100.0 * beat.duration)
-                                pitch = val_to_pitch(points[0].value)
+                                pitch = bend_value_to_pitch(points[0].value)
                                 events.append({
                                     "time": ev_time, "type": "pitchwheel", 
                                     "pitch": pitch, "channel": channel
@@ -163,27 +356,33 @@ class MidiWriter:
                                     if duration <= 0:
                                         # Instant jump
                                         events.append({
-                                            "time": start_abs + t1_rel, "type": "pitchwheel",
-                                            "pitch": val_to_pitch(val1), "channel": channel
+                                            "time": start_abs + t1_rel,
+                                            "type": "pitchwheel",
+                                            "pitch": bend_value_to_pitch(val1),
+                                            "channel": channel,
                                         })
                                         continue
                                         
                                     # Interpolate
-                                    steps = max(1, int(duration / resolution_ticks))
+                                    steps = max(1, int(duration / RESOLUTION_TICKS))
+                                    # Huge durations expand into millions of points
+                                    self.budget.check_events(len(events) + steps + 1)
                                     for s in range(steps + 1):
                                         alpha = s / float(steps)
                                         cur_time_rel = t1_rel + int(duration * alpha)
                                         cur_val = val1 + (val2 - val1) * alpha
                                         
                                         events.append({
-                                            "time": start_abs + cur_time_rel, "type": "pitchwheel",
-                                            "pitch": val_to_pitch(cur_val), "channel": channel
+                                            "time": start_abs + cur_time_rel,
+                                            "type": "pitchwheel",
+                                            "pitch": bend_value_to_pitch(cur_val),
+                                            "channel": channel,
                                         })
 
                             # Reset Pitch Bend at end of note
                             events.append({
                                 "time": end_abs, "type": "pitchwheel", 
-                                "pitch": CENTER_PITCH, "channel": channel
+                                "pitch": 0, "channel": channel
                             }) 
 
         # Sort events by time
@@ -194,7 +393,11 @@ class MidiWriter:
         for ev in events:
             dt = ev["time"] - last_time
             if dt < 0: dt = 0
-            if ev["type"] == "pitchwheel":
+            if ev["type"] == "setup":
+                setup = self._channel_setup(track, ev["channel"])
+                setup[0].time = dt
+                midi_track.extend(setup)
+            elif ev["type"] == "pitchwheel":
                  midi_track.append(
                     mido.Message(
                         "pitchwheel",
@@ -218,7 +421,23 @@ class MidiWriter:
         midi_track.append(mido.MetaMessage("end_of_track", time=0))
         return midi_track
 
-    def _set_pitch_bend_range(self, track, channel, semitones=12):
+    def _note_pitch(self, track: Track, note) -> int:
+        # MIDI Number calculation
+        midi_note = note.midi_number
+        if midi_note is None:
+             # Fallback calculation
+            base = note.fret
+            if not track.is_percussion and track.tuning:
+                 # Ensure string index is within bounds of tuning array
+                string_idx = note.string - 1
+                if 0 <= string_idx < len(track.tuning):
+                    base += track.tuning[string_idx]
+            midi_note = base
+
+        # Clamp MIDI note
+        return min(127, max(0, midi_note))
+
+    def _set_pitch_bend_range(self, track, channel, semitones=BEND_RANGE_SEMITONES):
         # RPN 00 00 Pitch Bend Range
         track.append(mido.Message("control_change", control=101, value=0, channel=channel, time=0))
         track.append(mido.Message("control_change", control=100, value=0, channel=channel, time=0))
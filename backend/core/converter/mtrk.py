@@ -0,0 +1,142 @@
+"""
+Encoding of MIDI track chunks (MTrk) as MidiFile.save() writes them.
+
+Tracks are encoded separately so they can be cached, reassembled and, for
+doubled parts, copied with other channels: remap_channels() rewrites the
+channel nibble of every channel message without decoding anything else.
+"""
+import io
+import struct
+from typing import Dict, Iterable, List
+
+import mido
+from mido.midifiles.meta import meta_charset
+from mido.midifiles.midifiles import write_track
+
+TICKS_PER_BEAT = 960
+
+# Data bytes following a channel status, by its high nibble
+_DATA_LENGTH = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+
+
+def encode_track(track: mido.MidiTrack, charset: str = "latin1") -> bytes:
+    """The complete MTrk chunk (header included)."""
+    buffer = io.BytesIO()
+    with meta_charset(charset):
+        write_track(buffer, track)
+    return buffer.getvalue()
+
+
+def encode_messages(messages: Iterable, charset: str = "latin1") -> bytes:
+    """
+    Event data of `messages` (delta time + message, with running status)
+    without the chunk header, so parts of a track can be encoded on their
+    own. Running status starts afresh: the first channel message always
+    carries its status byte.
+    """
+    data = bytearray()
+    running_status = None
+    with meta_charset(charset):
+        for msg in messages:
+            data.extend(_variable_int(msg.time))
+            msg_bytes = msg.bytes()
+            if msg.is_meta:
+                data.extend(msg_bytes)
+                running_status = None
+                continue
+            if msg.type == "sysex":
+                # Length prefixed in files, the end byte included
+                data.append(0xF0)
+                data.extend(_variable_int(len(msg.data) + 1))
+                data.extend(msg.data)
+                data.append(0xF7)
+                running_status = None
+                continue
+            status = msg_bytes[0]
+            data.extend(msg_bytes[1:] if status == running_status else msg_bytes)
+            running_status = status if status < 0xF0 else None
+    return bytes(data)
+
+
+def chunk(data: bytes) -> bytes:
+    return b"MTrk" + struct.pack(">L", len(data)) + data
+
+
+def tempo_chunk(tempo_bpm: int) -> bytes:
+    track = mido.MidiTrack()
+    track.append(mido.MetaMessage("set_tempo", tempo=mido.bpm2tempo(tempo_bpm), time=0))
+    track.append(mido.MetaMessage("end_of_track", time=0))
+    return encode_track(track)
+
+
+def assemble(chunks: List[bytes], ticks_per_beat: int = TICKS_PER_BEAT) -> bytes:
+    """A type 1 MIDI file made of already encoded MTrk chunks."""
+    header = b"MThd" + struct.pack(">Lhhh", 6, 1, len(chunks), ticks_per_beat)
+    return b"".join([header, *chunks])
+
+
+def remap_channels(data: bytes, mapping: Dict[int, int]) -> bytes:
+    """
+    Event data (as from encode_messages) with channel `c` replaced by
+    `mapping[c]`, channels missing from the mapping are kept. The mapping
+    must be one-to-one, otherwise two statuses that differed could become
+    equal and the running status would no longer match.
+    """
+    if all(src == dst for src, dst in mapping.items()):
+        return data
+    table = bytes(
+        (status & 0xF0) | mapping.get(status & 0x0F, status & 0x0F)
+        if 0x80 <= status < 0xF0
+        else status
+        for status in range(256)
+    )
+
+    out = bytearray(data)
+    pos = 0
+    end = len(out)
+    running_length = 0
+    while pos < end:
+        # Delta time
+        while out[pos] & 0x80:
+            pos += 1
+        pos += 1
+
+        status = out[pos]
+        if status == 0xFF:
+            # Meta: type, length, data
+            pos, length = _read_variable_int(out, pos + 2)
+            pos += length
+            running_length = 0
+        elif status in (0xF0, 0xF7):
+            pos, length = _read_variable_int(out, pos + 1)
+            pos += length
+            running_length = 0
+        elif status & 0x80:
+            out[pos] = table[status]
+            running_length = _DATA_LENGTH[status >> 4]
+            pos += 1 + running_length
+        else:
+            # Running status, data bytes only
+            if not running_length:
+                raise ValueError(f"Running status without a previous status at {pos}")
+            pos += running_length
+    return bytes(out)
+
+
+def _variable_int(value: int) -> bytes:
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _read_variable_int(data, pos: int):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return pos, value
@@ -0,0 +1,71 @@
+"""
+Tie chains.
+
+Guitar Pro marks every note continuing the previous one on the same string
+as NoteType.TIE. Played as is, each segment re-attacks the note, so chains
+are merged: the first note sounds until the end of the last one, the tied
+notes only contribute their bends.
+
+One pass over the track keeps the open note of each (string, voice); a tie
+extends it when it starts where that note ends with the same pitch,
+anything else on that string closes it.
+"""
+from typing import Callable, Dict, NamedTuple, Set, Tuple
+
+from backend.models.song_model import Note, NoteType, Track
+
+# Tuplet durations are truncated to whole ticks, a tie may start a tick or
+# two after the note it continues
+TIE_TOLERANCE_TICKS = 2
+
+
+class TieChains(NamedTuple):
+    # id(note) -> end tick of its chain, for every note of a merged chain
+    ends: Dict[int, int]
+    # id(note) of the tied notes folded into an earlier one
+    continuations: Set[int]
+    # id(note) -> id(note) of the first note of its chain, for every note
+    # of a merged chain
+    heads: Dict[int, int]
+
+
+def resolve_ties(track: Track, pitch: Callable[[Note], int]) -> TieChains:
+    # (string, voice) -> [pitch, end tick, ids of the notes in the chain]
+    open_notes: Dict[Tuple[int, int], list] = {}
+    merged = []
+    continuations = set()
+
+    for measure in track.measures:
+        for beat in measure.beats:
+            end = beat.start_time + beat.duration
+            for note in beat.notes:
+                key = (note.string, beat.voice)
+                if note.type in (NoteType.REST, NoteType.DEAD):
+                    open_notes.pop(key, None)
+                    continue
+
+                note_pitch = pitch(note)
+                if note.type == NoteType.TIE:
+                    chain = open_notes.get(key)
+                    if (
+                        chain is not None
+                        and chain[0] == note_pitch
+                        and abs(beat.start_time - chain[1]) <= TIE_TOLERANCE_TICKS
+                    ):
+                        if len(chain[2]) == 1:
+                            merged.append(chain)
+                        chain[1] = end
+                        chain[2].append(id(note))
+                        continuations.add(id(note))
+                        continue
+                    # Nothing to continue: played as a new note
+
+                open_notes[key] = [note_pitch, end, [id(note)]]
+
+    ends = {}
+    heads = {}
+    for _, chain_end, ids in merged:
+        for note_id in ids:
+            ends[note_id] = chain_end
+            heads[note_id] = ids[0]
+    return TieChains(ends, continuations, heads)
@@ -0,0 +1,147 @@
+"""
+Cache of encoded MTrk chunks.
+
+A chunk only depends on the track itself, the fidelity mode, the
+channels it was given and whether it was compacted, so it is stored under
+(song key, track number, high fidelity, channels, compact). Converting the
+same file again with other tracks selected, or after toggling High
+Fidelity back, reassembles the cached chunks behind a fresh header and
+tempo track. Together with the outline of the song (tempo, which tracks
+exist), that needs neither parsing nor rendering.
+
+Song keys are content hashes of the uploaded file. Bounded in bytes, least
+recently used chunks go first.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from backend.core.converter.mtrk import assemble, tempo_chunk
+from backend.models.song_model import Song
+
+CACHE_BYTES = int(os.environ.get("GP2MIDI_TRACK_CACHE_BYTES", str(64 * 1024 * 1024)))
+MAX_OUTLINES = 1024
+
+
+class SongOutline(NamedTuple):
+    """What assembling a file needs besides the track chunks."""
+
+    tempo: int
+    tracks: Tuple[Tuple[int, bool], ...]  # (number, is_percussion)
+
+
+ChunkKey = Tuple[str, int, bool, Tuple[int, ...], bool]
+
+
+class TrackChunkCache:
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._chunks: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._outlines: "OrderedDict[str, SongOutline]" = OrderedDict()
+        self._bytes = 0
+        # Writers run in the threadpool
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: ChunkKey) -> Optional[bytes]:
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                self.misses += 1
+                return None
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return chunk
+
+    def put(self, key: ChunkKey, chunk: bytes):
+        if len(chunk) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._chunks.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._chunks[key] = chunk
+            self._bytes += len(chunk)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def remember_song(self, song_key: str, song: Song):
+        """Keeps the outline of a freshly parsed (unfiltered) song."""
+        outline = SongOutline(
+            tempo=song.tempo,
+            tracks=tuple((t.number, t.is_percussion) for t in song.tracks),
+        )
+        with self._lock:
+            self._outlines[song_key] = outline
+            self._outlines.move_to_end(song_key)
+            while len(self._outlines) > MAX_OUTLINES:
+                self._outlines.popitem(last=False)
+
+    def outline(self, song_key: str) -> Optional[SongOutline]:
+        with self._lock:
+            return self._outlines.get(song_key)
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._outlines.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "chunks": len(self._chunks),
+                "songs": len(self._outlines),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+            }
+
+
+def chunk_key(
+    song_key: str,
+    number: int,
+    high_fidelity: bool,
+    channels: Iterable[int],
+    compact: bool = False,
+) -> ChunkKey:
+    return (song_key, number, high_fidelity, tuple(channels), compact)
+
+
+def assemble_cached(
+    cache: TrackChunkCache,
+    song_key: str,
+    high_fidelity: bool,
+    allocate: Callable[[int, bool], List[int]],
+    track_numbers: Optional[Iterable[int]] = None,
+    compact: bool = False,
+) -> Optional[bytes]:
+    """
+    The MIDI file for a previously converted song, built only from cached
+    chunks, or None if anything is missing. `allocate(number,
+    is_percussion)` must hand out channels exactly as the writer does.
+    """
+    outline = cache.outline(song_key)
+    if outline is None:
+        return None
+    wanted = set(track_numbers) if track_numbers else None
+
+    chunks = [tempo_chunk(outline.tempo)]
+    for number, is_percussion in outline.tracks:
+        if wanted is not None and number not in wanted:
+            continue
+        channels = allocate(number, is_percussion)
+        chunk = cache.get(chunk_key(song_key, number, high_fidelity, channels, compact))
+        if chunk is None:
+            return None
+        chunks.append(chunk)
+    return assemble(chunks)
+
+
+track_cache = TrackChunkCache()
@@ -0,0 +1,46 @@
+"""
+Deferred imports with timings.
+
+PyGuitarPro, mido and the parsers are only needed once a file comes in, so
+the API imports them on first use instead of at startup. Each deferred
+import is timed and the numbers are exposed on /api/metrics, a dependency
+that suddenly takes much longer to load shows up there.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+_timings: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def timed_import(module_name: str) -> ModuleType:
+    """importlib.import_module() that records how long the first import took."""
+    # sys.modules also holds modules another thread is still importing,
+    # import_module() waits for those instead of handing them out half done
+    if module_name in sys.modules:
+        return importlib.import_module(module_name)
+
+    # Requests parsing in threads may race for the same module, the import
+    # lock makes the second one wait and the timing is only recorded once
+    with _lock:
+        if module_name in sys.modules:
+            return importlib.import_module(module_name)
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _timings[module_name] = round(elapsed_ms, 3)
+    logger.info(f"Imported {module_name} in {elapsed_ms:.1f} ms")
+    return module
+
+
+def import_timings() -> Dict[str, float]:
+    """Milliseconds spent on each deferred import so far."""
+    with _lock:
+        return dict(_timings)
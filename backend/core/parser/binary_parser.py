@@ -1,6 +1,19 @@
-from backend.core.parser.gp_parser import GPParser
-
-import guitarpro
+import io
+import logging
+import os
+from typing import Iterable, Optional
+
+from backend.core.budget import ParseBudget
+from backend.core.cancellation import CancelToken, check
+from backend.core.imports import timed_import
+from backend.core.parser.gp_parser import TICKS_PER_QUARTER, GPParser
+from backend.core.parser.native_binary_reader import (
+    GP4_SLIDES,
+    NativeBinaryReader,
+    NativeReaderError,
+    articulation_effects,
+    bend_point_to_ir,
+)
 
 from backend.models.song_model import (
     Beat,
@@ -13,30 +26,92 @@ from backend.models.song_model import (
     Track,
 )
 
+logger = logging.getLogger(__name__)
+
+# The native reader is opt-in until it has seen more real-world files
+NATIVE_READER_ENABLED = os.environ.get("GP2MIDI_NATIVE_READER", "0") == "1"
+
+
+def _guitarpro():
+    # PyGuitarPro is the slowest import of the app and the native reader
+    # doesn't need it, load it with the first file that does
+    return timed_import("guitarpro")
+
 
 class BinaryParser(GPParser):
+    def __init__(self, native: Optional[bool] = None):
+        self.native = NATIVE_READER_ENABLED if native is None else native
+
     def parse_file(self, file_path: str) -> Song:
+        if self.native:
+            with open(file_path, "rb") as f:
+                return self.parse_bytes(f.read())
         try:
-            gp_song = guitarpro.parse(file_path)
+            gp_song = _guitarpro().parse(file_path)
             return self._map_to_ir(gp_song)
         except Exception as e:
             print(f"Error parsing GP file: {e}")
             raise
 
-    def parse_bytes(self, file_content: bytes) -> Song:
-        # PyGuitarPro parse expects a stream or path.
-        # We might need to write to temp file or wrap bytes in io.BytesIO
-        import io
-
+    def parse_bytes(
+        self,
+        file_content: bytes,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
+        # Binary files have no compression nor references, what they hold
+        # is bounded by their size; `budget` only matters to the writer
+        if self.native:
+            song = self._parse_native(file_content, cancel=cancel)
+            if song is not None:
+                return song
+
+        # PyGuitarPro reads the version header itself, a stream is enough.
+        # It can't be interrupted, the mapping below checks per measure.
         stream = io.BytesIO(file_content)
-        # Note: guitarpro.parse might strictly require a filename for 
-        # extension detection?
-        # Let's inspect source or try. Usually it reads headers.
-        # Ideally we save to temp file to be safe.
-        gp_song = guitarpro.parse(stream)
-        return self._map_to_ir(gp_song)
-
-    def _map_to_ir(self, gp_song) -> Song:
+        gp_song = _guitarpro().parse(stream)
+        return self._map_to_ir(gp_song, cancel)
+
+    def parse_preview_bytes(
+        self,
+        file_content: bytes,
+        seconds: float,
+        track_numbers: Optional[Iterable[int]] = None,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
+        if not self.native:
+            return super().parse_preview_bytes(
+                file_content, seconds, track_numbers, cancel
+            )
+
+        # Measures are stored one after another, the native reader can stop
+        # as soon as the preview window is covered
+        song = self._parse_native(file_content, max_seconds=seconds, cancel=cancel)
+        if song is None:
+            return super().parse_preview_bytes(
+                file_content, seconds, track_numbers, cancel
+            )
+        if track_numbers:
+            wanted = set(track_numbers)
+            song.tracks = [t for t in song.tracks if t.number in wanted]
+        return song
+
+    def _parse_native(
+        self,
+        file_content: bytes,
+        max_seconds: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ):
+        try:
+            return NativeBinaryReader(file_content).read_song(
+                max_seconds=max_seconds, cancel=cancel
+            )
+        except NativeReaderError as e:
+            logger.warning(f"Native GP reader failed, falling back to PyGuitarPro: {e}")
+            return None
+
+    def _map_to_ir(self, gp_song, cancel: Optional[CancelToken] = None) -> Song:
         song = Song(title=gp_song.title, artist=gp_song.artist, tempo=gp_song.tempo)
 
         for gp_track in gp_song.tracks:
@@ -46,23 +121,29 @@ class BinaryParser(GPParser):
                 is_percussion=gp_track.isPercussionTrack,
                 channel=gp_track.channel.channel,
                 program=gp_track.channel.instrument,
+                # GP lists strings from the highest to the lowest
+                tuning=[s.value for s in reversed(gp_track.strings)],
             )
 
             for gp_measure in gp_track.measures:
+                check(cancel)
                 measure = Measure(
                     number=gp_measure.number,
                     numerator=gp_measure.timeSignature.numerator,
                     denominator=gp_measure.timeSignature.denominator.value,
                 )
 
-                for gp_voice in gp_measure.voices:
+                for voice_index, gp_voice in enumerate(gp_measure.voices):
                     # GP has 2 voices per track usually. We flatten or keep them?
                     # For now, flatten beats from valid voices
                     for gp_beat in gp_voice.beats:
+                        # Tuplets can make PyGuitarPro times fractional
+                        duration_ticks = int(gp_beat.duration.time)
                         beat = Beat(
-                            start_time=gp_beat.start,
-                            duration=gp_beat.duration.value,
+                            start_time=int(gp_beat.start),
+                            duration=duration_ticks,
                             text=gp_beat.text,
+                            voice=voice_index,
                         )
 
                         for gp_note in gp_beat.notes:
@@ -79,10 +160,28 @@ class BinaryParser(GPParser):
                             # Effects
                             effects = []
                             if gp_note.effect.isBend:
-                                # Process bend points
                                 effects.append(
-                                    NoteEffect(type=EffectType.BEND)
-                                )  # Simplify for now
+                                    NoteEffect(
+                                        type=EffectType.BEND,
+                                        bend_points=[
+                                            bend_point_to_ir(p.position, p.value)
+                                            for p in gp_note.effect.bend.points
+                                        ],
+                                    )
+                                )
+                            slides = 0
+                            for slide in gp_note.effect.slides:
+                                slides |= GP4_SLIDES.get(slide.value, 0)
+                            trill_fret = None
+                            if gp_note.effect.isTrill:
+                                trill_fret = gp_note.effect.trill.fret
+                            effects += articulation_effects(
+                                gp_note.effect.hammer,
+                                slides,
+                                trill_fret,
+                                gp_note.effect.vibrato,
+                                gp_note.effect.palmMute,
+                            )
                             if gp_note.effect.isHarmonic:
                                 effects.append(NoteEffect(type=EffectType.HARMONIC))
 
@@ -90,9 +189,11 @@ class BinaryParser(GPParser):
                                 string=gp_note.string,
                                 fret=gp_note.value,
                                 velocity=gp_note.velocity,
-                                duration=1.0,  # Placeholder, need real duration calc
+                                duration=duration_ticks / TICKS_PER_QUARTER,
                                 type=note_type,
                                 effects=effects,
+                                duration_percent=gp_note.durationPercent,
+                                midi_number=gp_note.realValue,
                             )
                             beat.notes.append(note)
 
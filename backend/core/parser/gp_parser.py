@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional, Tuple
 
-from backend.models.song_model import Song
+from backend.core.budget import ParseBudget
+from backend.core.cancellation import CancelToken
+from backend.models.song_model import Song, Track
+
+TICKS_PER_QUARTER = 960
+
+
+def measure_seconds(numerator: int, denominator: int, tempo: int) -> float:
+    """Wall-clock length of one measure at a constant tempo (BPM)."""
+    quarters = numerator * 4.0 / denominator
+    return quarters * 60.0 / max(1, tempo)
 
 
 class GPParser(ABC):
@@ -12,8 +23,75 @@ class GPParser(ABC):
         pass
 
     @abstractmethod
-    def parse_bytes(self, file_content: bytes) -> Song:
+    def parse_bytes(
+        self,
+        file_content: bytes,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
         """
         Parses bytes directly (useful for API uploads).
+        `cancel` is checked between measures, Cancelled aborts the parse.
+        `budget` bounds what the parse may read and build (a default
+        ParseBudget when omitted), BudgetExceeded aborts it.
         """
         pass
+
+    def iter_tracks(
+        self,
+        file_content: bytes,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Tuple[Song, Iterator[Track]]:
+        """
+        The song with its tracks, and an iterator that yields each track
+        once its measures are parsed. Until then the song's tracks only
+        hold their metadata.
+
+        The default implementation parses everything first; parsers that
+        can finish tracks one by one should override it.
+        """
+        song = self.parse_bytes(file_content, cancel, budget)
+        return song, iter(list(song.tracks))
+
+    def parse_preview_bytes(
+        self,
+        file_content: bytes,
+        seconds: float,
+        track_numbers: Optional[Iterable[int]] = None,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
+        """
+        Parses only enough measures to cover the first `seconds` of the song.
+        `track_numbers` (1-based, as in Track.number) restricts the result.
+
+        The default implementation parses everything and trims afterwards;
+        parsers that can stop early should override it.
+        """
+        song = self.parse_bytes(file_content, cancel, budget)
+        if track_numbers:
+            wanted = set(track_numbers)
+            song.tracks = [t for t in song.tracks if t.number in wanted]
+        trim_song(song, seconds)
+        return song
+
+
+def trim_song(song: Song, seconds: float) -> Song:
+    """Drops every measure that starts at or after `seconds`."""
+    if not song.tracks:
+        return song
+
+    # All tracks share the same measure headers, the first one is enough
+    # to find the cut-off.
+    keep = 0
+    elapsed = 0.0
+    for measure in song.tracks[0].measures:
+        if elapsed >= seconds:
+            break
+        elapsed += measure_seconds(measure.numerator, measure.denominator, song.tempo)
+        keep += 1
+
+    for track in song.tracks:
+        del track.measures[keep:]
+    return song
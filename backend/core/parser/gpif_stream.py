@@ -0,0 +1,167 @@
+"""
+Streaming access to score.gpif.
+
+Guitar Pro stores its score as flat, id-referenced sections in dependency
+order: MasterBars -> Bars -> Voices -> Beats -> Notes. Walking the document
+with iterparse lets us decide while reading which elements are worth keeping,
+so the tree we hand to XmlParser only holds what a caller asked for.
+"""
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Optional, Set
+
+from backend.core.budget import ParseBudget
+from backend.core.parser.gp_parser import measure_seconds
+
+# Section tag -> item tag
+SECTIONS = {
+    "MasterBars": "MasterBar",
+    "Bars": "Bar",
+    "Voices": "Voice",
+    "Beats": "Beat",
+    "Notes": "Note",
+}
+
+# Item tag -> (child reference tag, referenced item tag)
+REFERENCES = {
+    "Bar": ("Voices", "Voice"),
+    "Voice": ("Beats", "Beat"),
+    "Beat": ("Notes", "Note"),
+}
+
+
+def local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def split_ns(tag: str) -> str:
+    parts = tag.split("}")
+    return parts[0] + "}" if len(parts) > 1 else ""
+
+
+def first_tempo(master_track: ET.Element, ns: str, default: int = 120) -> int:
+    automations = master_track.find(f"{ns}Automations")
+    if automations is None:
+        return default
+    for auto in automations.findall(f"{ns}Automation"):
+        if auto.findtext(f"{ns}Type") == "Tempo":
+            value = auto.findtext(f"{ns}Value")
+            if value:
+                try:
+                    return int(float(value.split()[0]))
+                except ValueError:
+                    pass
+    return default
+
+
+def load_preview_root(
+    source,
+    seconds: float,
+    track_indices: Optional[Iterable[int]] = None,
+    budget: Optional[ParseBudget] = None,
+) -> ET.Element:
+    """
+    Streams score.gpif from `source` (a binary file object) and returns a
+    root element that only contains the MasterBars starting within the
+    first `seconds`, plus the Bars/Voices/Beats/Notes they reference for
+    the tracks at `track_indices` (0-based positions in MasterTrack/Tracks).
+    Bytes read and elements seen are charged to `budget` when given.
+
+    Everything else is cleared as soon as it has been read. If the sections
+    come in an unexpected order the referenced set is unknown and the whole
+    section is kept, which is slower but still correct.
+    """
+    indices = set(track_indices) if track_indices is not None else None
+
+    # Referenced ids per item tag. None means "not known yet, keep all".
+    needed: Dict[str, Optional[Set[str]]] = {
+        "Bar": None,
+        "Voice": None,
+        "Beat": None,
+        "Note": None,
+    }
+    pending: Dict[str, Set[str]] = {tag: set() for tag in needed}
+
+    root = None
+    ns = ""
+    tempo = 120
+    elapsed = 0.0
+    depth = 0
+    section = None
+    kept = []
+
+    if budget is not None:
+        source = budget.reader(source)
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if budget is not None:
+                budget.charge_element()
+            depth += 1
+            if depth == 1:
+                root = elem
+                ns = split_ns(elem.tag)
+            elif depth == 2:
+                name = local_name(elem.tag)
+                section = name if name in SECTIONS else None
+                kept = []
+            continue
+
+        depth -= 1
+        if depth == 1:
+            # A top level element just ended
+            name = local_name(elem.tag)
+            if name == "MasterTrack":
+                tempo = first_tempo(elem, ns)
+            if section:
+                elem[:] = kept
+                child = SECTIONS[section]
+                if section == "MasterBars":
+                    needed["Bar"] = pending["Bar"]
+                elif child in REFERENCES:
+                    ref_item = REFERENCES[child][1]
+                    if needed[ref_item] is None:
+                        needed[ref_item] = pending[ref_item]
+            section = None
+            continue
+
+        if depth != 2 or section is None:
+            continue
+
+        # An item of one of the id-referenced sections just ended
+        item = SECTIONS[section]
+        if item == "MasterBar":
+            if elapsed >= seconds:
+                elem.clear()
+                continue
+            num, den = _time_signature(elem.findtext(f"{ns}Time"))
+            elapsed += measure_seconds(num, den, tempo)
+            bar_refs = (elem.findtext(f"{ns}Bars") or "").split()
+            for idx, bar_id in enumerate(bar_refs):
+                if indices is None or idx in indices:
+                    pending["Bar"].add(bar_id)
+            kept.append(elem)
+            continue
+
+        wanted = needed[item]
+        if wanted is not None and elem.get("id") not in wanted:
+            elem.clear()
+            continue
+
+        kept.append(elem)
+        if item in REFERENCES:
+            ref_tag, ref_item = REFERENCES[item]
+            refs = elem.findtext(f"{ns}{ref_tag}")
+            if refs:
+                pending[ref_item].update(refs.split())
+
+    if root is None:
+        raise ValueError("Invalid GPX/GP file: empty score.gpif")
+    return root
+
+
+def _time_signature(text: Optional[str]):
+    try:
+        num, den = (int(x) for x in (text or "4/4").split("/"))
+        return num, den
+    except ValueError:
+        return 4, 4
@@ -0,0 +1,225 @@
+"""
+Guitar Pro 6 (.gpx) container.
+
+A .gpx file is a small sector based filesystem ("BCFS") holding score.gpif
+and a few other files, usually compressed as a whole ("BCFZ"):
+
+    BCFZ   "BCFZ", decompressed size (int32 LE), then a bit stream (most
+           significant bit first) of chunks:
+             0 + 2 bit count (LSB first) + count literal bytes
+             1 + 4 bit word size + offset and size words (LSB first):
+               copy min(offset, size) bytes from `offset` bytes back
+    BCFS   "BCFS", then 0x1000 byte sectors. Sector entries of type 2
+           describe a file: name at +0x04, size at +0x8C and a 0 terminated
+           list of sector numbers at +0x94.
+
+Decompression writes into a single preallocated bytearray, and file
+contents are returned as memoryviews of their sectors so score.gpif can be
+fed to the XML parser without being copied again.
+"""
+import struct
+from typing import Dict, List, Optional
+
+from backend.core.budget import BudgetExceeded
+
+BCFZ = b"BCFZ"
+BCFS = b"BCFS"
+SECTOR_SIZE = 0x1000
+FILE_ENTRY = 2
+NAME_OFFSET = 0x04
+NAME_LENGTH = 127
+SIZE_OFFSET = 0x8C
+SECTORS_OFFSET = 0x94
+
+# Longest back reference a chunk can write (15 bit size word)
+_MAX_CHUNK = (1 << 15) - 1
+
+_I32 = struct.Struct("<i")
+
+# Bit-reversed bytes, reversing a 1-15 bit word takes two lookups
+_REVERSED_BYTE = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+class GpxContainerError(ValueError):
+    pass
+
+
+def is_gpx(data) -> bool:
+    return bytes(data[:4]) in (BCFZ, BCFS)
+
+
+def _reverse_bits(value: int, width: int) -> int:
+    reversed16 = (_REVERSED_BYTE[value & 0xFF] << 8) | _REVERSED_BYTE[value >> 8]
+    return reversed16 >> (16 - width)
+
+
+def decompress_bcfz(data, max_size: Optional[int] = None) -> memoryview:
+    """
+    Decodes a BCFZ stream (header included) and returns a view of the
+    decompressed BCFS image. `max_size` rejects oversized images before
+    anything is allocated.
+    """
+    src = memoryview(data)
+    if bytes(src[:4]) != BCFZ:
+        raise GpxContainerError("Not a BCFZ stream")
+    if len(src) < 8:
+        raise GpxContainerError("Truncated BCFZ header")
+    expected = _I32.unpack_from(src, 4)[0]
+    if expected < 0:
+        raise GpxContainerError(f"Invalid BCFZ size {expected}")
+    if max_size is not None and expected > max_size:
+        raise BudgetExceeded("decompressed_bytes", max_size)
+
+    # The last chunk may run past the announced size
+    out = bytearray(expected + _MAX_CHUNK)
+    written = 0
+
+    # Bit reader state: `acc` holds `nbits` unread bits, refilled 8 bytes at
+    # a time so a whole chunk header (at most 1 + 4 + 2 * 15 bits) or literal
+    # run (1 + 2 + 3 * 8 bits) is always available. Everything stays in
+    # locals, this loop is the hot path.
+    pos = 8
+    acc = 0
+    nbits = 0
+    from_bytes = int.from_bytes
+    reverse = _reverse_bits
+
+    try:
+        while written < expected:
+            if nbits < 40:
+                chunk = src[pos:pos + 8]
+                acc = (acc << (8 * len(chunk))) | from_bytes(chunk, "big")
+                nbits += 8 * len(chunk)
+                pos += len(chunk)
+
+            nbits -= 1
+            if (acc >> nbits) & 1:
+                # Back reference
+                nbits -= 4
+                width = (acc >> nbits) & 0xF
+                mask = (1 << width) - 1
+                nbits -= width
+                offset = reverse((acc >> nbits) & mask, width) if width else 0
+                nbits -= width
+                size = reverse((acc >> nbits) & mask, width) if width else 0
+                count = min(offset, size)
+                start = written - offset
+                if start < 0:
+                    raise GpxContainerError("BCFZ back reference before start")
+                out[written:written + count] = out[start:start + count]
+                written += count
+            else:
+                # Literal bytes, read as one big-endian word
+                nbits -= 2
+                count = reverse((acc >> nbits) & 0x3, 2)
+                if count:
+                    nbits -= 8 * count
+                    value = (acc >> nbits) & ((1 << (8 * count)) - 1)
+                    out[written:written + count] = value.to_bytes(count, "big")
+                    written += count
+
+            acc &= (1 << nbits) - 1
+    except ValueError as e:
+        # Negative shift count: the bits ran out before the announced size
+        if isinstance(e, GpxContainerError):
+            raise
+        raise GpxContainerError("BCFZ stream ended early") from e
+    finally:
+        src.release()
+
+    return memoryview(out)[:written]
+
+
+class GpxContainer:
+    """Files of a BCFS image, as lists of sector memoryviews."""
+
+    def __init__(self, data, max_size: Optional[int] = None):
+        view = memoryview(data)
+        if bytes(view[:4]) == BCFZ:
+            view = decompress_bcfz(view, max_size)
+        if bytes(view[:4]) != BCFS:
+            raise GpxContainerError("Not a GPX (BCFS) container")
+        # Sector offsets are relative to the end of the header
+        self._data = view[4:]
+        self._entries = self._read_entries()
+
+    def _int(self, offset: int) -> int:
+        if offset + 4 > len(self._data):
+            raise GpxContainerError(f"GPX entry runs past the end at {offset}")
+        return _I32.unpack_from(self._data, offset)[0]
+
+    def _read_entries(self) -> Dict[str, List[memoryview]]:
+        data = self._data
+        entries = {}
+        offset = SECTOR_SIZE
+        while offset + 3 < len(data):
+            if self._int(offset) == FILE_ENTRY:
+                entry_offset = offset
+                name_start = offset + NAME_OFFSET
+                raw_name = bytes(data[name_start:name_start + NAME_LENGTH])
+                name = raw_name.split(b"\x00", 1)[0].decode("latin-1")
+                remaining = self._int(offset + SIZE_OFFSET)
+
+                chunks = []
+                pointer = offset + SECTORS_OFFSET
+                while True:
+                    sector = self._int(pointer)
+                    if sector == 0:
+                        break
+                    pointer += 4
+                    # Like Guitar Pro, the walk continues after the last
+                    # sector of the file
+                    offset = sector * SECTOR_SIZE
+                    if remaining > 0:
+                        size = min(SECTOR_SIZE, remaining)
+                        if sector < 0 or offset + size > len(data):
+                            raise GpxContainerError(f"GPX sector {sector} out of range")
+                        chunks.append(data[offset:offset + size])
+                        remaining -= size
+                entries[name] = chunks
+                # Sectors pointing backwards would make the walk loop forever
+                offset = max(offset, entry_offset)
+            offset += SECTOR_SIZE
+        return entries
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def chunks(self, name: str) -> List[memoryview]:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise GpxContainerError(f"{name} not found in GPX container")
+
+    def read(self, name: str) -> bytes:
+        return b"".join(self.chunks(name))
+
+    def size(self, name: str) -> int:
+        return sum(len(c) for c in self.chunks(name))
+
+
+class ChunkReader:
+    """Minimal binary file object over a list of buffers, for iterparse."""
+
+    def __init__(self, chunks: List[memoryview]):
+        self._chunks = chunks
+        self._index = 0
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            parts = []
+            while True:
+                part = self.read(SECTOR_SIZE)
+                if not part:
+                    return b"".join(parts)
+                parts.append(part)
+        while self._index < len(self._chunks):
+            chunk = self._chunks[self._index]
+            if self._pos < len(chunk):
+                data = bytes(chunk[self._pos:self._pos + size])
+                self._pos += len(data)
+                return data
+            self._index += 1
+            self._pos = 0
+        return b""
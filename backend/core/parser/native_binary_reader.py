@@ -0,0 +1,682 @@
+"""
+Native reader for Guitar Pro 3, 4 and 5 files.
+
+Decodes the binary format straight from a memoryview with precompiled struct
+formats and emits our IR in a single pass, instead of letting PyGuitarPro
+build its own object graph that BinaryParser then copies. Only what the IR
+needs is decoded, everything else (chord diagrams, mix tables, RSE data...)
+is skipped by size.
+
+The layout and its quirks (tick origin at one quarter note, tied note
+lookup, bend point scaling) follow PyGuitarPro, which stays the fallback
+and the reference implementation in the tests.
+"""
+import struct
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from backend.core.cancellation import Cancelled, CancelToken, check
+from backend.core.parser.gp_parser import TICKS_PER_QUARTER, measure_seconds
+from backend.models.song_model import (
+    SLIDE_IN_ABOVE,
+    SLIDE_IN_BELOW,
+    SLIDE_LEGATO,
+    SLIDE_OUT_DOWN,
+    SLIDE_OUT_UP,
+    SLIDE_SHIFT,
+    VIBRATO_SLIGHT,
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+
+VERSIONS = {
+    "FICHIER GUITAR PRO v3.00": (3, 0, 0),
+    "FICHIER GUITAR PRO v4.00": (4, 0, 0),
+    "FICHIER GUITAR PRO v4.06": (4, 0, 6),
+    "FICHIER GUITAR PRO L4.06": (4, 0, 6),
+    "CLIPBOARD GUITAR PRO 4.0 [c6]": (4, 0, 6),
+    "FICHIER GUITAR PRO v5.00": (5, 0, 0),
+    "FICHIER GUITAR PRO v5.10": (5, 1, 0),
+    "CLIPBOARD GP 5.0": (5, 0, 0),
+    "CLIPBOARD GP 5.1": (5, 1, 0),
+    "CLIPBOARD GP 5.2": (5, 2, 0),
+}
+
+_I8 = struct.Struct("<b")
+_I16 = struct.Struct("<h")
+_I32 = struct.Struct("<i")
+_F64 = struct.Struct("<d")
+# Instrument, volume, balance, chorus, reverb, phaser, tremolo, 2 blank bytes
+_MIDI_CHANNEL = struct.Struct("<i6b2x")
+_TUNING = struct.Struct("<7i")
+# Position, value, vibrato
+_BEND_POINT = struct.Struct("<ii?")
+# GP3/GP4 mix table: instrument, volume..tremolo, tempo
+_MIX_TABLE = struct.Struct("<7bi")
+
+WHOLE_TIME = TICKS_PER_QUARTER * 4
+# Ticks before the first measure, PyGuitarPro starts its timeline there
+FIRST_MEASURE_START = TICKS_PER_QUARTER
+
+TUPLETS = {
+    3: (3, 2), 5: (5, 4), 6: (6, 4), 7: (7, 4), 9: (9, 8),
+    10: (10, 8), 11: (11, 8), 12: (12, 8), 13: (13, 8),
+}
+
+# Beat status byte
+STATUS_EMPTY = 0
+STATUS_NORMAL = 1
+
+# GP note type byte -> IR note type
+NOTE_TYPES = {0: NoteType.REST, 2: NoteType.TIE, 3: NoteType.DEAD}
+
+DEFAULT_VELOCITY = 95  # forte
+
+# GP4 slide byte (PyGuitarPro's SlideType values) -> IR slide flags, GP5
+# stores the flags themselves
+GP4_SLIDES = {
+    -2: SLIDE_IN_ABOVE, -1: SLIDE_IN_BELOW, 1: SLIDE_SHIFT,
+    2: SLIDE_LEGATO, 3: SLIDE_OUT_DOWN, 4: SLIDE_OUT_UP,
+}
+
+
+class NativeReaderError(ValueError):
+    pass
+
+
+def bend_point_to_ir(position: int, value: int) -> BendPoint:
+    """
+    Converts a bend point in PyGuitarPro units (position 0-12, value in
+    quarter tones) to the GPIF units used by the IR (position 0-100,
+    100 = one tone).
+    """
+    return BendPoint(position=round(position * 100 / 12), value=value * 25)
+
+
+def articulation_effects(
+    hammer: bool, slides: int, trill_fret: Optional[int], vibrato: bool, palm_mute: bool
+) -> List[NoteEffect]:
+    """The IR effects of a note's articulations, in the order both GP readers use."""
+    effects = []
+    if hammer:
+        effects.append(NoteEffect(type=EffectType.HAMMER))
+    if slides:
+        effects.append(NoteEffect(type=EffectType.SLIDE, value=slides))
+    if trill_fret is not None:
+        effects.append(NoteEffect(type=EffectType.TRILL, value=trill_fret))
+    if vibrato:
+        effects.append(NoteEffect(type=EffectType.VIBRATO, value=VIBRATO_SLIGHT))
+    if palm_mute:
+        effects.append(NoteEffect(type=EffectType.PALM_MUTE))
+    return effects
+
+
+def unpack_velocity(dynamic: int) -> int:
+    return 15 + 16 * dynamic - 16
+
+
+class _TrackState:
+    __slots__ = ("index", "ir", "strings")
+
+    def __init__(self, index: int, ir: Track, strings: Tuple[int, ...]):
+        self.index = index
+        self.ir = ir
+        # String tunings as stored in the file, highest string first
+        self.strings = strings
+
+
+class NativeBinaryReader:
+    def __init__(self, data, encoding: str = "cp1252"):
+        self.buf = memoryview(data)
+        self.pos = 0
+        self.encoding = encoding
+        self.version = None
+        self.version_tuple = None
+        self.major = 0
+
+    def read_song(
+        self,
+        max_seconds: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Song:
+        """
+        Decodes the whole file, or only the measures starting within the
+        first `max_seconds` when given. `cancel` is checked per measure.
+        """
+        try:
+            return self._read_song(max_seconds, cancel)
+        except (NativeReaderError, Cancelled):
+            raise
+        except Exception as e:
+            raise NativeReaderError(
+                f"Cannot decode GP file at byte {self.pos}: {e.__class__.__name__}: {e}"
+            ) from e
+
+    # Primitives
+    # ==========
+
+    def _skip(self, count: int):
+        self.pos += count
+
+    def _i8(self) -> int:
+        value = _I8.unpack_from(self.buf, self.pos)[0]
+        self.pos += 1
+        return value
+
+    def _u8(self) -> int:
+        value = self.buf[self.pos]
+        self.pos += 1
+        return value
+
+    def _i16(self) -> int:
+        value = _I16.unpack_from(self.buf, self.pos)[0]
+        self.pos += 2
+        return value
+
+    def _i32(self) -> int:
+        value = _I32.unpack_from(self.buf, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def _f64(self) -> float:
+        value = _F64.unpack_from(self.buf, self.pos)[0]
+        self.pos += 8
+        return value
+
+    def _byte_size_string(self, count: int) -> str:
+        size = self._u8()
+        start = self.pos
+        self.pos += count
+        return bytes(self.buf[start:start + min(size, count)]).decode(self.encoding)
+
+    def _int_byte_size_string(self) -> str:
+        count = self._i32()
+        if count < 1:
+            raise NativeReaderError(f"Invalid string length {count}")
+        return self._byte_size_string(count - 1)
+
+    def _int_size_string(self) -> str:
+        count = self._i32()
+        start = self.pos
+        self.pos += count
+        return bytes(self.buf[start:self.pos]).decode(self.encoding)
+
+    # Song
+    # ====
+
+    def _read_song(
+        self, max_seconds: Optional[float], cancel: Optional[CancelToken]
+    ) -> Song:
+        self.version = self._byte_size_string(30)
+        self.version_tuple = VERSIONS.get(self.version)
+        if self.version_tuple is None:
+            raise NativeReaderError(f"Unsupported version '{self.version}'")
+        self.major = self.version_tuple[0]
+        clipboard = self.version.startswith("CLIPBOARD")
+
+        if self.major == 3:
+            title, artist = self._read_info()
+            self._skip(1)  # triplet feel
+            tempo = self._i32()
+            self._skip(4)  # key
+        elif self.major == 4:
+            if clipboard:
+                self._skip(16)
+            title, artist = self._read_info()
+            self._skip(1)  # triplet feel
+            self._read_lyrics()
+            tempo = self._i32()
+            self._skip(5)  # key, octave
+        else:
+            if clipboard:
+                self._skip(28)
+            title, artist = self._read_info()
+            self._read_lyrics()
+            if self.version_tuple > (5, 0, 0):
+                self._skip(19)  # RSE master volume, unknown, 11 band equalizer
+            self._read_page_setup()
+            self._int_byte_size_string()  # tempo name
+            tempo = self._i32()
+            if self.version_tuple > (5, 0, 0):
+                self._skip(1)  # hide tempo
+            self._skip(5)  # key, octave
+
+        instruments = self._read_midi_channels()
+        if self.major == 5:
+            self._skip(19 * 2 + 4)  # directions, master reverb
+
+        measure_count = self._i32()
+        track_count = self._i32()
+
+        song = Song(title=title, artist=artist, tempo=tempo)
+        headers = self._read_measure_headers(measure_count)
+        tracks = self._read_tracks(track_count, instruments)
+        song.tracks = [t.ir for t in tracks]
+        self._read_measures(headers, tracks, tempo, max_seconds, cancel)
+        return song
+
+    def _read_info(self) -> Tuple[str, str]:
+        # title, subtitle, artist, album, words, [music,] copyright, tab,
+        # instructions
+        count = 9 if self.major == 5 else 8
+        info = [self._int_byte_size_string() for _ in range(count)]
+        for _ in range(self._i32()):  # notice lines
+            self._int_byte_size_string()
+        return info[0], info[2]
+
+    def _read_lyrics(self):
+        self._skip(4)  # track choice
+        for _ in range(5):
+            self._skip(4)  # starting measure
+            self._int_size_string()
+
+    def _read_page_setup(self):
+        self._skip(30)  # page size, margins, score proportion, header/footer flags
+        for _ in range(10):
+            self._int_byte_size_string()
+
+    def _read_midi_channels(self) -> List[int]:
+        instruments = []
+        for channel in range(64):
+            instrument = _MIDI_CHANNEL.unpack_from(self.buf, self.pos)[0]
+            self.pos += _MIDI_CHANNEL.size
+            if channel % 16 == 9 and instrument == -1:
+                instrument = 0
+            instruments.append(instrument)
+        return instruments
+
+    def _read_measure_headers(self, count: int) -> List[Tuple[int, int, int]]:
+        headers = []
+        numerator, denominator = 4, 4
+        gp5 = self.major == 5
+        for number in range(1, count + 1):
+            if gp5 and number > 1:
+                self._skip(1)
+            flags = self._u8()
+            if flags & 0x01:
+                numerator = self._i8()
+            if flags & 0x02:
+                denominator = self._i8()
+            if gp5:
+                if flags & 0x08:
+                    self._skip(1)  # repeat close
+                if flags & 0x20:
+                    self._read_marker()
+                if flags & 0x40:
+                    self._skip(2)  # key signature
+                if flags & 0x10:
+                    self._skip(1)  # repeat alternative
+                if flags & 0x03:
+                    self._skip(4)  # beams
+                if not flags & 0x10:
+                    self._skip(1)
+                self._skip(1)  # triplet feel
+            else:
+                if flags & 0x08:
+                    self._skip(1)  # repeat close
+                if flags & 0x10:
+                    self._skip(1)  # repeat alternative
+                if flags & 0x20:
+                    self._read_marker()
+                if flags & 0x40:
+                    self._skip(2)  # key signature
+            headers.append((number, numerator, denominator))
+        return headers
+
+    def _read_marker(self):
+        self._int_byte_size_string()
+        self._skip(4)  # color
+
+    def _read_tracks(self, count: int, instruments: List[int]) -> List[_TrackState]:
+        version = self.version_tuple
+        gp5 = self.major == 5
+        tracks = []
+        for i in range(count):
+            number = i + 1
+            if gp5 and (number == 1 or version == (5, 0, 0)):
+                self._skip(1)
+            flags = self._u8()
+            name = self._byte_size_string(40)
+            string_count = self._i32()
+            strings = _TUNING.unpack_from(self.buf, self.pos)[:max(0, string_count)]
+            self.pos += _TUNING.size
+            self._skip(4)  # port
+            channel = self._i32() - 1
+            self._skip(4)  # effect channel
+            if not 0 <= channel < len(instruments):
+                raise NativeReaderError(
+                    f"Track {number}: invalid MIDI channel {channel}"
+                )
+            if instruments[channel] < 0:
+                instruments[channel] = 0
+            self._skip(12)  # fret count, capo, color
+
+            if gp5:
+                # Settings flags, RSE accentuation/bank/humanize, clef
+                # transpositions, unknown int, 12 blank bytes
+                self._skip(2 + 3 + 8 + 4 + 12)
+                # RSE instrument
+                self._skip(12 + (3 if version == (5, 0, 0) else 4))
+                if version > (5, 0, 0):
+                    self._skip(4)  # equalizer
+                    self._int_byte_size_string()  # effect
+                    self._int_byte_size_string()  # effect category
+
+            track = Track(
+                number=number,
+                name=name,
+                is_percussion=bool(flags & 0x01) or channel == 9,
+                channel=channel,
+                program=instruments[channel],
+                tuning=list(reversed(strings)),
+            )
+            tracks.append(_TrackState(i, track, strings))
+
+        if gp5:
+            self._skip(2 if version == (5, 0, 0) else 1)
+        return tracks
+
+    # Measures
+    # ========
+
+    def _read_measures(
+        self,
+        headers: List[Tuple[int, int, int]],
+        tracks: List[_TrackState],
+        tempo: int,
+        max_seconds: Optional[float],
+        cancel: Optional[CancelToken],
+    ):
+        voice_count = 2 if self.major == 5 else 1
+        # (track index, voice index, string) -> fret of the last note,
+        # used to resolve tied notes in constant time
+        last_frets: Dict[Tuple[int, int, int], int] = {}
+        start = FIRST_MEASURE_START
+        elapsed = 0.0
+
+        for number, numerator, denominator in headers:
+            if max_seconds is not None and elapsed >= max_seconds:
+                break
+            check(cancel)
+            for track in tracks:
+                measure = Measure(
+                    number=number, numerator=numerator, denominator=denominator
+                )
+                for voice in range(voice_count):
+                    beats = self._read_voice(start, track, voice, last_frets)
+                    for beat_start, duration, text, notes, _ in beats:
+                        if not notes:
+                            continue
+                        ticks = int(duration)
+                        note_duration = ticks / TICKS_PER_QUARTER
+                        for note in notes:
+                            note.duration = note_duration
+                        measure.beats.append(
+                            Beat(
+                                start_time=int(beat_start),
+                                duration=ticks,
+                                notes=notes,
+                                text=text,
+                                voice=voice,
+                            )
+                        )
+                if voice_count == 2 and self.pos < len(self.buf):
+                    self._skip(1)  # line break
+                track.ir.measures.append(measure)
+            start += numerator * (WHOLE_TIME // denominator)
+            elapsed += measure_seconds(numerator, denominator, tempo)
+
+    def _read_voice(self, start, track: _TrackState, voice: int, last_frets) -> list:
+        # Each beat is [start, duration, text, notes, status]
+        beats = []
+        for _ in range(self._i32()):
+            start += self._read_beat(start, track, voice, beats, last_frets)
+        return beats
+
+    def _read_beat(
+        self, start, track: _TrackState, voice: int, beats: list, last_frets
+    ):
+        flags = self._u8()
+        # Beats sharing a start (after an empty beat) are merged
+        if beats and beats[-1][0] == start:
+            beat = beats[-1]
+        else:
+            beat = [start, TICKS_PER_QUARTER, None, [], STATUS_EMPTY]
+            beats.append(beat)
+
+        status = self._u8() if flags & 0x40 else STATUS_NORMAL
+        beat[4] = status
+        duration = self._read_duration(flags)
+
+        harmonic = False
+        if flags & 0x02:
+            self._read_chord()
+        if flags & 0x04:
+            beat[2] = self._int_byte_size_string()
+        if flags & 0x08:
+            harmonic = self._read_beat_effects()
+        if flags & 0x10:
+            self._read_mix_table_change()
+
+        string_flags = self._u8()
+        notes = beat[3]
+        for string in range(1, len(track.strings) + 1):
+            if string_flags & (1 << (7 - string)):
+                notes.append(
+                    self._read_note(track, voice, string, status, harmonic, last_frets)
+                )
+        beat[1] = duration
+
+        if self.major == 5:
+            flags2 = self._i16()
+            if flags2 & 0x800:
+                self._skip(1)  # break secondary beams
+
+        return duration if status != STATUS_EMPTY else 0
+
+    def _read_duration(self, flags: int):
+        time = WHOLE_TIME // (1 << (self._i8() + 2))
+        if flags & 0x01:
+            time += time // 2
+        if flags & 0x20:
+            tuplet = TUPLETS.get(self._i32())
+            if tuplet:
+                enters, times = tuplet
+                time = Fraction(time * times, enters)
+                if time.denominator == 1:
+                    time = time.numerator
+        return time
+
+    def _read_chord(self):
+        if not self._u8():
+            # Old format: name, first fret, 6 frets if displayed
+            self._int_byte_size_string()
+            if self._i32():
+                self._skip(24)
+        elif self.major == 3:
+            self._skip(124)
+        else:
+            self._skip(106)
+
+    def _read_beat_effects(self) -> bool:
+        """Skips beat effects, returns whether notes get a harmonic."""
+        if self.major == 3:
+            flags1 = self._u8()
+            if flags1 & 0x20:
+                self._skip(5)  # slap effect, tremolo bar value
+            if flags1 & 0x40:
+                self._skip(2)  # stroke
+            # GP3 stores harmonics per beat
+            return bool(flags1 & 0x0C)
+
+        flags1 = self._u8()
+        flags2 = self._u8()
+        if flags1 & 0x20:
+            self._skip(1)  # slap effect
+        if flags2 & 0x04:
+            self._read_bend()  # tremolo bar
+        if flags1 & 0x40:
+            self._skip(2)  # stroke
+        if flags2 & 0x02:
+            self._skip(1)  # pick stroke
+        return False
+
+    def _read_mix_table_change(self):
+        if self.major < 5:
+            values = _MIX_TABLE.unpack_from(self.buf, self.pos)
+            self.pos += _MIX_TABLE.size
+            # One duration byte per changed value, except the instrument
+            self._skip(sum(1 for v in values[1:] if v >= 0))
+            if self.major == 4:
+                self._skip(1)  # all tracks flags
+            return
+
+        version = self.version_tuple
+        self._skip(1)  # instrument
+        self._skip(12 + (3 if version == (5, 0, 0) else 4))  # RSE instrument
+        if version == (5, 0, 0):
+            self._skip(1)
+        changed = sum(1 for _ in range(6) if self._i8() >= 0)
+        self._int_byte_size_string()  # tempo name
+        tempo = self._i32()
+        self._skip(changed)
+        if tempo >= 0:
+            self._skip(2 if version > (5, 0, 0) else 1)
+        self._skip(2)  # all tracks flags, wah
+        if version > (5, 0, 0):
+            self._int_byte_size_string()
+            self._int_byte_size_string()
+
+    # Notes
+    # =====
+
+    def _read_note(
+        self,
+        track: _TrackState,
+        voice: int,
+        string: int,
+        status: int,
+        harmonic: bool,
+        last_frets,
+    ) -> Note:
+        flags = self._u8()
+        note_type = 0  # rest
+        velocity = DEFAULT_VELOCITY
+        value = 0
+        duration_percent = 1.0
+
+        if flags & 0x20:
+            note_type = self._u8()
+        if self.major < 5 and flags & 0x01:
+            self._skip(2)  # independent duration, tuplet
+        if flags & 0x10:
+            velocity = unpack_velocity(self._i8())
+        if flags & 0x20:
+            fret = self._i8()
+            key = (track.index, voice, string)
+            value = last_frets.get(key, -1) if note_type == 2 else fret
+            if self.major == 5:
+                value = value if 0 <= value < 100 else 0
+            else:
+                value = min(max(value, 0), 99)
+        if flags & 0x80:
+            self._skip(2)  # fingering
+        if self.major == 5:
+            if flags & 0x01:
+                duration_percent = self._f64()
+            self._skip(1)  # accidental flags
+
+        effects = []
+        if flags & 0x08:
+            effects, harmonic = self._read_note_effects(harmonic)
+
+        if status != STATUS_EMPTY:
+            last_frets[(track.index, voice, string)] = value
+
+        if harmonic:
+            effects.append(NoteEffect(type=EffectType.HARMONIC))
+
+        return Note(
+            string=string,
+            fret=value,
+            velocity=velocity,
+            duration=1.0,
+            type=NOTE_TYPES.get(note_type, NoteType.NORMAL),
+            effects=effects,
+            duration_percent=duration_percent,
+            midi_number=value + track.strings[string - 1],
+        )
+
+    def _read_note_effects(self, harmonic: bool) -> Tuple[List[NoteEffect], bool]:
+        bend_points = None
+        if self.major == 3:
+            flags = self._u8()
+            if flags & 0x01:
+                bend_points = self._read_bend()
+            if flags & 0x10:
+                self._skip(4)  # grace note
+            # Slides (0x04) carry no payload in GP3, they are shift slides
+            effects = []
+            if bend_points:
+                effects.append(
+                    NoteEffect(type=EffectType.BEND, bend_points=bend_points)
+                )
+            slides = SLIDE_SHIFT if flags & 0x04 else 0
+            effects += articulation_effects(
+                bool(flags & 0x02), slides, None, False, False
+            )
+            return effects, harmonic
+
+        gp5 = self.major == 5
+        flags1 = self._u8()
+        flags2 = self._u8()
+        slides = 0
+        trill_fret = None
+        if flags1 & 0x01:
+            bend_points = self._read_bend()
+        if flags1 & 0x10:
+            self._skip(5 if gp5 else 4)  # grace note
+        if flags2 & 0x04:
+            self._skip(1)  # tremolo picking
+        if flags2 & 0x08:
+            slides = self._u8() if gp5 else GP4_SLIDES.get(self._i8(), 0)
+        if flags2 & 0x10:
+            harmonic = True
+            harmonic_type = self._i8()
+            if gp5 and harmonic_type == 2:
+                self._skip(3)  # artificial: semitone, accidental, octave
+            elif gp5 and harmonic_type == 3:
+                self._skip(1)  # tapped: fret
+        if flags2 & 0x20:
+            trill_fret = self._i8()
+            self._skip(1)  # trill period
+        effects = []
+        if bend_points:
+            effects.append(NoteEffect(type=EffectType.BEND, bend_points=bend_points))
+        effects += articulation_effects(
+            bool(flags1 & 0x02),
+            slides,
+            trill_fret,
+            bool(flags2 & 0x40),
+            bool(flags2 & 0x02),
+        )
+        return effects, harmonic
+
+    def _read_bend(self) -> Optional[List[BendPoint]]:
+        self._skip(5)  # type, value
+        count = self._i32()
+        points = []
+        for _ in range(count):
+            position, value, _ = _BEND_POINT.unpack_from(self.buf, self.pos)
+            self.pos += _BEND_POINT.size
+            # Same rounding as PyGuitarPro: raw position 0-60, 25 per quarter tone
+            point = bend_point_to_ir(round(position * 12 / 60), round(value / 25))
+            points.append(point)
+        return points or None
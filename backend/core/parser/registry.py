@@ -0,0 +1,99 @@
+"""
+Picks the parser for an upload.
+
+The format is sniffed from the first bytes of the file, extensions are only
+a fallback: users rename files, and a .gp can be a GP7 zip as well as a
+GP3-5 file saved with the wrong extension. Parser modules (and through
+them PyGuitarPro) are imported the first time a file needs them, see
+backend.core.imports.
+"""
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from backend.core.imports import timed_import
+from backend.core.parser.gp_parser import GPParser
+
+BINARY_EXTENSIONS = (".gp3", ".gp4", ".gp5")
+XML_EXTENSIONS = (".gpx", ".gp")
+
+ZIP_MAGIC = b"PK\x03\x04"
+GPX_MAGICS = (b"BCFZ", b"BCFS")
+# GP3-5 files start with a length byte then a 30 byte version string
+# ("FICHIER GUITAR PRO v5.00"), clipboard exports use "CLIPBOARD GUITAR PRO"
+# in GP4 and "CLIPBOARD GP 5.x" in GP5
+BINARY_HEADERS = (b"FICHIER GUITAR PRO", b"CLIPBOARD GUITAR PRO", b"CLIPBOARD GP ")
+
+# Format names returned by sniff_format()
+ZIP = "zip"
+GPX = "gpx"
+BINARY = "binary"
+
+
+class ParserSpec(NamedTuple):
+    module: str
+    class_name: str
+    extensions: Tuple[str, ...]
+
+
+PARSERS: Dict[str, ParserSpec] = {
+    "xml": ParserSpec(
+        "backend.core.parser.xml_parser", "XmlParser", XML_EXTENSIONS
+    ),
+    "binary": ParserSpec(
+        "backend.core.parser.binary_parser", "BinaryParser", BINARY_EXTENSIONS
+    ),
+}
+
+FORMAT_PARSERS = {
+    ZIP: "xml",
+    GPX: "xml",
+    BINARY: "binary",
+}
+
+
+def sniff_format(content) -> Optional[str]:
+    """Recognizes the container from the magic bytes, None if unknown."""
+    head = bytes(content[:32])
+    if head.startswith(ZIP_MAGIC):
+        return ZIP
+    if head[:4] in GPX_MAGICS:
+        return GPX
+    if head and head[1:].startswith(BINARY_HEADERS):
+        return BINARY
+    return None
+
+
+@lru_cache(maxsize=None)
+def load_parser(name: str) -> GPParser:
+    """
+    The instance of one of PARSERS, importing its module on first use.
+    Parsers keep per-parse state out of the instance, one serves every
+    request concurrently.
+    """
+    spec = PARSERS[name]
+    module = timed_import(spec.module)
+    return getattr(module, spec.class_name)()
+
+
+def parser_for_filename(filename: str) -> Optional[GPParser]:
+    """Pick a parser from the file extension, None if the format is unknown."""
+    filename = filename.lower()
+    for name, spec in PARSERS.items():
+        if filename.endswith(spec.extensions):
+            return load_parser(name)
+    return None
+
+
+def parser_for_content(content, filename: Optional[str] = None) -> Optional[GPParser]:
+    """
+    Pick a parser from the magic bytes of `content`. When they aren't
+    recognized the extension of `filename` decides, so a damaged file still
+    gets a parse error instead of "unsupported format". None if neither
+    tells.
+    """
+    fmt = sniff_format(content)
+    if fmt is not None:
+        return load_parser(FORMAT_PARSERS[fmt])
+    if filename:
+        return parser_for_filename(filename)
+    return None
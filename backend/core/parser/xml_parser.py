@@ -1,8 +1,22 @@
+"""
+Parser for Guitar Pro 6-8 files (score.gpif in a .gp zip or a .gpx container).
+
+XmlParser itself holds no state: each parse gets a ParseContext with what
+belongs to that file (id map, rhythms, cancel token, budget), so a single
+instance can serve concurrent parses from a thread pool. What doesn't
+depend on the file is built once and shared: GpifTags, the qualified tag
+names of a namespace (one per namespace, cached), and the tables below.
+"""
 import io
 import xml.etree.ElementTree as ET
 import zipfile
-from backend.core.parser.gp_parser import GPParser
-from typing import Dict
+from functools import lru_cache
+from backend.core.budget import ParseBudget
+from backend.core.cancellation import CancelToken, check
+from backend.core.parser.gp_parser import GPParser, TICKS_PER_QUARTER
+from backend.core.parser.gpx_container import ChunkReader, GpxContainer, is_gpx
+from backend.core.parser.gpif_stream import load_preview_root, split_ns
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from backend.models.song_model import (
     Beat,
@@ -14,8 +28,68 @@ from backend.models.song_model import (
     BendPoint,
     EffectType,
     NoteEffect,
+    VIBRATO_SLIGHT,
+    VIBRATO_WIDE,
 )
 
+# Quarter notes per Rhythm/NoteValue
+RHYTHM_QUARTERS = {
+    "Whole": 4.0, "Half": 2.0, "Quarter": 1.0, "Eighth": 0.5,
+    "16th": 0.25, "32nd": 0.125, "64th": 0.0625, "128th": 0.03125,
+}
+
+# Note property -> children holding its value, first one set wins
+PROPERTY_VALUE_TAGS = {
+    "Fret": ("Number", "Int", "Fret"),
+    "String": ("Number", "Int", "String"),
+    "Velocity": ("Number", "Int"),
+    "Midi": ("Number", "Int"),
+    "Slide": ("Flags",),
+}
+
+# Tags looked up while parsing, qualified once per namespace by GpifTags
+TAGS = (
+    "Title", "Artist", "MasterTrack", "Automations", "Automation", "Type", "Value",
+    "Tracks", "Name", "Sounds", "Sound", "MIDI", "Program", "Bank", "InstrumentSet",
+    "Properties", "Property", "Pitches", "MasterBar", "Time", "Bars", "Voices",
+    "Beats", "Notes", "Rhythm", "Rhythms", "NoteValue", "AugmentationDot", "Tie",
+    "Point", "Position", "Trill", "Vibrato",
+)
+
+
+class GpifTags:
+    """Qualified tag names (and paths) for one namespace, see gpif_tags()."""
+
+    def __init__(self, ns: str):
+        self.ns = ns
+        for tag in TAGS:
+            setattr(self, tag, f"{ns}{tag}")
+        self.all_master_bars = f".//{ns}MasterBar"
+        self.all_rhythms = f".//{ns}Rhythms"
+        self.all_points = f".//{ns}Point"
+        self.property_values = {
+            name: tuple(f"{ns}{tag}" for tag in tags)
+            for name, tags in PROPERTY_VALUE_TAGS.items()
+        }
+
+
+@lru_cache(maxsize=None)
+def gpif_tags(ns: str) -> GpifTags:
+    # Files use one or two namespaces, the cache stays tiny
+    return GpifTags(ns)
+
+
+def property_int(prop_elem: ET.Element, value_tags: Tuple[str, ...]) -> int:
+    """The first parseable value among `value_tags` children, 0 if none."""
+    for tag in value_tags:
+        v = prop_elem.findtext(tag)
+        if v:
+            try:
+                return int(float(v))
+            except ValueError:
+                pass
+    return 0
+
 
 class XmlParser(GPParser):
     def parse_file(self, file_path: str) -> Song:
@@ -23,27 +97,114 @@ class XmlParser(GPParser):
             content = f.read()
         return self.parse_bytes(content)
 
-    def parse_bytes(self, file_content: bytes) -> Song:
-        with zipfile.ZipFile(io.BytesIO(file_content)) as z:
-            filenames = z.namelist()
-            score_file = None
-            if "score.gpif" in filenames:
-                score_file = "score.gpif"
-            elif "Content/score.gpif" in filenames:
-                score_file = "Content/score.gpif"
+    def parse_bytes(
+        self,
+        file_content: bytes,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
+        budget = budget or ParseBudget()
+        root = self._load_root(file_content, budget)
+        return ParseContext(cancel, budget).parse(root)
+
+    def parse_preview_bytes(
+        self,
+        file_content: bytes,
+        seconds: float,
+        track_numbers: Optional[Iterable[int]] = None,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Song:
+        budget = budget or ParseBudget()
+        # Track.number is the 1-based position in MasterTrack/Tracks
+        indices = [n - 1 for n in track_numbers] if track_numbers else None
+        if is_gpx(file_content):
+            reader = ChunkReader(self._gpx_score_chunks(file_content, budget))
+            root = load_preview_root(reader, seconds, indices, budget)
+        else:
+            with zipfile.ZipFile(io.BytesIO(file_content)) as z:
+                score_file = self._find_score_file(z)
+                budget.check_declared_size(z.getinfo(score_file).file_size)
+                with z.open(score_file) as f:
+                    root = load_preview_root(f, seconds, indices, budget)
+
+        song = ParseContext(cancel, budget).parse(root)
+        if track_numbers:
+            wanted = set(track_numbers)
+            song.tracks = [t for t in song.tracks if t.number in wanted]
+        return song
+
+    def iter_tracks(
+        self,
+        file_content: bytes,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ) -> Tuple[Song, Iterator[Track]]:
+        budget = budget or ParseBudget()
+        root = self._load_root(file_content, budget)
+        context = ParseContext(cancel, budget)
+        song, track_ids = context.parse_header(root)
+        return song, context.iter_track_structures(root, song, track_ids)
+
+    def _gpx_score_chunks(self, file_content: bytes, budget: ParseBudget):
+        # The whole BCFS image is bounded by the decompressed budget
+        container = GpxContainer(
+            file_content, max_size=budget.max_decompressed_bytes
+        )
+        return container.chunks("score.gpif")
 
-            if not score_file:
-                raise ValueError("Invalid GPX/GP file: score.gpif not found")
+    def _find_score_file(self, z: zipfile.ZipFile) -> str:
+        filenames = z.namelist()
+        if "score.gpif" in filenames:
+            return "score.gpif"
+        if "Content/score.gpif" in filenames:
+            return "Content/score.gpif"
+        raise ValueError("Invalid GPX/GP file: score.gpif not found")
 
+    def _load_root(self, file_content: bytes, budget: ParseBudget) -> ET.Element:
+        if is_gpx(file_content):
+            # GP6: the score is fed to expat straight from the sectors
+            return budget.feed_xml(self._gpx_score_chunks(file_content, budget))
+
+        with zipfile.ZipFile(io.BytesIO(file_content)) as z:
+            score_file = self._find_score_file(z)
+            budget.check_declared_size(z.getinfo(score_file).file_size)
             with z.open(score_file) as f:
-                tree = ET.parse(f)
-                root = tree.getroot()
-                return self._parse_xml(root)
+                return budget.parse_xml(f)
+
+
+class ParseContext:
+    """Everything one parse of score.gpif needs, never shared between parses."""
+
+    def __init__(
+        self,
+        cancel: Optional[CancelToken] = None,
+        budget: Optional[ParseBudget] = None,
+    ):
+        self.cancel = cancel
+        self.budget = budget
+        self.tags: GpifTags = gpif_tags("")
+        # Local tag -> id -> element
+        self.id_map: Dict[str, Dict[str, ET.Element]] = {}
+        # Rhythm id -> quarter notes
+        self.rhythm_map: Dict[str, float] = {}
+        # GPIF track id -> Track
+        self.tracks_by_id: Dict[int, Track] = {}
+
+    def parse(self, root: ET.Element) -> Song:
+        song, track_ids = self.parse_header(root)
 
-    def _parse_xml(self, root: ET.Element) -> Song:
+        # Parse Structure (MasterBars -> Measures -> Notes)
+        for _ in self.iter_track_structures(root, song, track_ids):
+            pass
+
+        return song
+
+    def parse_header(self, root: ET.Element) -> Tuple[Song, list]:
+        # Everything but the measures: the song with its (empty) tracks
+        check(self.cancel)
         # Check Namespace
-        ns_match = root.tag.split("}")
-        self.ns = ns_match[0] + "}" if len(ns_match) > 1 else ""
+        self.tags = gpif_tags(split_ns(root.tag))
 
         # Build Typed ID map
         self._build_id_map(root)
@@ -52,15 +213,11 @@ class XmlParser(GPParser):
         self._parse_metadata(root, song)
         self._parse_rhythms(root) # Update internal map
         self._parse_tempo(root, song)
-        
+
         # Parse Tracks
         track_ids = self._get_track_refs(root)
         self._parse_tracks(song, track_ids)
-
-        # Parse Structure (MasterBars -> Measures -> Notes)
-        self._parse_structure(root, song, track_ids)
-
-        return song
+        return song, track_ids
 
     def _build_id_map(self, root: ET.Element):
         self.id_map = {}
@@ -75,32 +232,25 @@ class XmlParser(GPParser):
     def _get_elem(self, tag_suffix, eid):
         return self.id_map.get(tag_suffix, {}).get(str(eid))
 
-    def _ft(self, elem, tag):
-        return elem.findtext(f"{self.ns}{tag}")
-
     def _get_ref_list(self, elem, tag):
-        txt = self._ft(elem, tag)
+        # `tag` is qualified, e.g. self.tags.Bars
+        txt = elem.findtext(tag)
         return txt.split() if txt else []
 
-    def _find_child(self, parent, tag):
-        return parent.find(f"{self.ns}{tag}")
-
-    def _findall_child(self, parent, tag):
-        return parent.findall(f"{self.ns}{tag}")
-
     def _parse_metadata(self, root, song: Song):
-        song.title = self._ft(root, "Title") or "Untitled"
-        song.artist = self._ft(root, "Artist") or "Unknown"
+        song.title = root.findtext(self.tags.Title) or "Untitled"
+        song.artist = root.findtext(self.tags.Artist) or "Unknown"
 
     def _parse_tempo(self, root, song: Song):
-        master_track = self._find_child(root, "MasterTrack")
+        t = self.tags
+        master_track = root.find(t.MasterTrack)
         if master_track:
-            automations = self._find_child(master_track, "Automations")
+            automations = master_track.find(t.Automations)
             if automations:
-                for auto in self._findall_child(automations, "Automation"):
-                    type_elem = self._find_child(auto, "Type")
+                for auto in automations.findall(t.Automation):
+                    type_elem = auto.find(t.Type)
                     if type_elem is not None and type_elem.text == "Tempo":
-                        val_str = self._ft(auto, "Value")
+                        val_str = auto.findtext(t.Value)
                         if val_str:
                             try:
                                 song.tempo = int(val_str.split()[0])
@@ -108,33 +258,35 @@ class XmlParser(GPParser):
                                 pass
 
     def _get_track_refs(self, root):
-        master_track = self._find_child(root, "MasterTrack")
+        master_track = root.find(self.tags.MasterTrack)
         if master_track:
-            return [int(tid) for tid in self._get_ref_list(master_track, "Tracks")]
+            track_ids = self._get_ref_list(master_track, self.tags.Tracks)
+            return [int(tid) for tid in track_ids]
         return []
 
     def _parse_tracks(self, song: Song, track_ids: list):
-         for i, tid in enumerate(track_ids):
+        t = self.tags
+        for i, tid in enumerate(track_ids):
             track_elem = self._get_elem("Track", tid)
             if not track_elem:
                 continue
 
-            name = self._ft(track_elem, "Name") or f"Track {i + 1}"
+            name = track_elem.findtext(t.Name) or f"Track {i + 1}"
             program = 0
             is_percussion = False
 
             # Sounds / Program
-            sounds = self._find_child(track_elem, "Sounds")
+            sounds = track_elem.find(t.Sounds)
             if sounds:
-                sound = self._find_child(sounds, "Sound")
+                sound = sounds.find(t.Sound)
                 if sound:
-                    midi_node = self._find_child(sound, "MIDI")
+                    midi_node = sound.find(t.MIDI)
                     if midi_node:
-                        p_str = self._ft(midi_node, "Program")
+                        p_str = midi_node.findtext(t.Program)
                         if p_str:
                             program = int(p_str)
                         # Bank Parsing
-                        bank_node = self._find_child(midi_node, "Bank")
+                        bank_node = midi_node.find(t.Bank)
                         if bank_node is not None:
                             # GP often stores bank as a single string "General MIDI" or a number.
                             # We might need to look for specific Children like "MSB", "LSB" or just "Number"
@@ -143,17 +295,17 @@ class XmlParser(GPParser):
                             pass # Placeholder, usually GPX uses 'Primary' or 'Secondary' attributes
 
 
-            inst_set = self._find_child(track_elem, "InstrumentSet")
-            if inst_set and self._ft(inst_set, "Type") == "drumKit":
+            inst_set = track_elem.find(t.InstrumentSet)
+            if inst_set and inst_set.findtext(t.Type) == "drumKit":
                 is_percussion = True
 
             # Tuning
             tuning = []
-            properties = self._find_child(track_elem, "Properties")
+            properties = track_elem.find(t.Properties)
             if properties:
-                for p in self._findall_child(properties, "Property"):
+                for p in properties.findall(t.Property):
                     if p.get("name") == "Tuning":
-                        pitches_str = self._ft(p, "Pitches")
+                        pitches_str = p.findtext(t.Pitches)
                         if pitches_str:
                             tuning = [int(x) for x in pitches_str.split()]
                         break
@@ -166,59 +318,63 @@ class XmlParser(GPParser):
                 channel=9 if is_percussion else (i % 16),
                 tuning=tuning,
             )
-            # Store track reference by ID in a temporary map if needed, 
-            # but we can just use song.tracks and index match since track_ids are ordered.
             song.tracks.append(track)
-            
-            # We also need a way to lookup track by ID during stricture parsing.
-            # Let's attach the ID to the track object temporarily or use a helper map.
-            track._gp_id = tid
-
-    def _parse_structure(self, root, song: Song, track_ids: list):
-        # Create a map for quick track lookup
-        tracks_by_id = {t._gp_id: t for t in song.tracks if hasattr(t, "_gp_id")}
-        track_cursors = {tid: 0 for tid in track_ids}
-        TICKS_PER_QUARTER = 960
-
-        master_bars = root.findall(f".//{self.ns}MasterBar")
-        
-        for mb_idx, mb in enumerate(master_bars):
-            ts_str = self._ft(mb, "Time") or "4/4"
+            # The structure pass looks tracks up by their GPIF id
+            self.tracks_by_id[tid] = track
+
+    def iter_track_structures(
+        self, root, song: Song, track_ids: list
+    ) -> Iterator[Track]:
+        # Fills the measures of one track after the other and yields each
+        # one once it is complete, so a writer can start on it while the
+        # next one is parsed
+        t = self.tags
+
+        # (time signature, measure length, bar per track) of each MasterBar
+        master_bars = []
+        for mb in root.findall(t.all_master_bars):
+            ts_str = mb.findtext(t.Time) or "4/4"
             num, den = map(int, ts_str.split("/"))
             measure_length_ticks = int(num * TICKS_PER_QUARTER * 4 / den)
-            
-            bar_ids_str = self._get_ref_list(mb, "Bars")
-
-            for tr_idx, bar_id_str in enumerate(bar_ids_str):
-                if tr_idx >= len(track_ids):
-                    break
-                track_id = track_ids[tr_idx]
-                track = tracks_by_id.get(track_id)
-                if not track:
-                    continue
+            bar_ids = self._get_ref_list(mb, t.Bars)
+            master_bars.append((num, den, measure_length_ticks, bar_ids))
 
-                cursor = track_cursors[track_id]
+        for tr_idx, track_id in enumerate(track_ids):
+            track = self.tracks_by_id.get(track_id)
+            if not track:
+                continue
+            cursor = 0
+            for mb_idx, master_bar in enumerate(master_bars):
+                num, den, measure_length_ticks, bar_ids_str = master_bar
+                check(self.cancel)
+                if tr_idx >= len(bar_ids_str):
+                    continue
                 measure = Measure(number=mb_idx + 1, numerator=num, denominator=den)
                 track.measures.append(measure)
 
+                bar_id_str = bar_ids_str[tr_idx]
                 if bar_id_str:
-                    self._parse_bar_content(bar_id_str, measure, cursor)
+                    self._parse_bar_content(bar_id_str, measure, cursor, track.tuning)
 
-                track_cursors[track_id] += measure_length_ticks
+                cursor += measure_length_ticks
+            yield track
 
-    def _parse_bar_content(self, bar_id_str, measure: Measure, cursor: int):
+    def _parse_bar_content(
+        self, bar_id_str, measure: Measure, cursor: int, tuning: List[int]
+    ):
+        t = self.tags
         bar_elem = self._get_elem("Bar", bar_id_str)
         if not bar_elem:
             return
 
-        voice_ids = self._get_ref_list(bar_elem, "Voices")
-        for vid in voice_ids:
+        voice_ids = self._get_ref_list(bar_elem, t.Voices)
+        for voice_index, vid in enumerate(voice_ids):
             voice_elem = self._get_elem("Voice", vid)
             if not voice_elem:
                 continue
 
             voice_cursor = cursor
-            beat_ids = self._get_ref_list(voice_elem, "Beats")
+            beat_ids = self._get_ref_list(voice_elem, t.Beats)
 
             for bid in beat_ids:
                 beat_elem = self._get_elem("Beat", bid)
@@ -226,40 +382,41 @@ class XmlParser(GPParser):
                     continue
 
                 duration_ticks = self._get_beat_duration(beat_elem)
-                beat_obj = Beat(start_time=voice_cursor, duration=duration_ticks)
-
-                note_ids = self._get_ref_list(beat_elem, "Notes")
+                beat_obj = Beat(
+                    start_time=voice_cursor, duration=duration_ticks, voice=voice_index
+                )
+
+                note_ids = self._get_ref_list(beat_elem, t.Notes)
+                # References can repeat, charge what is actually built
+                if self.budget:
+                    self.budget.charge_notes(1 + len(note_ids))
                 for nid in note_ids:
                     note_elem = self._get_elem("Note", nid)
                     if note_elem:
-                        self._parse_note(note_elem, beat_obj)
+                        self._parse_note(note_elem, beat_obj, tuning)
 
                 measure.beats.append(beat_obj)
                 voice_cursor += duration_ticks
 
     def _get_beat_duration(self, beat_elem):
-        duration_ticks = 960
-        rhythm_ref = self._find_child(beat_elem, "Rhythm")
+        duration_ticks = TICKS_PER_QUARTER
+        rhythm_ref = beat_elem.find(self.tags.Rhythm)
         if rhythm_ref is not None:
             rid = rhythm_ref.get("ref")
             if rid in self.rhythm_map:
-                duration_ticks = int(960 * self.rhythm_map[rid])
+                duration_ticks = int(TICKS_PER_QUARTER * self.rhythm_map[rid])
         return duration_ticks
 
     def _parse_rhythms(self, root):
-        # ... logic as before but store in self.rhythm_map
+        t = self.tags
         mapping = {}
-        base_values = {
-            "Whole": 4.0, "Half": 2.0, "Quarter": 1.0, "Eighth": 0.5,
-            "16th": 0.25, "32nd": 0.125, "64th": 0.0625, "128th": 0.03125,
-        }
-        rhythms_node = root.find(f".//{self.ns}Rhythms")
+        rhythms_node = root.find(t.all_rhythms)
         if rhythms_node is not None:
-            for r in rhythms_node.findall(f"{self.ns}Rhythm"):
+            for r in rhythms_node.findall(t.Rhythm):
                 rid = r.get("id")
-                note_value_str = r.findtext(f"{self.ns}NoteValue")
-                val = base_values.get(note_value_str, 1.0)
-                dots = r.find(f"{self.ns}AugmentationDot")
+                note_value_str = r.findtext(t.NoteValue)
+                val = RHYTHM_QUARTERS.get(note_value_str, 1.0)
+                dots = r.find(t.AugmentationDot)
                 if dots is not None:
                     count = int(dots.get("count", 1))
                     val *= 2.0 - (1.0 / (2**count))
@@ -267,12 +424,13 @@ class XmlParser(GPParser):
         self.rhythm_map = mapping
         return mapping
 
-    def _parse_note(self, note_elem: ET.Element, beat: Beat):
-         # ... reuse existing logic but adapted ...
-        props_node = note_elem.find(f"{self.ns}Properties")
+    def _parse_note(self, note_elem: ET.Element, beat: Beat, tuning: List[int]):
+        t = self.tags
+        values = t.property_values
+        props_node = note_elem.find(t.Properties)
         props = {}
         if props_node:
-            for p in props_node.findall(f"{self.ns}Property"):
+            for p in props_node.findall(t.Property):
                 props[p.get("name")] = p
 
         fret = 0
@@ -280,40 +438,30 @@ class XmlParser(GPParser):
         velocity = 100
         midi_num = None
 
-        def _val(prop_elem, tags=["Number", "Int", "Fret", "String"]):
-            for t in tags:
-                v = prop_elem.findtext(f"{self.ns}{t}")
-                if v:
-                    try:
-                        return int(float(v))
-                    except ValueError:
-                        pass
-            return 0
-
         if "Fret" in props:
-            fret = _val(props["Fret"], ["Number", "Int", "Fret"])
+            fret = property_int(props["Fret"], values["Fret"])
         if "String" in props:
-            string = _val(props["String"], ["Number", "Int", "String"]) + 1
+            string = property_int(props["String"], values["String"]) + 1
         if "Velocity" in props:
-            velocity = _val(props["Velocity"], ["Number", "Int"])
+            velocity = property_int(props["Velocity"], values["Velocity"])
         if "Midi" in props:
-            midi_num = _val(props["Midi"], ["Number", "Int"])
+            midi_num = property_int(props["Midi"], values["Midi"])
 
-        tie = note_elem.find(f"{self.ns}Tie")
+        tie = note_elem.find(t.Tie)
         is_tie = False
         if tie is not None:
             if tie.get("destination") == "true":
                 is_tie = True
-        
+
         note_type = NoteType.TIE if is_tie else NoteType.NORMAL
-        
+
         # Detect bends (basic)
         effects = []
         if "Bends" in props:
             points_elem = props["Bends"]
             # Usually nested in <Points> or just under the property
             # We'll search recursively for "Point" to be safe
-            bend_points_xml = points_elem.findall(f".//{self.ns}Point")
+            bend_points_xml = points_elem.findall(t.all_points)
             if bend_points_xml:
                 # We have bends
                 bend_effect = NoteEffect(type=EffectType.BEND)
@@ -321,25 +469,54 @@ class XmlParser(GPParser):
                     pos = 0
                     val = 0
                     # Position
-                    pos_node = pt.find(f"{self.ns}Position")
+                    pos_node = pt.find(t.Position)
                     if pos_node is not None:
                         try:
                             pos = int(pos_node.text)
                         except (ValueError, TypeError):
                             pass
-                    
+
                     # Value
-                    val_node = pt.find(f"{self.ns}Value")
+                    val_node = pt.find(t.Value)
                     if val_node is not None:
                         try:
                              val = int(val_node.text)
                         except (ValueError, TypeError):
                             pass
-                    
+
                     bend_effect.bend_points.append(BendPoint(position=pos, value=val))
-                
+
                 effects.append(bend_effect)
-        
+
+        # Articulations, in the order the GP3-5 readers use
+        if "HopoOrigin" in props:
+            effects.append(NoteEffect(type=EffectType.HAMMER))
+        if "Slide" in props:
+            slide_flags = property_int(props["Slide"], values["Slide"])
+            if slide_flags:
+                effects.append(NoteEffect(type=EffectType.SLIDE, value=slide_flags))
+        trill = note_elem.findtext(t.Trill)
+        if trill:
+            # The other note as a MIDI number, the IR keeps its fret: off the
+            # note's own pitch, or without Midi off the string's tuning the
+            # way the writer pitches such notes (0 for untuned strings)
+            if midi_num is not None:
+                open_string = midi_num - fret
+            else:
+                open_string = tuning[string - 1] if 0 < string <= len(tuning) else 0
+            try:
+                effects.append(
+                    NoteEffect(type=EffectType.TRILL, value=int(trill) - open_string)
+                )
+            except ValueError:
+                pass
+        vibrato = note_elem.findtext(t.Vibrato)
+        if vibrato:
+            depth = VIBRATO_WIDE if vibrato == "Wide" else VIBRATO_SLIGHT
+            effects.append(NoteEffect(type=EffectType.VIBRATO, value=depth))
+        if "PalmMuted" in props:
+            effects.append(NoteEffect(type=EffectType.PALM_MUTE))
+
         note = Note(
             string=string,
             fret=fret,
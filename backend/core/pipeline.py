@@ -0,0 +1,117 @@
+"""
+Pipelined parse -> write.
+
+GPParser.iter_tracks() finishes the tracks of a song one after the other.
+convert_pipelined() runs it in a thread at most PIPELINE_DEPTH tracks
+ahead of the writer, which encodes each track as soon as it is complete
+and then lets go of its measures. At most depth + 2 parsed tracks are
+held at once instead of the whole song.
+
+Both stages are Python code: with the GIL they take turns rather than
+run at once, so the end-to-end time only drops to max(parse, write) on
+a free-threaded interpreter. With the GIL the first tracks still come out
+(and report progress) while later ones are parsed.
+"""
+import io
+import os
+import threading
+from queue import Full, Queue
+from typing import Iterable, Iterator, Optional
+
+from backend.core.budget import ParseBudget
+from backend.core.cancellation import CancelToken
+from backend.core.parser.gp_parser import GPParser
+
+# Parsed tracks allowed to wait for the writer
+PIPELINE_DEPTH = int(os.environ.get("GP2MIDI_PIPELINE_DEPTH", "2"))
+_STOP_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+def run_ahead(items: Iterable, depth: int = PIPELINE_DEPTH) -> Iterator:
+    """
+    Iterates `items` in a thread, at most `depth` items ahead of the caller.
+    What `items` raises is raised to the caller; closing the iterator early
+    stops the thread at its next item.
+    """
+    queue: Queue = Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(entry, timeout=_STOP_POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+            return
+        put((_DONE, None))
+
+    thread = threading.Thread(target=produce, name="gp2midi-pipeline", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _released(tracks: Iterable) -> Iterator:
+    # The writer asks for the next track once the previous one is encoded
+    for track in tracks:
+        yield track
+        track.measures = []
+
+
+def convert_pipelined(
+    parser: GPParser,
+    content: bytes,
+    track_numbers: Optional[Iterable[int]] = None,
+    cancel: Optional[CancelToken] = None,
+    budget: Optional[ParseBudget] = None,
+    progress=None,
+    depth: int = PIPELINE_DEPTH,
+    **writer_options,
+) -> bytes:
+    """
+    The MIDI file of `content`, written while it is parsed. Tracks not in
+    `track_numbers` (all if empty) are skipped; `writer_options` go to
+    MidiWriter, interval allocation excepted.
+    """
+    from backend.core.converter.midi_writer import MidiWriter
+
+    budget = budget or ParseBudget()
+    song, tracks = parser.iter_tracks(content, cancel, budget)
+    if track_numbers:
+        wanted = set(track_numbers)
+        song.tracks = [t for t in song.tracks if t.number in wanted]
+        tracks = (t for t in tracks if t.number in wanted)
+
+    buffer = io.BytesIO()
+    stream = run_ahead(tracks, depth)
+    try:
+        MidiWriter(song, **writer_options).write(
+            file=buffer,
+            progress=progress,
+            cancel=cancel,
+            budget=budget,
+            tracks=_released(stream),
+        )
+    finally:
+        stream.close()
+    return buffer.getvalue()
@@ -0,0 +1,352 @@
+"""
+Pages of a track's notes, read from a packed song.
+
+Piano-roll clients want the notes of a few measures at a time, before any
+MIDI exists. song_codec already stores the song as flat columns stitched
+together by cumulative end offsets (measure_beat_end, beat_note_end...),
+which is an index of where each measure's beats and notes start: a page
+of measures is located in O(1) and read in O(page) straight from the
+columns, without rebuilding a Song. Only tick windows need a per-track
+table of measure start ticks, built once per track.
+
+Pages come as columns: one entry per sounding note (rests and dead notes
+are skipped, like the writer does) in start, duration, pitch, velocity,
+string and tie, plus the bend points of those notes stitched with
+bend_end offsets the way the codec does. to_json() and to_bytes() give
+the two wire formats.
+
+NoteIndexCache keeps packed songs of recently analyzed files by content
+hash, bounded in bytes.
+"""
+import bisect
+import json
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from backend.core.storage.song_codec import COLUMNS, NONE_INT, PackedSong, dumps
+from backend.models.song_model import EffectType, NoteType, Song
+
+CACHE_BYTES = int(os.environ.get("GP2MIDI_NOTE_CACHE_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_PAGE_MEASURES = 32
+MAX_PAGE_MEASURES = 256
+TICKS_PER_QUARTER = 960
+
+# Per note, in wire order
+NOTE_COLUMNS = ("start", "duration", "pitch", "velocity", "string", "tie")
+# Per bend point, bend_end (per note) stitches them to their note
+BEND_COLUMNS = ("position", "value")
+
+MAGIC = b"GP2N"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sHHI")
+
+_NATIVE_LITTLE = sys.byteorder == "little"
+
+# Packed bytes per measure, beat, note and effect, from the codec's columns
+_ROW_BYTES = {
+    row: sum(
+        array(code).itemsize
+        for name, code in COLUMNS.items()
+        if name.startswith(row + "_")
+    )
+    for row in ("measure", "beat", "note", "effect")
+}
+
+
+class NotePage(NamedTuple):
+    track: int
+    # 0-based measure indices, end exclusive
+    first_measure: int
+    end_measure: int
+    total_measures: int
+    # Tick window the notes were filtered on, None for whole measures
+    start_tick: Optional[int]
+    end_tick: Optional[int]
+    notes: Dict[str, array]
+    bend_end: array
+    bends: Dict[str, array]
+
+    @property
+    def next_measure(self) -> Optional[int]:
+        return self.end_measure if self.end_measure < self.total_measures else None
+
+    def _meta(self) -> dict:
+        return {
+            "track": self.track,
+            "first_measure": self.first_measure,
+            "end_measure": self.end_measure,
+            "next_measure": self.next_measure,
+            "total_measures": self.total_measures,
+            "start_tick": self.start_tick,
+            "end_tick": self.end_tick,
+            "note_count": len(self.bend_end),
+            "bend_count": len(self.bends["position"]),
+        }
+
+    def to_json(self) -> dict:
+        meta = self._meta()
+        meta["notes"] = {name: column.tolist() for name, column in self.notes.items()}
+        meta["bend_end"] = self.bend_end.tolist()
+        meta["bends"] = {name: column.tolist() for name, column in self.bends.items()}
+        return meta
+
+    def to_bytes(self) -> bytes:
+        """
+        Same preamble as song_codec: magic "GP2N", version (u16), reserved
+        (u16), header length (u32), then the JSON page header padded to 4
+        bytes and little-endian int32 columns: NOTE_COLUMNS, bend_end, then
+        BEND_COLUMNS.
+        """
+        meta = self._meta()
+        meta["columns"] = list(NOTE_COLUMNS) + ["bend_end"] + list(BEND_COLUMNS)
+        header = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        header += b" " * (-(_PREAMBLE.size + len(header)) % 4)
+        columns = [self.notes[name] for name in NOTE_COLUMNS]
+        columns += [self.bend_end] + [self.bends[name] for name in BEND_COLUMNS]
+        if not _NATIVE_LITTLE:
+            columns = [array("i", column) for column in columns]
+            for column in columns:
+                column.byteswap()
+        return b"".join(
+            [_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header)), header]
+            + [column.tobytes() for column in columns]
+        )
+
+
+class NoteIndex:
+    """Note pages of a packed song, the caller keeps it open while paging."""
+
+    def __init__(self, packed: PackedSong, nbytes: int = 0):
+        self.packed = packed
+        # Size of the packed song, what a cache holding it pays
+        self.nbytes = nbytes
+        header = packed.header
+        self._skipped = {
+            i for i, value in enumerate(header["note_types"])
+            if value in (NoteType.REST.value, NoteType.DEAD.value)
+        }
+        self._tie = header["note_types"].index(NoteType.TIE.value)
+        self._bend = header["effect_types"].index(EffectType.BEND.value)
+        # Track number -> (track metadata, index of its first measure)
+        self.tracks = {}
+        offset = 0
+        for meta in header["tracks"]:
+            self.tracks[meta["number"]] = (meta, offset)
+            offset += meta["measures"]
+        self._measure_ticks: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_song(cls, song: Song) -> "NoteIndex":
+        data = dumps(song)
+        return cls(PackedSong(data), len(data))
+
+    @classmethod
+    def open(cls, path: str) -> "NoteIndex":
+        return cls(PackedSong.open(path), os.path.getsize(path))
+
+    def close(self):
+        self.packed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def measure_count(self, track_number: int) -> int:
+        return self.tracks[track_number][0]["measures"]
+
+    def measure_ticks(self, track_number: int) -> List[int]:
+        """Start tick of each measure of the track, then its end."""
+        with self._lock:
+            ticks = self._measure_ticks.get(track_number)
+            if ticks is None:
+                ticks = self._build_ticks(track_number)
+                self._measure_ticks[track_number] = ticks
+            return ticks
+
+    def _build_ticks(self, track_number: int) -> List[int]:
+        # Measure lengths from the time signatures, anchored on the first
+        # beat: the binary parser starts songs at 960, the XML one at 0
+        meta, first = self.tracks[track_number]
+        c = self.packed.columns
+        ticks = [0]
+        anchor = None
+        for m in range(first, first + meta["measures"]):
+            if anchor is None:
+                beat_begin = c["measure_beat_end"][m - 1] if m else 0
+                if beat_begin < c["measure_beat_end"][m]:
+                    anchor = c["beat_start"][beat_begin] - ticks[-1]
+            numerator = c["measure_numerator"][m]
+            denominator = c["measure_denominator"][m]
+            length = TICKS_PER_QUARTER * 4 * numerator // denominator
+            ticks.append(ticks[-1] + length)
+        return [tick + (anchor or 0) for tick in ticks]
+
+    def page(
+        self,
+        track_number: int,
+        first_measure: int = 0,
+        measures: int = DEFAULT_PAGE_MEASURES,
+        start_tick: Optional[int] = None,
+        end_tick: Optional[int] = None,
+    ) -> NotePage:
+        """
+        Notes of `measures` measures from `first_measure` (0-based), or of
+        the notes sounding in [start_tick, end_tick) when given, at most
+        MAX_PAGE_MEASURES measures either way. KeyError for unknown tracks.
+        """
+        meta, offset = self.tracks[track_number]
+        total = meta["measures"]
+        if start_tick is not None or end_tick is not None:
+            ticks = self.measure_ticks(track_number)
+            if start_tick is not None:
+                # Notes of earlier measures can still ring into the window
+                first_measure = max(0, bisect.bisect_right(ticks, start_tick) - 2)
+            measures = MAX_PAGE_MEASURES
+            if end_tick is not None:
+                measures = bisect.bisect_left(ticks, end_tick) - first_measure
+        first_measure = min(max(0, first_measure), total)
+        measures = max(0, min(measures, MAX_PAGE_MEASURES))
+        end_measure = min(total, first_measure + measures)
+
+        c = self.packed.columns
+        tuning = meta["tuning"] if not meta["is_percussion"] else []
+        window_start = -sys.maxsize if start_tick is None else start_tick
+        window_end = sys.maxsize if end_tick is None else end_tick
+
+        notes = {name: array("i") for name in NOTE_COLUMNS}
+        bend_end = array("i")
+        bends = {name: array("i") for name in BEND_COLUMNS}
+        m_begin, m_end = offset + first_measure, offset + end_measure
+        beat_begin = c["measure_beat_end"][m_begin - 1] if m_begin else 0
+        beat_end = c["measure_beat_end"][m_end - 1] if m_end > m_begin else beat_begin
+        for b in range(beat_begin, beat_end):
+            start = c["beat_start"][b]
+            duration = c["beat_duration"][b]
+            if start >= window_end or start + duration <= window_start:
+                continue
+            note_begin = c["beat_note_end"][b - 1] if b else 0
+            for n in range(note_begin, c["beat_note_end"][b]):
+                note_type = c["note_type"][n]
+                if note_type in self._skipped:
+                    continue
+                notes["start"].append(start)
+                notes["duration"].append(duration)
+                notes["pitch"].append(self._pitch(c, n, tuning))
+                notes["velocity"].append(min(127, max(0, c["note_velocity"][n])))
+                notes["string"].append(c["note_string"][n])
+                notes["tie"].append(note_type == self._tie)
+                effect_begin = c["note_effect_end"][n - 1] if n else 0
+                for e in range(effect_begin, c["note_effect_end"][n]):
+                    if c["effect_type"][e] == self._bend:
+                        point_begin = c["effect_bend_end"][e - 1] if e else 0
+                        for p in range(point_begin, c["effect_bend_end"][e]):
+                            bends["position"].append(c["bend_position"][p])
+                            bends["value"].append(c["bend_value"][p])
+                bend_end.append(len(bends["position"]))
+
+        return NotePage(
+            track_number, first_measure, end_measure, total,
+            start_tick, end_tick, notes, bend_end, bends,
+        )
+
+    @staticmethod
+    def _pitch(c, n: int, tuning: list) -> int:
+        # MidiWriter._note_pitch over the columns
+        pitch = c["note_midi_number"][n]
+        if pitch == NONE_INT:
+            pitch = c["note_fret"][n]
+            string_idx = c["note_string"][n] - 1
+            if 0 <= string_idx < len(tuning):
+                pitch += tuning[string_idx]
+        return min(127, max(0, pitch))
+
+
+def estimated_bytes(song: Song) -> int:
+    """Size of dumps(song) without the header and bend points, a lower bound."""
+    measures = beats = notes = effects = 0
+    for track in song.tracks:
+        measures += len(track.measures)
+        for measure in track.measures:
+            beats += len(measure.beats)
+            for beat in measure.beats:
+                notes += len(beat.notes)
+                for note in beat.notes:
+                    effects += len(note.effects)
+    return (
+        measures * _ROW_BYTES["measure"] + beats * _ROW_BYTES["beat"]
+        + notes * _ROW_BYTES["note"] + effects * _ROW_BYTES["effect"]
+    )
+
+
+class NoteIndexCache:
+    """Note indexes of recently analyzed songs, least recently used go first."""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._indexes: "OrderedDict[str, NoteIndex]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def remember_song(self, song_key: str, song: Song):
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if song_key in self._indexes:
+                self._indexes.move_to_end(song_key)
+                return
+        # One song must not flush everything else, nor be packed to find out
+        if estimated_bytes(song) > self.max_bytes // 4:
+            return
+        index = NoteIndex.from_song(song)
+        if index.nbytes > self.max_bytes // 4:
+            return
+        with self._lock:
+            if song_key in self._indexes:
+                return
+            self._indexes[song_key] = index
+            self._bytes += index.nbytes
+            while self._bytes > self.max_bytes:
+                # Evicted indexes are left to the garbage collector, a page
+                # being read from one keeps it alive
+                _, evicted = self._indexes.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get(self, song_key: str) -> Optional[NoteIndex]:
+        with self._lock:
+            index = self._indexes.get(song_key)
+            if index is None:
+                self.misses += 1
+                return None
+            self._indexes.move_to_end(song_key)
+            self.hits += 1
+            return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "songs": len(self._indexes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+            }
+
+
+note_index_cache = NoteIndexCache()
@@ -0,0 +1,103 @@
+"""
+Hands a song to another process through shared memory.
+
+The song is packed with song_codec into a multiprocessing.shared_memory
+block; only a SongDescriptor (block name and size) crosses the process
+boundary. The receiving process opens the block as a PackedSong, whose
+columns are memoryviews straight into the shared pages: nothing is copied
+or unpickled until it asks for a Song with to_song().
+
+The creating process owns the block: it unlinks it once the receiver is
+done, or hands that over (read_song(..., unlink=True)). Before Python
+3.13 attaching registers the block with the resource tracker again, so
+both sides must share one tracker, as processes started through
+multiprocessing do.
+"""
+import sys
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+from backend.core.storage.song_codec import PackedSong, dumps
+from backend.models.song_model import Song
+
+
+class SongDescriptor(NamedTuple):
+    # Shared memory block holding the packed song
+    name: str
+    # Bytes used, blocks can be rounded up to whole pages
+    size: int
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedSong:
+    """A packed song in a shared memory block."""
+
+    def __init__(self, block: shared_memory.SharedMemory, size: int):
+        self.block = block
+        self.size = size
+        self._buffer = block.buf[:size]
+        try:
+            self.packed = PackedSong(self._buffer)
+        except Exception:
+            self._buffer.release()
+            block.close()
+            raise
+
+    @classmethod
+    def create(cls, song: Song) -> "SharedSong":
+        """Packs `song` into a new block, owned by the caller."""
+        data = dumps(song)
+        block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        block.buf[:len(data)] = data
+        return cls(block, len(data))
+
+    @classmethod
+    def attach(cls, descriptor: SongDescriptor) -> "SharedSong":
+        """Opens the block another process created, FileNotFoundError if it's gone."""
+        return cls(_attach(descriptor.name), descriptor.size)
+
+    @property
+    def descriptor(self) -> SongDescriptor:
+        return SongDescriptor(self.block.name, self.size)
+
+    def to_song(self) -> Song:
+        return self.packed.to_song()
+
+    def close(self):
+        # The column views go first, the mapping can't close while exported
+        if self.packed is not None:
+            self.packed.close()
+            self.packed = None
+            self._buffer.release()
+            self.block.close()
+
+    def unlink(self):
+        """Frees the block for every process, the ones attached keep their mapping."""
+        self.block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def share_song(song: Song) -> SharedSong:
+    return SharedSong.create(song)
+
+
+def read_song(descriptor: SongDescriptor, unlink: bool = False) -> Song:
+    """
+    The song behind `descriptor`. With unlink the block is freed afterwards,
+    for handoffs where the receiver takes ownership.
+    """
+    with SharedSong.attach(descriptor) as shared:
+        song = shared.to_song()
+        if unlink:
+            shared.unlink()
+    return song
@@ -0,0 +1,368 @@
+"""
+Compact binary serialization of the song IR.
+
+Layout (all little-endian):
+
+    preamble   magic "GP2S", format version (u16), reserved (u16),
+               header length (u32)
+    header     UTF-8 JSON with the song and track metadata, the beat texts,
+               the enum tables and the section directory, padded to 8 bytes
+    sections   one flat array per column (note frets, beat starts, bend
+               values...), each 8-byte aligned
+
+Nested lists are flattened into columns and stitched back together with
+cumulative "end" offsets (measure_beat_end, beat_note_end, ...), so a
+packed song can be opened with mmap and its columns read as memoryviews
+without copying them. to_song() rebuilds an identical Song.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, List, Union
+
+from backend.models.song_model import (
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+
+MAGIC = b"GP2S"
+# 2: beat_voice
+FORMAT_VERSION = 2
+
+_PREAMBLE = struct.Struct("<4sHHI")
+_ALIGN = 8
+
+# Sentinel for Optional[int] columns (midi_number)
+NONE_INT = -(2**31)
+
+# name -> array typecode, in file order
+COLUMNS = {
+    "measure_number": "i",
+    "measure_numerator": "i",
+    "measure_denominator": "i",
+    "measure_beat_end": "I",
+    "beat_start": "q",
+    "beat_duration": "i",
+    "beat_text": "i",  # index in the header text table, -1 for None
+    "beat_voice": "B",
+    "beat_note_end": "I",
+    "note_string": "i",
+    "note_fret": "i",
+    "note_velocity": "i",
+    "note_duration": "d",
+    "note_type": "B",
+    "note_duration_percent": "d",
+    "note_midi_number": "i",
+    "note_effect_end": "I",
+    "effect_type": "B",
+    "effect_has_value": "B",
+    "effect_value": "d",
+    "effect_bend_end": "I",
+    "bend_position": "i",
+    "bend_value": "i",
+}
+
+# Columns are stored little-endian, big-endian hosts have to swap a copy
+_NATIVE_LITTLE = sys.byteorder == "little"
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class SongCodecError(ValueError):
+    pass
+
+
+def _pad(length: int) -> int:
+    return -length % _ALIGN
+
+
+def dumps(song: Song) -> bytes:
+    note_types = list(NoteType)
+    effect_types = list(EffectType)
+    note_type_index = {t: i for i, t in enumerate(note_types)}
+    effect_type_index = {t: i for i, t in enumerate(effect_types)}
+
+    cols: Dict[str, list] = {name: [] for name in COLUMNS}
+    texts: List[str] = []
+    text_index: Dict[str, int] = {}
+    tracks_meta = []
+
+    for track in song.tracks:
+        tracks_meta.append(
+            {
+                "number": track.number,
+                "name": track.name,
+                "is_percussion": track.is_percussion,
+                "channel": track.channel,
+                "program": track.program,
+                "bank_msb": track.bank_msb,
+                "bank_lsb": track.bank_lsb,
+                "tuning": track.tuning,
+                "measures": len(track.measures),
+            }
+        )
+        for measure in track.measures:
+            cols["measure_number"].append(measure.number)
+            cols["measure_numerator"].append(measure.numerator)
+            cols["measure_denominator"].append(measure.denominator)
+            for beat in measure.beats:
+                cols["beat_start"].append(beat.start_time)
+                cols["beat_duration"].append(beat.duration)
+                if beat.text is None:
+                    cols["beat_text"].append(-1)
+                else:
+                    if beat.text not in text_index:
+                        text_index[beat.text] = len(texts)
+                        texts.append(beat.text)
+                    cols["beat_text"].append(text_index[beat.text])
+                cols["beat_voice"].append(beat.voice)
+                for note in beat.notes:
+                    cols["note_string"].append(note.string)
+                    cols["note_fret"].append(note.fret)
+                    cols["note_velocity"].append(note.velocity)
+                    cols["note_duration"].append(note.duration)
+                    cols["note_type"].append(note_type_index[note.type])
+                    cols["note_duration_percent"].append(note.duration_percent)
+                    cols["note_midi_number"].append(
+                        NONE_INT if note.midi_number is None else note.midi_number
+                    )
+                    for effect in note.effects:
+                        cols["effect_type"].append(effect_type_index[effect.type])
+                        cols["effect_has_value"].append(effect.value is not None)
+                        cols["effect_value"].append(
+                            0.0 if effect.value is None else effect.value
+                        )
+                        for point in effect.bend_points:
+                            cols["bend_position"].append(point.position)
+                            cols["bend_value"].append(point.value)
+                        cols["effect_bend_end"].append(len(cols["bend_position"]))
+                    cols["note_effect_end"].append(len(cols["effect_type"]))
+                cols["beat_note_end"].append(len(cols["note_string"]))
+            cols["measure_beat_end"].append(len(cols["beat_start"]))
+
+    blobs = []
+    sections = []
+    offset = 0
+    for name, code in COLUMNS.items():
+        try:
+            arr = array(code, cols[name])
+        except OverflowError as e:
+            raise SongCodecError(f"Value out of range for column {name}: {e}")
+        if not _NATIVE_LITTLE:
+            arr.byteswap()
+        blob = arr.tobytes()
+        sections.append([name, code, offset, len(arr)])
+        blobs.append(blob)
+        blobs.append(b"\x00" * _pad(len(blob)))
+        offset += len(blob) + _pad(len(blob))
+
+    header = json.dumps(
+        {
+            "title": song.title,
+            "artist": song.artist,
+            "tempo": song.tempo,
+            "tracks": tracks_meta,
+            "texts": texts,
+            "note_types": [t.value for t in note_types],
+            "effect_types": [t.value for t in effect_types],
+            "sections": sections,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    header += b" " * _pad(_PREAMBLE.size + len(header))
+
+    return b"".join(
+        [_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header)), header] + blobs
+    )
+
+
+def dump(song: Song, path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(dumps(song))
+
+
+class PackedSong:
+    """
+    A serialized song opened in place. The columns are memoryviews over the
+    underlying buffer (an mmap when opened from a file), nothing is copied
+    until to_song() is called.
+    """
+
+    def __init__(self, buffer: Buffer, _mmap=None):
+        self._mmap = _mmap
+        self._view = memoryview(buffer)
+        self.columns: Dict[str, memoryview] = {}
+        try:
+            self._read_sections()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_sections(self):
+        if len(self._view) < _PREAMBLE.size:
+            raise SongCodecError("Buffer too small for a packed song")
+
+        magic, version, _, header_len = _PREAMBLE.unpack_from(self._view)
+        if magic != MAGIC:
+            raise SongCodecError(f"Not a packed song (magic {magic!r})")
+        if version != FORMAT_VERSION:
+            raise SongCodecError(f"Unsupported packed song version {version}")
+
+        data_start = _PREAMBLE.size + header_len
+        try:
+            self.header = json.loads(bytes(self._view[_PREAMBLE.size:data_start]))
+        except ValueError as e:
+            raise SongCodecError(f"Corrupt packed song header: {e}")
+
+        for name, code, offset, count in self.header["sections"]:
+            start = data_start + offset
+            end = start + count * array(code).itemsize
+            if end > len(self._view):
+                raise SongCodecError(f"Section {name} runs past the end of the data")
+            column = self._view[start:end].cast(code)
+            if not _NATIVE_LITTLE:
+                swapped = array(code, column.tobytes())
+                swapped.byteswap()
+                column.release()
+                column = memoryview(swapped)
+            self.columns[name] = column
+
+        missing = set(COLUMNS) - set(self.columns)
+        if missing:
+            raise SongCodecError(f"Packed song is missing sections: {sorted(missing)}")
+
+    @classmethod
+    def open(cls, path: str) -> "PackedSong":
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, _mmap=mm)
+
+    def close(self):
+        # Exported views must be released before the mmap can be closed
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def to_song(self) -> Song:
+        h = self.header
+        note_types = [NoteType(v) for v in h["note_types"]]
+        effect_types = [EffectType(v) for v in h["effect_types"]]
+        texts = h["texts"]
+        # tolist() is one C loop per column, far cheaper than indexing views
+        c = {name: column.tolist() for name, column in self.columns.items()}
+
+        song = Song(title=h["title"], artist=h["artist"], tempo=h["tempo"])
+        measure_pos = beat_pos = note_pos = effect_pos = bend_pos = 0
+        for meta in h["tracks"]:
+            track = Track(
+                number=meta["number"],
+                name=meta["name"],
+                is_percussion=meta["is_percussion"],
+                channel=meta["channel"],
+                program=meta["program"],
+                bank_msb=meta["bank_msb"],
+                bank_lsb=meta["bank_lsb"],
+                tuning=meta["tuning"],
+            )
+            for m in range(measure_pos, measure_pos + meta["measures"]):
+                beats = []
+                beat_end = c["measure_beat_end"][m]
+                for b in range(beat_pos, beat_end):
+                    notes = []
+                    note_end = c["beat_note_end"][b]
+                    for n in range(note_pos, note_end):
+                        effects = []
+                        effect_end = c["note_effect_end"][n]
+                        for e in range(effect_pos, effect_end):
+                            bend_end = c["effect_bend_end"][e]
+                            effects.append(
+                                NoteEffect(
+                                    type=effect_types[c["effect_type"][e]],
+                                    value=c["effect_value"][e]
+                                    if c["effect_has_value"][e]
+                                    else None,
+                                    bend_points=[
+                                        BendPoint(
+                                            position=c["bend_position"][p],
+                                            value=c["bend_value"][p],
+                                        )
+                                        for p in range(bend_pos, bend_end)
+                                    ],
+                                )
+                            )
+                            bend_pos = bend_end
+                        effect_pos = effect_end
+
+                        midi_number = c["note_midi_number"][n]
+                        notes.append(
+                            Note(
+                                string=c["note_string"][n],
+                                fret=c["note_fret"][n],
+                                velocity=c["note_velocity"][n],
+                                duration=c["note_duration"][n],
+                                type=note_types[c["note_type"][n]],
+                                effects=effects,
+                                duration_percent=c["note_duration_percent"][n],
+                                midi_number=None
+                                if midi_number == NONE_INT
+                                else midi_number,
+                            )
+                        )
+                    note_pos = note_end
+
+                    text = c["beat_text"][b]
+                    beats.append(
+                        Beat(
+                            start_time=c["beat_start"][b],
+                            duration=c["beat_duration"][b],
+                            notes=notes,
+                            text=None if text < 0 else texts[text],
+                            voice=c["beat_voice"][b],
+                        )
+                    )
+                beat_pos = beat_end
+
+                track.measures.append(
+                    Measure(
+                        number=c["measure_number"][m],
+                        numerator=c["measure_numerator"][m],
+                        denominator=c["measure_denominator"][m],
+                        beats=beats,
+                    )
+                )
+            measure_pos += meta["measures"]
+            song.tracks.append(track)
+
+        return song
+
+
+def loads(data: Buffer) -> Song:
+    packed = PackedSong(data)
+    try:
+        return packed.to_song()
+    finally:
+        packed.close()
+
+
+def load(path: str) -> Song:
+    with PackedSong.open(path) as packed:
+        return packed.to_song()
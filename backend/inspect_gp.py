@@ -1,62 +1,396 @@
+"""
+Streaming inspector for Guitar Pro 6-8 scores (score.gpif in a .gp zip or a
+.gpx container), to triage files that are slow or over budget without
+parsing them.
+
+    python backend/inspect_gp.py song.gp [--top 20] [--json] [--measure]
+
+score.gpif is read once with iterparse and every item is dropped as soon as
+its references are recorded, so memory follows the number of ids rather
+than the size of the document. The report has:
+
+- the container, file size and decompressed size of score.gpif
+- elements per tag (the most frequent --top ones)
+- per track: bars, beats and notes after resolving references, and bend
+  points per note
+- per Bars/Voices/Beats/Notes section: how many ids are referenced more
+  than once and how many references point at them (what makes a small
+  file expand into a big song)
+- the default ParseBudget limits the file would cross, and a parse time
+  estimate from the element and note counts (--measure runs XmlParser to
+  compare)
+"""
+import argparse
+import json
+import os
 import sys
+import time
 import xml.etree.ElementTree as ET
 import zipfile
+from collections import Counter
+from typing import Dict, List, NamedTuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.core.budget import (
+    MAX_DECOMPRESSED_BYTES,
+    MAX_NOTES,
+    MAX_XML_ELEMENTS,
+    ParseBudget,
+)
+from backend.core.parser.gpif_stream import REFERENCES, SECTIONS, local_name, split_ns
+from backend.core.parser.gpx_container import ChunkReader, GpxContainer, is_gpx
+
+# XmlParser cost per element read and per beat/note built, fitted on
+# synthetic scores (backend/tests/gpif_factory.py); only a rough guide
+PARSE_SECONDS_PER_ELEMENT = 5e-6
+PARSE_SECONDS_PER_NOTE = 15e-6
+
+# Voice slots without a voice
+EMPTY_REF = "-1"
+
+
+class TrackStats(NamedTuple):
+    name: str
+    bars: int
+    beats: int
+    notes: int
+    bend_points: int
+
+    @property
+    def bend_points_per_note(self) -> float:
+        return self.bend_points / self.notes if self.notes else 0.0
+
+
+class ReuseStats(NamedTuple):
+    # Items defined in the section
+    defined: int
+    # References to items of the section, and distinct ids they name
+    references: int
+    referenced: int
+    # Ids referenced more than once, and the references pointing at them
+    reused: int
+    reused_references: int
+    max_references: int
+    # Defined but never referenced, referenced but never defined
+    unreferenced: int
+    missing: int
+
+
+class Inspection(NamedTuple):
+    path: str
+    container: str
+    file_size: int
+    decompressed_bytes: int
+    elements: int
+    tags: Counter
+    tracks: List[TrackStats]
+    reuse: Dict[str, ReuseStats]
+    seconds: float  # Spent inspecting
+
+    @property
+    def resolved_notes(self) -> int:
+        # What ParseBudget.charge_notes() would see: beats plus notes
+        return sum(t.beats + t.notes for t in self.tracks)
+
+    @property
+    def estimated_parse_seconds(self) -> float:
+        return (
+            self.elements * PARSE_SECONDS_PER_ELEMENT
+            + self.resolved_notes * PARSE_SECONDS_PER_NOTE
+        )
+
+    def exceeded_limits(self) -> List[str]:
+        """Default ParseBudget limits a full parse would cross."""
+        limits = [
+            ("decompressed_bytes", self.decompressed_bytes, MAX_DECOMPRESSED_BYTES),
+            ("xml_elements", self.elements, MAX_XML_ELEMENTS),
+            ("notes", self.resolved_notes, MAX_NOTES),
+        ]
+        return [name for name, used, limit in limits if used > limit]
+
+
+class _Collector:
+    """Keeps the references of each item as the document streams by."""
+
+    def __init__(self):
+        self.ns = ""
+        self.track_names: Dict[str, str] = {}
+        self.track_ids: List[str] = []
+        # Bar ids per track position, in MasterBar order
+        self.track_bars: List[List[str]] = []
+        # Item tag -> id -> referenced child ids
+        self.children: Dict[str, Dict[str, List[str]]] = {
+            item: {} for item in REFERENCES
+        }
+        self.notes: Dict[str, int] = {}  # Note id -> bend points
 
+    def item(self, tag: str, elem: ET.Element):
+        ns = self.ns
+        if tag == "MasterBar":
+            bar_ids = (elem.findtext(f"{ns}Bars") or "").split()
+            while len(self.track_bars) < len(bar_ids):
+                self.track_bars.append([])
+            for position, bar_id in enumerate(bar_ids):
+                self.track_bars[position].append(bar_id)
+        elif tag in REFERENCES:
+            refs = (elem.findtext(f"{ns}{REFERENCES[tag][0]}") or "").split()
+            self.children[tag][elem.get("id")] = [r for r in refs if r != EMPTY_REF]
+        elif tag == "Note":
+            bend_points = 0
+            properties = elem.find(f"{ns}Properties")
+            if properties is not None:
+                for prop in properties.findall(f"{ns}Property"):
+                    if prop.get("name") == "Bends":
+                        bend_points += len(prop.findall(f".//{ns}Point"))
+            self.notes[elem.get("id")] = bend_points
 
-def inspect_gp(file_path):
-    print(f"Inspecting {file_path}")
+    def top_level(self, tag: str, elem: ET.Element):
+        ns = self.ns
+        if tag == "MasterTrack":
+            self.track_ids = (elem.findtext(f"{ns}Tracks") or "").split()
+        elif tag == "Tracks":
+            for track in elem.findall(f"{ns}Track"):
+                name = track.findtext(f"{ns}Name") or ""
+                self.track_names[track.get("id")] = name.strip()
+
+    def tracks(self) -> List[TrackStats]:
+        # Uses of every item, following references from each track's bars
+        stats = []
+        for position, bar_ids in enumerate(self.track_bars):
+            bars = Counter(bar_ids)
+            voices = self._expand("Bar", bars)
+            beats = self._expand("Voice", voices)
+            notes = self._expand("Beat", beats)
+            track_id = None
+            if position < len(self.track_ids):
+                track_id = self.track_ids[position]
+            defined = self.children["Beat"]
+            stats.append(TrackStats(
+                name=self.track_names.get(track_id, f"Track {position + 1}"),
+                bars=len(bar_ids),
+                beats=sum(n for beat_id, n in beats.items() if beat_id in defined),
+                notes=sum(n for note_id, n in notes.items() if note_id in self.notes),
+                bend_points=sum(
+                    n * self.notes.get(note_id, 0) for note_id, n in notes.items()
+                ),
+            ))
+        return stats
+
+    def _expand(self, tag: str, uses: Counter) -> Counter:
+        children = self.children[tag]
+        expanded = Counter()
+        for item_id, count in uses.items():
+            for child_id in children.get(item_id, ()):
+                expanded[child_id] += count
+        return expanded
+
+    def reuse(self) -> Dict[str, ReuseStats]:
+        references = {"Bar": Counter(b for bars in self.track_bars for b in bars)}
+        for tag, (_, child) in REFERENCES.items():
+            references[child] = Counter(
+                child_id for refs in self.children[tag].values() for child_id in refs
+            )
+        defined = {tag: set(ids) for tag, ids in self.children.items()}
+        defined["Note"] = set(self.notes)
+
+        stats = {}
+        for tag, counts in references.items():
+            reused = [n for n in counts.values() if n > 1]
+            stats[tag] = ReuseStats(
+                defined=len(defined[tag]),
+                references=sum(counts.values()),
+                referenced=len(counts),
+                reused=len(reused),
+                reused_references=sum(reused),
+                max_references=max(counts.values(), default=0),
+                unreferenced=len(defined[tag] - counts.keys()),
+                missing=len(counts.keys() - defined[tag]),
+            )
+        return stats
+
+
+def _open_score(f):
+    """(container name, readable score.gpif) of an open .gp/.gpx file."""
+    head = f.read(4)
+    f.seek(0)
+    if is_gpx(head):
+        container = GpxContainer(f.read())
+        return "gpx", ChunkReader(container.chunks("score.gpif"))
     try:
-        with zipfile.ZipFile(file_path, "r") as z:
-            print("Files in archive:", z.namelist())
+        z = zipfile.ZipFile(f)
+    except zipfile.BadZipFile:
+        raise ValueError("Not a GPIF score (GP3-5 files have no score.gpif)")
+    for name in ("score.gpif", "Content/score.gpif"):
+        if name in z.namelist():
+            return "zip", z.open(name)
+    raise ValueError("Invalid GPX/GP file: score.gpif not found")
 
-            score_file = None
-            if "score.gpif" in z.namelist():
-                score_file = "score.gpif"
-            elif "Content/score.gpif" in z.namelist():
-                score_file = "Content/score.gpif"
 
-            if not score_file:
-                print("score.gpif not found!")
-                return
+def inspect_gp(file_path: str) -> Inspection:
+    started = time.perf_counter()
+    # Counts bytes and elements, nothing is too big to look at
+    budget = ParseBudget(max_decompressed_bytes=sys.maxsize, max_elements=sys.maxsize)
+    tags = Counter()
+    collector = _Collector()
 
-            with z.open(score_file) as f:
-                content = f.read()
-                # Parse XML
-                root = ET.fromstring(content)
+    with open(file_path, "rb") as f:
+        container, score = _open_score(f)
+        depth = 0
+        root = section_elem = None
+        section = None
+        for event, elem in ET.iterparse(budget.reader(score), events=("start", "end")):
+            if event == "start":
+                budget.charge_element()
+                depth += 1
+                name = local_name(elem.tag)
+                tags[name] += 1
+                if depth == 1:
+                    root = elem
+                    collector.ns = split_ns(elem.tag)
+                elif depth == 2:
+                    section = name if name in SECTIONS else None
+                    section_elem = elem
+                continue
 
-                # Write formatted XML snippet to file
-                with open("debug_xml_structure.txt", "w", encoding="utf-8") as out:
-                    # Generic dump of structure (tags and attributes)
-                    # not full content to avoid huge files
-                    dump_structure(root, out)
+            depth -= 1
+            if depth == 2 and section:
+                collector.item(SECTIONS[section], elem)
+                # Drops the item itself, not only its content
+                section_elem.clear()
+            elif depth == 1:
+                collector.top_level(local_name(elem.tag), elem)
+                section = None
+                root.clear()
 
-    except Exception as e:
-        print(f"Error: {e}")
+    return Inspection(
+        path=file_path,
+        container=container,
+        file_size=os.path.getsize(file_path),
+        decompressed_bytes=budget.decompressed_bytes,
+        elements=budget.elements,
+        tags=tags,
+        tracks=collector.tracks(),
+        reuse=collector.reuse(),
+        seconds=time.perf_counter() - started,
+    )
 
 
-def dump_structure(elem, f, level=0):
-    indent = "  " * level
-    # Print tag and attributes
-    attrs = " ".join(f'{k}="{v}"' for k, v in elem.attrib.items())
-    text = (elem.text or "").strip()
-    short_text = text[:50] + "..." if len(text) > 50 else text
+def measure_parse(file_path: str) -> float:
+    """Seconds XmlParser takes on the file, with the default budget."""
+    from backend.core.parser.xml_parser import XmlParser
 
-    f.write(f"{indent}<{elem.tag} {attrs}")
-    if short_text:
-        f.write(f"> {short_text}\n")
-    else:
-        f.write(">\n")
+    with open(file_path, "rb") as f:
+        content = f.read()
+    started = time.perf_counter()
+    XmlParser().parse_bytes(content)
+    return time.perf_counter() - started
 
-    # Recurse children (limit depth or count if needed)
-    for child in elem:
-        dump_structure(child, f, level + 1)
 
+def format_report(inspection: Inspection, top: int = 20) -> str:
+    lines = [
+        f"{inspection.path}",
+        f"  container {inspection.container}, {inspection.file_size:,} bytes, "
+        f"score.gpif {inspection.decompressed_bytes:,} bytes, "
+        f"{inspection.elements:,} elements",
+        "",
+        "Elements per tag:",
+    ]
+    for tag, count in inspection.tags.most_common(top):
+        lines.append(f"  {tag:<24} {count:>12,}")
+    if len(inspection.tags) > top:
+        lines.append(f"  ({len(inspection.tags) - top} more tags)")
 
-if __name__ == "__main__":
-    target = (
-        r"c:\Users\sales\Downloads\Code Stuff\gp2midi"
-        r"\My Bloody Valentine-When You Sleep-11-06-2025.gp"
+    lines += ["", "Tracks (after resolving references):"]
+    for stats in inspection.tracks:
+        lines.append(
+            f"  {stats.name[:24]:<24} bars {stats.bars:>7,}  beats {stats.beats:>10,}"
+            f"  notes {stats.notes:>10,}  bend points {stats.bend_points:>10,}"
+            f" ({stats.bend_points_per_note:.2f}/note)"
+        )
+
+    lines += ["", "Reused ids (referenced more than once):"]
+    for tag, stats in inspection.reuse.items():
+        lines.append(
+            f"  {tag:<6} {stats.reused:>9,} of {stats.referenced:>9,} ids"
+            f", {stats.reused_references:>10,} of {stats.references:>10,} references"
+            f", max {stats.max_references:,}"
+            + (f", {stats.unreferenced:,} unreferenced" if stats.unreferenced else "")
+            + (f", {stats.missing:,} missing" if stats.missing else "")
+        )
+
+    exceeded = inspection.exceeded_limits()
+    lines += [
+        "",
+        f"Resolved beats+notes {inspection.resolved_notes:,}, "
+        f"estimated parse time {inspection.estimated_parse_seconds:.2f}s "
+        f"(inspected in {inspection.seconds:.2f}s)",
+        "Exceeds the default limits: " + (", ".join(exceeded) if exceeded else "none"),
+    ]
+    return "\n".join(lines)
+
+
+def to_json(inspection: Inspection) -> dict:
+    return {
+        "path": inspection.path,
+        "container": inspection.container,
+        "file_size": inspection.file_size,
+        "decompressed_bytes": inspection.decompressed_bytes,
+        "elements": inspection.elements,
+        "tags": dict(inspection.tags.most_common()),
+        "tracks": [
+            dict(stats._asdict(), bend_points_per_note=stats.bend_points_per_note)
+            for stats in inspection.tracks
+        ],
+        "reuse": {tag: stats._asdict() for tag, stats in inspection.reuse.items()},
+        "resolved_notes": inspection.resolved_notes,
+        "estimated_parse_seconds": inspection.estimated_parse_seconds,
+        "exceeded_limits": inspection.exceeded_limits(),
+        "seconds": inspection.seconds,
+    }
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    arg_parser.add_argument("paths", nargs="+", help=".gp or .gpx files")
+    arg_parser.add_argument("--top", type=int, default=20, help="tags listed")
+    arg_parser.add_argument(
+        "--json", action="store_true", help="one JSON object per file"
+    )
+    arg_parser.add_argument(
+        "--measure", action="store_true", help="also time a full parse"
     )
-    if len(sys.argv) > 1:
-        target = sys.argv[1]
-    inspect_gp(target)
+    args = arg_parser.parse_args(argv)
+
+    failed = False
+    for path in args.paths:
+        try:
+            inspection = inspect_gp(path)
+        except Exception as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed = True
+            continue
+        measured = None
+        if args.measure:
+            try:
+                measured = measure_parse(path)
+            except Exception as e:
+                # Over budget files are what this is for, report them anyway
+                measured = f"{type(e).__name__}: {e}"
+        if args.json:
+            report = to_json(inspection)
+            if measured is not None:
+                report["measured_parse_seconds"] = measured
+            print(json.dumps(report))
+        else:
+            print(format_report(inspection, args.top))
+            if isinstance(measured, float):
+                print(f"Measured parse time {measured:.2f}s")
+            elif measured is not None:
+                print(f"Measured parse failed: {measured}")
+            print()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+SQLite backed queue for conversion jobs.
+
+The database is the only thing the API and the workers share: the API
+inserts jobs and reads their state, workers claim queued jobs inside an
+IMMEDIATE transaction (so two workers never get the same job), report
+progress as rows in job_events and store the MIDI result. Any process that
+can open the file can run a worker.
+
+A running job whose heartbeat is older than the lease is assumed to belong
+to a dead worker and is queued again, up to MAX_ATTEMPTS times.
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from backend.models.job_model import Job, JobEvent, JobOptions, JobStatus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.environ.get("GP2MIDI_JOB_DB", "gp2midi_jobs.sqlite3")
+# Queued jobs allowed before submissions are rejected
+MAX_QUEUE_DEPTH = int(os.environ.get("GP2MIDI_MAX_QUEUE_DEPTH", "32"))
+LEASE_SECONDS = float(os.environ.get("GP2MIDI_JOB_LEASE_SECONDS", "300"))
+# Finished jobs (and their results) are kept this long
+RESULT_TTL_SECONDS = float(os.environ.get("GP2MIDI_JOB_TTL_SECONDS", "86400"))
+MAX_ATTEMPTS = 3
+
+# Retry-After bounds when the queue is full
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 600
+DEFAULT_JOB_SECONDS = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    options TEXT NOT NULL,
+    input BLOB,
+    result BLOB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id);
+"""
+
+_JOB_COLUMNS = (
+    "id, status, filename, options, attempts, progress_done, progress_total, "
+    "error, created_at, started_at, finished_at"
+)
+
+
+class QueueFull(Exception):
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"Job queue is full ({depth} queued)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class JobStore:
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_depth: int = MAX_QUEUE_DEPTH):
+        self.path = path
+        self.max_depth = max_depth
+        with self._connect() as conn:
+            # WAL lets the API read while a worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, sqlite3 connections
+        # can't be shared between threads and workers are separate processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def submit(self, filename: str, content: bytes, options: JobOptions) -> Job:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            depth = self._queue_depth(conn)
+            if depth >= self.max_depth:
+                raise QueueFull(depth, self._retry_after(conn, depth))
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, options, input, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    JobStatus.QUEUED.value,
+                    filename,
+                    options.model_dump_json(),
+                    content,
+                    now,
+                ),
+            )
+            self._add_event(conn, job_id, "status", {"status": JobStatus.QUEUED.value})
+        logger.info(f"Job {job_id} queued ({filename}, {len(content)} bytes)")
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM jobs WHERE id = ? AND status = ?",
+                (job_id, JobStatus.DONE.value),
+            ).fetchone()
+        return row[0] if row else None
+
+    def queue_depth(self) -> int:
+        with self._connect() as conn:
+            return self._queue_depth(conn)
+
+    def claim(self, worker_id: str) -> Optional[Tuple[Job, bytes]]:
+        now = time.time()
+        with self._transaction() as conn:
+            self._recover_expired(conn, now)
+            row = conn.execute(
+                f"SELECT {_JOB_COLUMNS}, input FROM jobs WHERE status = ? "
+                "ORDER BY created_at LIMIT 1",
+                (JobStatus.QUEUED.value,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (JobStatus.RUNNING.value, worker_id, now, now, row[0]),
+            )
+            self._add_event(conn, row[0], "status", {"status": JobStatus.RUNNING.value})
+        job = _row_to_job(row[:-1])
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.started_at = now
+        return job, row[-1]
+
+    def report_progress(
+        self, job_id: str, worker_id: str, done: int, total: int, **data
+    ) -> bool:
+        """False when the worker lost the job (lease expired), nothing is kept."""
+        with self._transaction() as conn:
+            owned = conn.execute(
+                "UPDATE jobs SET progress_done = ?, progress_total = ?, "
+                "heartbeat_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (done, total, time.time(), job_id, JobStatus.RUNNING.value, worker_id),
+            ).rowcount == 1
+            if owned:
+                self._add_event(
+                    conn, job_id, "progress", {"done": done, "total": total, **data}
+                )
+        return owned
+
+    def heartbeat(self, job_id: str, worker_id: str):
+        """Renews the lease of a job the worker is still running."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (time.time(), job_id, JobStatus.RUNNING.value, worker_id),
+            )
+
+    def complete(self, job_id: str, worker_id: str, result: bytes) -> bool:
+        """False when the worker lost the job, its result is dropped."""
+        with self._transaction() as conn:
+            owned = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, input = NULL, finished_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (
+                    JobStatus.DONE.value, result, time.time(),
+                    job_id, JobStatus.RUNNING.value, worker_id,
+                ),
+            ).rowcount == 1
+            if owned:
+                self._add_event(
+                    conn, job_id, "done",
+                    {"status": JobStatus.DONE.value, "size": len(result)},
+                )
+        if owned:
+            logger.info(f"Job {job_id} done ({len(result)} bytes)")
+        else:
+            logger.warning(f"Job {job_id} finished by {worker_id} after losing it")
+        return owned
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """False when the worker lost the job, the error is dropped."""
+        with self._transaction() as conn:
+            owned = self._fail(conn, job_id, error, time.time(), worker_id)
+        if owned:
+            logger.warning(f"Job {job_id} failed: {error}")
+        return owned
+
+    def events_since(self, job_id: str, after_id: int = 0) -> List[JobEvent]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, job_id, event, data FROM job_events "
+                "WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id),
+            ).fetchall()
+        return [
+            JobEvent(id=r[0], job_id=r[1], event=r[2], data=json.loads(r[3]))
+            for r in rows
+        ]
+
+    def purge(self, older_than: float = RESULT_TTL_SECONDS) -> int:
+        cutoff = time.time() - older_than
+        with self._transaction() as conn:
+            ids = [
+                r[0]
+                for r in conn.execute(
+                    "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (JobStatus.DONE.value, JobStatus.FAILED.value, cutoff),
+                )
+            ]
+            rows = [(i,) for i in ids]
+            conn.executemany("DELETE FROM job_events WHERE job_id = ?", rows)
+            conn.executemany("DELETE FROM jobs WHERE id = ?", rows)
+        if ids:
+            logger.info(f"Purged {len(ids)} finished jobs")
+        return len(ids)
+
+    def _queue_depth(self, conn) -> int:
+        return conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (JobStatus.QUEUED.value,)
+        ).fetchone()[0]
+
+    def _retry_after(self, conn, depth: int) -> int:
+        # Time to drain the queue at the recent pace of the running workers
+        row = conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM ("
+            "SELECT finished_at, started_at FROM jobs WHERE status = ? "
+            "ORDER BY finished_at DESC LIMIT 50)",
+            (JobStatus.DONE.value,),
+        ).fetchone()
+        job_seconds = row[0] or DEFAULT_JOB_SECONDS
+        running = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (JobStatus.RUNNING.value,)
+        ).fetchone()[0]
+        wait = job_seconds * depth / max(1, running)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(wait))))
+
+    def _recover_expired(self, conn, now: float):
+        expired = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE status = ? AND heartbeat_at < ?",
+            (JobStatus.RUNNING.value, now - LEASE_SECONDS),
+        ).fetchall()
+        for job_id, attempts in expired:
+            if attempts >= MAX_ATTEMPTS:
+                self._fail(conn, job_id, "Worker lost too many times", now)
+                continue
+            logger.warning(f"Job {job_id} lease expired, queueing it again")
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE id = ?",
+                (JobStatus.QUEUED.value, job_id),
+            )
+            self._add_event(conn, job_id, "status", {"status": JobStatus.QUEUED.value})
+
+    def _fail(
+        self, conn, job_id: str, error: str, now: float, worker_id: Optional[str] = None
+    ) -> bool:
+        # Only running jobs fail, and only for their worker when one is given
+        query = (
+            "UPDATE jobs SET status = ?, error = ?, input = NULL, finished_at = ? "
+            "WHERE id = ? AND status = ?"
+        )
+        params = [JobStatus.FAILED.value, error, now, job_id, JobStatus.RUNNING.value]
+        if worker_id is not None:
+            query += " AND worker = ?"
+            params.append(worker_id)
+        if conn.execute(query, params).rowcount != 1:
+            return False
+        self._add_event(
+            conn, job_id, "failed", {"status": JobStatus.FAILED.value, "error": error}
+        )
+        return True
+
+    def _add_event(self, conn, job_id: str, event: str, data: dict):
+        conn.execute(
+            "INSERT INTO job_events (job_id, event, data) VALUES (?, ?, ?)",
+            (job_id, event, json.dumps(data)),
+        )
+
+
+def _row_to_job(row) -> Job:
+    return Job(
+        id=row[0],
+        status=JobStatus(row[1]),
+        filename=row[2],
+        options=JobOptions.model_validate_json(row[3]),
+        attempts=row[4],
+        progress_done=row[5],
+        progress_total=row[6],
+        error=row[7],
+        created_at=row[8],
+        started_at=row[9],
+        finished_at=row[10],
+    )
@@ -0,0 +1,209 @@
+"""
+Conversion workers for the job queue.
+
+Run standalone workers (on this or any machine that shares the database):
+
+    python -m backend.jobs.worker --workers 4 --db /shared/gp2midi_jobs.sqlite3
+
+The API can also start a few of them itself, see GP2MIDI_JOB_WORKERS (off
+by default).
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Callable, List, Optional
+
+from backend.core.imports import timed_import
+from backend.core.parser.registry import parser_for_content
+from backend.jobs.store import DEFAULT_DB_PATH, LEASE_SECONDS, JobStore
+from backend.models.job_model import JobOptions
+
+logger = logging.getLogger(__name__)
+
+# Worker processes started by the API, by default none (external workers only)
+EMBEDDED_WORKERS = int(os.environ.get("GP2MIDI_JOB_WORKERS", "0"))
+POLL_INTERVAL = 0.5
+# Leases are renewed while a job runs, however long one of its tracks takes
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 4
+PURGE_INTERVAL = 600.0
+
+
+def convert(
+    filename: str,
+    content: bytes,
+    options: JobOptions,
+    progress: Optional[Callable] = None,
+) -> bytes:
+    parser = parser_for_content(content, filename)
+    if parser is None:
+        raise ValueError(f"Unsupported file format: {filename}")
+
+    if options.allocation != "interval":
+        # Tracks are written as soon as they are parsed
+        pipeline = timed_import("backend.core.pipeline")
+        return pipeline.convert_pipelined(
+            parser,
+            content,
+            options.selected_tracks,
+            progress=progress,
+            high_fidelity=options.high_fidelity,
+            compact=options.compact,
+        )
+
+    song = parser.parse_bytes(content)
+    if options.selected_tracks:
+        wanted = set(options.selected_tracks)
+        song.tracks = [t for t in song.tracks if t.number in wanted]
+
+    midi_buffer = io.BytesIO()
+    midi_writer = timed_import("backend.core.converter.midi_writer")
+    midi_writer.MidiWriter(
+        song,
+        high_fidelity=options.high_fidelity,
+        compact=options.compact,
+        allocation=options.allocation,
+    ).write(
+        file=midi_buffer, progress=progress
+    )
+    return midi_buffer.getvalue()
+
+
+class ConversionWorker:
+    def __init__(self, store: JobStore, worker_id: Optional[str] = None):
+        self.store = store
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._last_purge = 0.0
+
+    def run_once(self) -> bool:
+        """Process one queued job, False if there was none."""
+        claimed = self.store.claim(self.worker_id)
+        if claimed is None:
+            return False
+        job, content = claimed
+        logger.info(f"Worker {self.worker_id} running job {job.id} ({job.filename})")
+
+        def progress(done, total, track):
+            self.store.report_progress(
+                job.id, self.worker_id, done, total, track=track.name
+            )
+
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            args=(job.id, done),
+            name=f"heartbeat-{job.id}",
+            daemon=True,
+        )
+        heartbeat.start()
+        try:
+            result = convert(job.filename, content, job.options, progress)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            self.store.fail(job.id, self.worker_id, str(e) or type(e).__name__)
+        else:
+            self.store.complete(job.id, self.worker_id, result)
+        finally:
+            done.set()
+            heartbeat.join()
+        return True
+
+    def _heartbeat(self, job_id: str, done: threading.Event):
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.store.heartbeat(job_id, self.worker_id)
+            except Exception:
+                # Retried at the next interval, well within the lease
+                logger.exception(f"Worker {self.worker_id} heartbeat error")
+
+    def run(self, stop_event=None, poll_interval: float = POLL_INTERVAL):
+        logger.info(f"Worker {self.worker_id} started on {self.store.path}")
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if self.run_once():
+                    continue
+                self._maybe_purge()
+            except Exception:
+                # A locked or briefly unavailable database must not kill the worker
+                logger.exception(f"Worker {self.worker_id} loop error")
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = now
+            self.store.purge()
+
+
+def _worker_main(db_path: str, stop_event):
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    ConversionWorker(JobStore(db_path)).run(stop_event)
+
+
+class WorkerPool:
+    """Worker processes owned by the current process."""
+
+    def __init__(self, count: int, db_path: str = DEFAULT_DB_PATH):
+        # spawn rather than fork, the API process runs threads
+        self._ctx = multiprocessing.get_context("spawn")
+        self.count = count
+        self.db_path = db_path
+        self.stop_event = self._ctx.Event()
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        # Create the schema once before the workers race for it
+        JobStore(self.db_path)
+        for i in range(self.count):
+            process = self._ctx.Process(
+                target=_worker_main,
+                args=(self.db_path, self.stop_event),
+                name=f"gp2midi-worker-{i}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Started {self.count} conversion workers")
+
+    def stop(self, timeout: float = 10.0):
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating it")
+                process.terminate()
+                process.join()
+        self.processes = []
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run GP2MIDI conversion workers")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = arg_parser.parse_args()
+
+    pool = WorkerPool(args.workers, args.db)
+    pool.start()
+    try:
+        for process in pool.processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Builds the song library: parses every Guitar Pro file under the given
+paths once and indexes it in a LibraryStore, so catalogue songs convert
+from their packed IR without being parsed again.
+
+    python -m backend.library.ingest /music/tabs --workers 4 \
+        [--db gp2midi_library.sqlite3] [--prune]
+
+Re-running is incremental: files whose size and mtime didn't change are
+skipped without being read, files whose content hash didn't change only
+get their mtime updated, and only new or modified files are parsed.
+Parsing runs in worker processes; this process is the only one writing
+the index.
+"""
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from backend.core.parser.registry import (
+    BINARY_EXTENSIONS,
+    XML_EXTENSIONS,
+    parser_for_content,
+)
+from backend.core.storage import song_codec
+from backend.library.store import DEFAULT_DB_PATH, LibraryStore
+from backend.models.library_model import LibraryTrack
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = BINARY_EXTENSIONS + XML_EXTENSIONS
+
+
+class IngestReport(NamedTuple):
+    added: int
+    updated: int
+    unchanged: int
+    failed: int
+    removed: int
+
+
+class _Parsed(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    content_hash: str
+    # song_codec.dumps() of the song, None when it's stored already or failed
+    packed: Optional[bytes] = None
+    title: str = ""
+    artist: str = ""
+    tracks: Tuple[LibraryTrack, ...] = ()
+    error: Optional[str] = None
+
+
+def library_files(paths: Iterable[str]) -> Iterator[str]:
+    """Guitar Pro files among `paths` and under the directories in it."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(EXTENSIONS):
+                        yield os.path.abspath(os.path.join(root, name))
+        elif os.path.isfile(path):
+            yield os.path.abspath(path)
+
+
+def _parse_file(path: str, known_hash: Optional[str] = None) -> _Parsed:
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            content = f.read()
+    except OSError as e:
+        # Gone or unreadable since it was listed: no content to index
+        return _Parsed(path, 0, 0.0, "", error=str(e) or type(e).__name__)
+    fingerprint = (path, stat.st_size, stat.st_mtime)
+    # The same key as the API's, so catalogue conversions share its caches
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash == known_hash:
+        return _Parsed(*fingerprint, content_hash)
+
+    title = os.path.basename(path)
+    parser = parser_for_content(content, path)
+    if parser is None:
+        error = "Unsupported file format"
+        return _Parsed(*fingerprint, content_hash, title=title, error=error)
+    try:
+        song = parser.parse_bytes(content)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        return _Parsed(*fingerprint, content_hash, title=title, error=error)
+    # Only what the index needs travels back with the packed song
+    tracks = tuple(
+        LibraryTrack(
+            number=t.number,
+            name=t.name,
+            program=t.program,
+            is_percussion=t.is_percussion,
+        )
+        for t in song.tracks
+    )
+    return _Parsed(
+        *fingerprint, content_hash, song_codec.dumps(song),
+        title=song.title or title, artist=song.artist or "", tracks=tracks,
+    )
+
+
+def ingest(
+    store: LibraryStore,
+    paths: Iterable[str],
+    workers: int = 1,
+    force: bool = False,
+    prune: bool = False,
+) -> IngestReport:
+    """
+    Indexes the files under `paths`. With force every file is parsed again
+    and its packed IR rewritten, with prune indexed files that are gone
+    from disk are dropped (wherever they are, not only under `paths`).
+    """
+    known = store.fingerprints()
+    files = list(library_files(paths))
+
+    pending: List[Tuple[str, Optional[str]]] = []
+    unchanged = 0
+    for path in files:
+        fingerprint = known.get(path)
+        if fingerprint and not force:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat and (stat.st_size, stat.st_mtime) == fingerprint[:2]:
+                unchanged += 1
+                continue
+        pending.append((path, None if force or not fingerprint else fingerprint[2]))
+    logger.info(
+        f"Ingesting {len(pending)} of {len(files)} files ({unchanged} unchanged)"
+    )
+
+    added = updated = failed = 0
+    for parsed in _parse_all(pending, workers):
+        if not parsed.content_hash:
+            # Not read, the index keeps whatever it had for the file
+            logger.warning(f"Failed to read {parsed.path}: {parsed.error}")
+            failed += 1
+            continue
+        if parsed.packed is None and parsed.error is None:
+            # Touched but identical
+            store.touch(parsed.path, parsed.size, parsed.mtime)
+            unchanged += 1
+            continue
+        store.put(
+            parsed.path, parsed.size, parsed.mtime, parsed.content_hash,
+            parsed.title, parsed.artist, parsed.tracks, parsed.packed, parsed.error,
+            replace=force,
+        )
+        if parsed.error:
+            logger.warning(f"Failed to ingest {parsed.path}: {parsed.error}")
+            failed += 1
+        elif parsed.path in known:
+            updated += 1
+        else:
+            added += 1
+
+    removed = 0
+    if prune:
+        # Files indexed from other roots are still there, only drop what's gone
+        seen = set(files)
+        removed = store.remove(
+            path for path in known if path not in seen and not os.path.exists(path)
+        )
+
+    return IngestReport(added, updated, unchanged, failed, removed)
+
+
+def _parse_all(
+    pending: List[Tuple[str, Optional[str]]], workers: int
+) -> Iterator[_Parsed]:
+    if workers <= 1 or len(pending) <= 1:
+        for path, known_hash in pending:
+            yield _parse_file(path, known_hash)
+        return
+    # spawn rather than fork, as for the job workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        yield from pool.map(
+            _parse_file,
+            [path for path, _ in pending],
+            [known_hash for _, known_hash in pending],
+            chunksize=max(1, len(pending) // (workers * 8)),
+        )
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    arg_parser = argparse.ArgumentParser(
+        description="Ingest Guitar Pro files into the GP2MIDI library"
+    )
+    arg_parser.add_argument("paths", nargs="+", help="Guitar Pro files or directories")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    arg_parser.add_argument(
+        "--force", action="store_true", help="parse unchanged files again"
+    )
+    arg_parser.add_argument(
+        "--prune", action="store_true", help="drop files that are gone"
+    )
+    args = arg_parser.parse_args(argv)
+
+    store = LibraryStore(args.db)
+    report = ingest(store, args.paths, args.workers, args.force, args.prune)
+    print(
+        f"{report.added} added, {report.updated} updated, "
+        f"{report.unchanged} unchanged, {report.failed} failed, "
+        f"{report.removed} removed"
+    )
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+SQLite index of a pre-parsed song library.
+
+Each ingested file is parsed once and its IR packed with song_codec into
+<songs dir>/<content hash>.gp2s, so identical files share one IR and a
+song can be opened with mmap instead of parsed again. The index keeps,
+per file path, the size and mtime it was ingested at (re-ingest skips
+unchanged files without reading them), the content hash, the song's
+title and artist and, per track, its name and program for searches.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.core.storage import song_codec
+from backend.models.library_model import LibrarySong, LibraryTrack
+from backend.models.song_model import Song
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.environ.get("GP2MIDI_LIBRARY_DB", "gp2midi_library.sqlite3")
+# Packed songs, next to the database unless set
+SONGS_DIR = os.environ.get("GP2MIDI_LIBRARY_SONGS_DIR")
+IR_EXTENSION = ".gp2s"
+MAX_PAGE_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    ingested_at REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS songs_hash ON songs (content_hash);
+CREATE INDEX IF NOT EXISTS songs_title ON songs (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS songs_artist ON songs (artist COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS tracks (
+    song_id INTEGER NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    program INTEGER NOT NULL,
+    is_percussion INTEGER NOT NULL,
+    PRIMARY KEY (song_id, number)
+);
+CREATE INDEX IF NOT EXISTS tracks_name ON tracks (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_program ON tracks (program);
+"""
+
+_SONG_COLUMNS = "id, path, content_hash, title, artist, size, mtime, ingested_at, error"
+
+
+class LibraryStore:
+    def __init__(
+        self, path: str = DEFAULT_DB_PATH, songs_dir: Optional[str] = SONGS_DIR
+    ):
+        self.path = path
+        self.songs_dir = songs_dir or os.path.splitext(path)[0] + "_songs"
+        os.makedirs(self.songs_dir, exist_ok=True)
+        with self._connect() as conn:
+            # WAL lets the API read while an ingest writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, as in JobStore
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def ir_path(self, content_hash: str) -> str:
+        return os.path.join(self.songs_dir, content_hash + IR_EXTENSION)
+
+    def fingerprints(self) -> Dict[str, Tuple[int, float, str]]:
+        """path -> (size, mtime, content hash) of every ingested file."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path, size, mtime, content_hash FROM songs"
+            ).fetchall()
+        return {path: tuple(fingerprint) for path, *fingerprint in rows}
+
+    def put(
+        self,
+        path: str,
+        size: int,
+        mtime: float,
+        content_hash: str,
+        title: str,
+        artist: str = "",
+        tracks: Iterable[LibraryTrack] = (),
+        packed: Optional[bytes] = None,
+        error: Optional[str] = None,
+        replace: bool = False,
+    ) -> int:
+        """
+        Indexes `path`. `packed` (song_codec.dumps() of the song) is written
+        unless that content is stored already, or always with replace (after
+        a parser fix or a song_codec format change); a file indexed without
+        it (and with an error) can't be converted.
+        """
+        if packed is not None:
+            target = self.ir_path(content_hash)
+            if replace or not os.path.exists(target):
+                # Readers never see a partial file
+                partial = f"{target}.{os.getpid()}.tmp"
+                with open(partial, "wb") as f:
+                    f.write(packed)
+                os.replace(partial, target)
+
+        with self._transaction() as conn:
+            previous = conn.execute(
+                "SELECT content_hash FROM songs WHERE path = ?", (path,)
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO songs "
+                "(path, content_hash, title, artist, size, mtime, ingested_at, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET "
+                "content_hash = excluded.content_hash, title = excluded.title, "
+                "artist = excluded.artist, size = excluded.size, "
+                "mtime = excluded.mtime, ingested_at = excluded.ingested_at, "
+                "error = excluded.error",
+                (path, content_hash, title, artist, size, mtime, time.time(), error),
+            )
+            song_id = conn.execute(
+                "SELECT id FROM songs WHERE path = ?", (path,)
+            ).fetchone()[0]
+            conn.execute("DELETE FROM tracks WHERE song_id = ?", (song_id,))
+            conn.executemany(
+                "INSERT INTO tracks (song_id, number, name, program, is_percussion) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (song_id, t.number, t.name, t.program, t.is_percussion)
+                    for t in tracks
+                ],
+            )
+        if previous and previous[0] != content_hash:
+            self._release([previous[0]])
+        return song_id
+
+    def touch(self, path: str, size: int, mtime: float):
+        """Records a new mtime for a file whose content didn't change."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE songs SET size = ?, mtime = ? WHERE path = ?",
+                (size, mtime, path),
+            )
+
+    def remove(self, paths: Iterable[str]) -> int:
+        hashes = []
+        with self._transaction() as conn:
+            for path in paths:
+                row = conn.execute(
+                    "DELETE FROM songs WHERE path = ? RETURNING content_hash", (path,)
+                ).fetchone()
+                if row:
+                    hashes.append(row[0])
+        self._release(hashes)
+        return len(hashes)
+
+    def get(self, song_id: int) -> Optional[LibrarySong]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {_SONG_COLUMNS} FROM songs WHERE id = ?", (song_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._with_tracks(conn, [row])[0]
+
+    def get_by_path(self, path: str) -> Optional[LibrarySong]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {_SONG_COLUMNS} FROM songs WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._with_tracks(conn, [row])[0]
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        artist: Optional[str] = None,
+        program: Optional[int] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> List[LibrarySong]:
+        """
+        Songs whose title, artist or a track name contains `query`, by
+        `artist` and with a track playing `program`, by artist and title.
+        """
+        where = ["error IS NULL"]
+        params: list = []
+        if query:
+            escaped = (
+                query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            pattern = "%" + escaped + "%"
+            where.append(
+                "(title LIKE ? ESCAPE '\\' OR artist LIKE ? ESCAPE '\\' OR id IN "
+                "(SELECT song_id FROM tracks WHERE name LIKE ? ESCAPE '\\'))"
+            )
+            params += [pattern] * 3
+        if artist:
+            where.append("artist = ? COLLATE NOCASE")
+            params.append(artist)
+        if program is not None:
+            where.append(
+                "id IN (SELECT song_id FROM tracks "
+                "WHERE program = ? AND NOT is_percussion)"
+            )
+            params.append(program)
+        params += [max(1, min(limit, MAX_PAGE_SIZE)), max(0, offset)]
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_SONG_COLUMNS} FROM songs WHERE {' AND '.join(where)} "
+                "ORDER BY artist COLLATE NOCASE, title COLLATE NOCASE, id "
+                "LIMIT ? OFFSET ?",
+                params,
+            ).fetchall()
+            return self._with_tracks(conn, rows)
+
+    def load_song(self, song: LibrarySong) -> Song:
+        """The parsed song, read from its packed IR."""
+        return song_codec.load(self.ir_path(song.content_hash))
+
+    def _with_tracks(self, conn, rows) -> List[LibrarySong]:
+        songs = [_row_to_song(row) for row in rows]
+        if not songs:
+            return songs
+        by_id = {song.id: song for song in songs}
+        placeholders = ",".join("?" * len(by_id))
+        for song_id, number, name, program, is_percussion in conn.execute(
+            "SELECT song_id, number, name, program, is_percussion FROM tracks "
+            f"WHERE song_id IN ({placeholders}) ORDER BY song_id, number",
+            list(by_id),
+        ):
+            by_id[song_id].tracks.append(LibraryTrack(
+                number=number,
+                name=name,
+                program=program,
+                is_percussion=bool(is_percussion),
+            ))
+        return songs
+
+    def _release(self, content_hashes: Iterable[str]):
+        # Packed songs no indexed file refers to anymore, identical files share one
+        with self._connect() as conn:
+            for content_hash in set(content_hashes):
+                used = conn.execute(
+                    "SELECT 1 FROM songs WHERE content_hash = ? LIMIT 1",
+                    (content_hash,),
+                ).fetchone()
+                if used is None:
+                    try:
+                        os.remove(self.ir_path(content_hash))
+                    except FileNotFoundError:
+                        pass
+
+def _row_to_song(row) -> LibrarySong:
+    song_id, path, content_hash, title, artist, size, mtime, ingested_at, error = row
+    return LibrarySong(
+        id=song_id,
+        path=path,
+        content_hash=content_hash,
+        title=title,
+        artist=artist,
+        size=size,
+        mtime=mtime,
+        ingested_at=ingested_at,
+        error=error,
+    )
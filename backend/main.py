@@ -1,8 +1,12 @@
 import logging
-import uvicorn
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from backend.api.jobs import router as jobs_router
+from backend.api.library import router as library_router
 from backend.api.router import router as api_router
+from backend.jobs.worker import EMBEDDED_WORKERS, WorkerPool
 
 # Configure Logging
 logging.basicConfig(
@@ -11,7 +15,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="GP2MIDI Converter", version="2.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conversion jobs run in worker processes, external ones unless
+    # GP2MIDI_JOB_WORKERS asks for a few next to the API
+    pool = None
+    if EMBEDDED_WORKERS > 0:
+        pool = WorkerPool(EMBEDDED_WORKERS)
+        pool.start()
+    try:
+        yield
+    finally:
+        if pool:
+            pool.stop()
+
+
+app = FastAPI(title="GP2MIDI Converter", version="2.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +42,8 @@ app.add_middleware(
 )
 
 app.include_router(api_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+app.include_router(library_router, prefix="/api")
 
 @app.get("/health")
 async def health_check():
@@ -29,4 +51,6 @@ async def health_check():
     return {"status": "ok", "message": "GP2MIDI Backend is running V2.0"}
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
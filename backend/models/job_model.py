@@ -0,0 +1,43 @@
+from enum import Enum
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobOptions(BaseModel):
+    high_fidelity: bool = True
+    selected_tracks: List[int] = []
+    compact: bool = False
+    allocation: Literal["strings", "interval"] = "strings"
+
+
+class Job(BaseModel):
+    id: str
+    status: JobStatus
+    filename: str
+    options: JobOptions
+    attempts: int = 0
+    progress_done: int = 0
+    progress_total: int = 0
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+
+class JobEvent(BaseModel):
+    id: int
+    job_id: str
+    event: str  # "status", "progress", "done", "failed"
+    data: dict
@@ -0,0 +1,24 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class LibraryTrack(BaseModel):
+    number: int
+    name: str
+    program: int
+    is_percussion: bool
+
+
+class LibrarySong(BaseModel):
+    id: int
+    path: str
+    content_hash: str
+    title: str
+    artist: str
+    tracks: List[LibraryTrack] = []
+    size: int
+    mtime: float
+    ingested_at: float
+    # Set when the file couldn't be parsed, such songs have no IR
+    error: Optional[str] = None
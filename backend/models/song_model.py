@@ -23,6 +23,22 @@ class EffectType(Enum):
     VIBRATO = "vibrato"
 
 
+# NoteEffect.value by effect type:
+# - SLIDE: the slide flags below (same bits as Guitar Pro 5 and GPIF)
+# - VIBRATO: depth in semitones
+# - TRILL: fret of the other note, on the same string
+# HAMMER/PULL mark the first note of a legato pair, PALM_MUTE has no value.
+SLIDE_SHIFT = 0x01
+SLIDE_LEGATO = 0x02
+SLIDE_OUT_DOWN = 0x04
+SLIDE_OUT_UP = 0x08
+SLIDE_IN_BELOW = 0x10
+SLIDE_IN_ABOVE = 0x20
+
+VIBRATO_SLIGHT = 0.25
+VIBRATO_WIDE = 0.5
+
+
 class BendPoint(BaseModel):
     position: int  # 0 to 100 type scale or 0-12
     value: int  # semitones * 2? 1/4 tones? specific GP value
@@ -52,6 +68,7 @@ class Beat(BaseModel):
     duration: int  # Ticks
     notes: List[Note] = []
     text: Optional[str] = None
+    voice: int = 0  # 0-based voice within the measure
 
 
 class Measure(BaseModel):
@@ -0,0 +1,443 @@
+"""
+Differential harness: runs Guitar Pro files through a reference and a fast
+implementation of the same step and reports where their output differs.
+
+Pairs (see PAIRS):
+- binary:    PyGuitarPro mapping vs. the native GP3-5 reader
+- xml:       whole score.gpif tree vs. the streaming (iterparse) loader
+- encoder:   mido MidiFile.save() vs. the direct MTrk encoder
+- scheduler: per-string channels vs. interval channel allocation
+- compact:   full output vs. compacted output
+- pipeline:  parse then write vs. writing tracks while they are parsed
+
+Parsers are compared on the IR (Song.model_dump()), writers on what the
+MIDI file plays: notes with their start, end, velocity, program, controls
+and bend curve, plus meta events. Channels are left out, they are what the
+schedulers are free to change. Each file reports its first divergence and
+the speedup of the fast side.
+
+    python backend/tests/differential.py [FILE_OR_DIR ...] [--pairs binary,xml]
+        [--repeat 3] [--synthetic]
+
+Without files the checked-in fixtures (tests/fixtures) and the synthetic
+corpus (gpif_factory plus GP3-5 files written by PyGuitarPro) are used.
+"""
+import argparse
+import bisect
+import io
+import math
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter.channel_plan import INTERVAL
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.registry import (
+    BINARY,
+    GPX,
+    ZIP,
+    parser_for_content,
+    sniff_format,
+)
+from backend.core.parser.xml_parser import XmlParser
+from backend.core.pipeline import convert_pipelined
+from backend.models.song_model import Song
+from gpif_factory import build_gp
+
+PARSE = "parse"
+WRITE = "write"
+CONVERT = "convert"
+
+EXTENSIONS = (".gp", ".gpx", ".gp3", ".gp4", ".gp5")
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Bends are compared in semitones, rounded to absorb the 14-bit wheel
+BEND_DIGITS = 3
+
+
+class Pair(NamedTuple):
+    # PARSE: content -> Song, WRITE: Song -> MIDI bytes, CONVERT: content
+    # -> MIDI bytes
+    kind: str
+    formats: Tuple[str, ...]
+    reference: Callable
+    candidate: Callable
+
+
+class FileResult(NamedTuple):
+    name: str
+    pair: str
+    divergence: Optional[str]
+    reference_seconds: float
+    candidate_seconds: float
+
+    @property
+    def speedup(self) -> float:
+        if not self.candidate_seconds:
+            return math.inf
+        return self.reference_seconds / self.candidate_seconds
+
+
+def _mido_midi(song: Song) -> bytes:
+    # What the writer produced before tracks were encoded one by one
+    writer = MidiWriter(song)
+    midi_file = mido.MidiFile(ticks_per_beat=writer.ticks_per_beat)
+    midi_file.tracks.append(mido.MidiTrack([
+        mido.MetaMessage("set_tempo", tempo=mido.bpm2tempo(song.tempo), time=0),
+        mido.MetaMessage("end_of_track", time=0),
+    ]))
+    for track in song.tracks:
+        midi_file.tracks.append(writer._process_track(track))
+    buffer = io.BytesIO()
+    midi_file.save(file=buffer)
+    return buffer.getvalue()
+
+
+def _midi(**options) -> Callable[[Song], bytes]:
+    def write(song: Song) -> bytes:
+        buffer = io.BytesIO()
+        MidiWriter(song, **options).write(file=buffer)
+        return buffer.getvalue()
+    return write
+
+
+def _sequential_midi(content: bytes) -> bytes:
+    return _midi()(parser_for_content(content).parse_bytes(content))
+
+
+PAIRS: Dict[str, Pair] = {
+    "binary": Pair(
+        PARSE, (BINARY,),
+        lambda content: BinaryParser(native=False).parse_bytes(content),
+        lambda content: BinaryParser(native=True).parse_bytes(content),
+    ),
+    "xml": Pair(
+        PARSE, (ZIP, GPX),
+        lambda content: XmlParser().parse_bytes(content),
+        lambda content: XmlParser().parse_preview_bytes(content, math.inf),
+    ),
+    "encoder": Pair(WRITE, (ZIP, GPX, BINARY), _mido_midi, _midi()),
+    "scheduler": Pair(WRITE, (ZIP, GPX, BINARY), _midi(), _midi(allocation=INTERVAL)),
+    "compact": Pair(WRITE, (ZIP, GPX, BINARY), _midi(), _midi(compact=True)),
+    "pipeline": Pair(
+        CONVERT, (ZIP, GPX, BINARY),
+        _sequential_midi,
+        lambda content: convert_pipelined(parser_for_content(content), content),
+    ),
+}
+
+
+def ir_divergence(expected: Song, actual: Song) -> Optional[str]:
+    """Path and values of the first field that differs, None if none does."""
+    return _first_difference(expected.model_dump(), actual.model_dump(), "song")
+
+
+def _first_difference(expected, actual, path: str) -> Optional[str]:
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected.keys() | actual.keys():
+            if key not in actual or key not in expected:
+                side = "reference" if key in expected else "candidate"
+                return f"{path}.{key}: only in {side}"
+        for key in expected:
+            found = _first_difference(expected[key], actual[key], f"{path}.{key}")
+            if found:
+                return found
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        for i, (want, got) in enumerate(zip(expected, actual)):
+            found = _first_difference(want, got, f"{path}[{i}]")
+            if found:
+                return found
+        if len(expected) != len(actual):
+            return f"{path}: {len(expected)} items != {len(actual)}"
+        return None
+    if expected != actual:
+        return f"{path}: {expected!r} != {actual!r}"
+    return None
+
+
+class _Timeline:
+    # Values of a channel setting over time, the last one written at a tick
+    # wins (events sharing a tick may come in any order) and rewriting the
+    # current value changes nothing
+    def __init__(self):
+        self.ticks: Dict[object, List[int]] = {}
+        self.values: Dict[object, list] = {}
+
+    def set(self, key, tick: int, value):
+        ticks = self.ticks.setdefault(key, [])
+        values = self.values.setdefault(key, [])
+        if ticks and ticks[-1] == tick:
+            ticks.pop()
+            values.pop()
+        if values and values[-1] == value:
+            return
+        ticks.append(tick)
+        values.append(value)
+
+    def at(self, key, tick: int, default=None):
+        ticks = self.ticks.get(key)
+        if not ticks:
+            return default
+        i = bisect.bisect_right(ticks, tick)
+        return self.values[key][i - 1] if i else default
+
+    def changes(self, key, start: int, end: int) -> list:
+        # (tick, value) strictly inside (start, end)
+        ticks = self.ticks.get(key)
+        if not ticks:
+            return []
+        lo = bisect.bisect_right(ticks, start)
+        hi = bisect.bisect_left(ticks, end)
+        return list(zip(ticks[lo:hi], self.values[key][lo:hi]))
+
+
+def heard(midi_bytes: bytes) -> List[Tuple[list, list]]:
+    """
+    (meta events, notes) of every track as they play. A note is (start,
+    end, key, velocity, program, controls, bend at start, bend changes
+    while it sounds), channels left out.
+    """
+    midi = mido.MidiFile(file=io.BytesIO(midi_bytes))
+    events = []
+    for index, track in enumerate(midi.tracks):
+        now = 0
+        for order, msg in enumerate(track):
+            now += msg.time
+            events.append((now, index, order, msg))
+    # The order a player merges tracks in, as mido.merge_tracks()
+    events.sort(key=lambda e: e[:3])
+
+    programs = _Timeline()
+    controls = _Timeline()
+    bends = _Timeline()
+    ranges: Dict[int, list] = {}
+    selected: Dict[int, list] = {}
+    opened: Dict[Tuple[int, int], list] = {}
+    tracks = [([], []) for _ in midi.tracks]
+    notes = []
+    for now, index, _, msg in events:
+        if msg.is_meta:
+            if msg.type != "end_of_track":
+                fields = {k: v for k, v in vars(msg).items() if k != "time"}
+                tracks[index][0].append((now, sorted(fields.items())))
+            continue
+        channel = getattr(msg, "channel", None)
+        if msg.type == "note_on" and msg.velocity:
+            started = (now, index, msg.velocity)
+            opened.setdefault((channel, msg.note), []).append(started)
+        elif msg.type in ("note_on", "note_off"):
+            started = opened.get((channel, msg.note))
+            if started:
+                start, track_index, velocity = started.pop(0)
+                notes.append((track_index, channel, start, now, msg.note, velocity))
+        elif msg.type == "pitchwheel":
+            semitones, cents = ranges.get(channel, (2, 0))
+            bend = msg.pitch / 8192 * (semitones + cents / 100)
+            bends.set(channel, now, round(bend, BEND_DIGITS))
+        elif msg.type == "program_change":
+            programs.set(channel, now, msg.program)
+        elif msg.type == "control_change":
+            parameter = selected.setdefault(channel, [None, None])
+            if msg.control in (101, 100):
+                parameter[msg.control - 100] = msg.value
+            elif msg.control in (99, 98):
+                parameter[:] = [None, None]
+            elif msg.control in (6, 38):
+                if parameter == [0, 0]:
+                    ranges.setdefault(channel, [2, 0])[msg.control == 38] = msg.value
+            else:
+                controls.set((channel, msg.control), now, msg.value)
+
+    for track_index, channel, start, end, key, velocity in notes:
+        state = tuple(
+            (control, controls.at((channel, control), start))
+            for control in sorted(c for ch, c in controls.ticks if ch == channel)
+            if controls.at((channel, control), start) is not None
+        )
+        tracks[track_index][1].append((
+            start, end, key, velocity, programs.at(channel, start), state,
+            bends.at(channel, start, 0.0), tuple(bends.changes(channel, start, end)),
+        ))
+    for metas, track_notes in tracks:
+        metas.sort()
+        track_notes.sort()
+    return tracks
+
+
+def midi_divergence(expected: bytes, actual: bytes) -> Optional[str]:
+    """The first meta event or note heard differently, None if none is."""
+    want, got = heard(expected), heard(actual)
+    if len(want) != len(got):
+        return f"{len(want)} tracks != {len(got)}"
+    for index, ((want_metas, want_notes), (got_metas, got_notes)) in enumerate(
+        zip(want, got)
+    ):
+        sides = (("meta", want_metas, got_metas), ("note", want_notes, got_notes))
+        for label, a, b in sides:
+            for i, (x, y) in enumerate(zip(a, b)):
+                if x != y:
+                    return f"track {index} {label} {i}: {x} != {y}"
+            if len(a) != len(b):
+                return f"track {index}: {len(a)} {label} events != {len(b)}"
+    return None
+
+
+def _timed(function: Callable, argument, repeat: int):
+    # Best of `repeat` runs
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(argument)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def run_file(
+    name: str, content: bytes, pairs: Iterable[str], repeat: int = 1
+) -> List[FileResult]:
+    """Runs `content` through every pair that applies to its format."""
+    file_format = sniff_format(content)
+    song = None
+    results = []
+    for pair_name in pairs:
+        pair = PAIRS[pair_name]
+        if file_format not in pair.formats:
+            continue
+        if pair.kind != WRITE:
+            argument = content
+        else:
+            if song is None:
+                song = parser_for_content(content, name).parse_bytes(content)
+            argument = song
+        try:
+            expected, reference_seconds = _timed(pair.reference, argument, repeat)
+            actual, candidate_seconds = _timed(pair.candidate, argument, repeat)
+        except Exception as e:
+            error = f"raised {type(e).__name__}: {e}"
+            results.append(FileResult(name, pair_name, error, 0.0, 0.0))
+            continue
+        compare = ir_divergence if pair.kind == PARSE else midi_divergence
+        results.append(FileResult(
+            name, pair_name, compare(expected, actual),
+            reference_seconds, candidate_seconds,
+        ))
+    return results
+
+
+def build_binary(num_tracks=1, num_bars=4, version=(5, 1, 0), bends=False) -> bytes:
+    """A GP3-5 file written by PyGuitarPro, quarter notes up the strings."""
+    import guitarpro
+    from guitarpro import models as gp
+
+    song = gp.Song()
+    song.title = "Synthetic"
+    song.artist = "Differential"
+    for number in range(2, num_bars + 1):
+        song.addMeasureHeader(gp.MeasureHeader(number=number))
+    for t in range(num_tracks):
+        if t == 0:
+            track = song.tracks[0]
+        else:
+            track = gp.Track(song, number=t + 1)
+            tuning = [64, 59, 55, 50, 45, 40]
+            track.strings = [gp.GuitarString(i + 1, v) for i, v in enumerate(tuning)]
+            track.channel = gp.MidiChannel(channel=t, effectChannel=t, instrument=29)
+            song.tracks.append(track)
+        track.name = f"Track {t + 1}"
+        track.measures = [gp.Measure(track, header) for header in song.measureHeaders]
+        for b, measure in enumerate(track.measures):
+            voice = measure.voices[0]
+            for n in range(4):
+                beat = gp.Beat(voice)
+                beat.duration = gp.Duration(value=4)
+                note = gp.Note(
+                    beat, value=(b + n) % 12, string=n % 6 + 1, type=gp.NoteType.normal
+                )
+                if bends and n == 0:
+                    note.effect.bend = gp.BendEffect(
+                        type=gp.BendType.bend, value=100,
+                        points=[
+                            gp.BendPoint(0, 0), gp.BendPoint(6, 4), gp.BendPoint(12, 4)
+                        ],
+                    )
+                beat.notes.append(note)
+                voice.beats.append(beat)
+    stream = io.BytesIO()
+    guitarpro.write(song, stream, version=version)
+    return stream.getvalue()
+
+
+def synthetic_corpus(scale: int = 1) -> Iterable[Tuple[str, bytes]]:
+    bars = 16 * scale
+    yield "gp7-plain", build_gp(num_tracks=2, num_bars=bars)
+    yield "gp7-bends", build_gp(num_tracks=2, num_bars=bars, bends=True)
+    yield "gp7-articulations", build_gp(num_tracks=1, num_bars=bars, articulations=True)
+    for version in ((3, 0, 0), (4, 0, 0), (5, 1, 0)):
+        yield f"gp{version[0]}-bends", build_binary(
+            num_tracks=2, num_bars=bars, version=version, bends=True
+        )
+
+
+def corpus_files(paths: Iterable[str]) -> Iterable[Tuple[str, bytes]]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in sorted(files):
+                    if filename.lower().endswith(EXTENSIONS):
+                        yield from corpus_files([os.path.join(root, filename)])
+            continue
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", help="Guitar Pro files or directories")
+    parser.add_argument(
+        "--pairs", default=",".join(PAIRS),
+        help="comma separated, of " + ", ".join(PAIRS),
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per side, the best one is timed"
+    )
+    parser.add_argument(
+        "--synthetic", action="store_true", help="add the synthetic corpus"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="size of the synthetic files"
+    )
+    args = parser.parse_args(argv)
+
+    pairs = [p.strip() for p in args.pairs.split(",") if p.strip()]
+    unknown = [p for p in pairs if p not in PAIRS]
+    if unknown:
+        parser.error(f"unknown pairs: {', '.join(unknown)}")
+    corpus = list(corpus_files(args.paths or [FIXTURES]))
+    if args.synthetic or not args.paths:
+        corpus += list(synthetic_corpus(args.scale))
+
+    diverged = 0
+    for name, content in corpus:
+        for result in run_file(name, content, pairs, args.repeat):
+            timing = (
+                f"{result.reference_seconds * 1000:8.1f} ms -> "
+                f"{result.candidate_seconds * 1000:8.1f} ms  x{result.speedup:.2f}"
+            )
+            status = "ok"
+            if result.divergence is not None:
+                status = f"DIVERGES {result.divergence}"
+            print(f"{result.name:<28} {result.pair:<10} {timing}  {status}")
+            diverged += result.divergence is not None
+    print(f"{diverged} divergence(s)")
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
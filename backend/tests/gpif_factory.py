@@ -0,0 +1,207 @@
+"""
+Builds small synthetic Guitar Pro 6 (.gpx) and 7 (.gp) files for tests.
+
+Every bar, voice, beat and note gets its own id, mirroring how Guitar Pro
+lays out score.gpif (MasterTrack, Tracks, MasterBars, Bars, Voices, Beats,
+Notes, Rhythms).
+"""
+import io
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+
+NS = "http://www.guitar-pro.com/GPIF/1.0"
+
+
+def _sub(parent, tag, text=None, **attrib):
+    elem = ET.SubElement(parent, f"{{{NS}}}{tag}", attrib)
+    if text is not None:
+        elem.text = str(text)
+    return elem
+
+
+def build_gpif(
+    num_tracks=1,
+    num_bars=4,
+    notes_per_bar=4,
+    tempo=120,
+    time="4/4",
+    pitch=60,
+    bends=False,
+    track_names=None,
+    articulations=False,
+):
+    """Returns the score.gpif XML bytes of a synthetic score."""
+    ET.register_namespace("", NS)
+    root = ET.Element(f"{{{NS}}}GPIF")
+
+    score = _sub(root, "Score")
+    _sub(score, "Title", "Synthetic")
+    _sub(score, "Artist", "Factory")
+
+    mt = _sub(root, "MasterTrack")
+    _sub(mt, "Tracks", " ".join(str(i) for i in range(num_tracks)))
+    automations = _sub(mt, "Automations")
+    auto = _sub(automations, "Automation")
+    _sub(auto, "Type", "Tempo")
+    _sub(auto, "Value", f"{tempo} 2")
+
+    tracks = _sub(root, "Tracks")
+    for t in range(num_tracks):
+        track = _sub(tracks, "Track", id=str(t))
+        name = track_names[t] if track_names else f"Track {t + 1}"
+        _sub(track, "Name", name)
+        midi = _sub(_sub(_sub(track, "Sounds"), "Sound"), "MIDI")
+        _sub(midi, "Program", "29")
+
+    master_bars = _sub(root, "MasterBars")
+    bars = _sub(root, "Bars")
+    voices = _sub(root, "Voices")
+    beats = _sub(root, "Beats")
+    notes = _sub(root, "Notes")
+
+    next_id = 0
+    for b in range(num_bars):
+        mb = _sub(master_bars, "MasterBar")
+        _sub(mb, "Time", time)
+        bar_ids = []
+        for t in range(num_tracks):
+            bar_id, voice_id = next_id, next_id + 1
+            next_id += 2
+            bar_ids.append(str(bar_id))
+            _sub(_sub(bars, "Bar", id=str(bar_id)), "Voices", voice_id)
+
+            beat_ids = []
+            for n in range(notes_per_bar):
+                beat_id, note_id = next_id, next_id + 1
+                next_id += 2
+                beat_ids.append(str(beat_id))
+
+                beat = _sub(beats, "Beat", id=str(beat_id))
+                _sub(beat, "Rhythm", ref="0")
+                _sub(beat, "Notes", note_id)
+
+                note = _sub(notes, "Note", id=str(note_id))
+                props = _sub(note, "Properties")
+                _sub(_sub(props, "Property", name="Midi"), "Number", pitch + n)
+                _sub(_sub(props, "Property", name="String"), "String", n % 6)
+                if bends:
+                    p_bends = _sub(props, "Property", name="Bends")
+                    for pos, val in ((0, 0), (50, 50), (100, 100)):
+                        pt = _sub(p_bends, "Point")
+                        _sub(pt, "Position", pos)
+                        _sub(pt, "Value", val)
+                if articulations:
+                    # Cycles through vibrato, a legato slide into the next
+                    # note, a hammer-on and a palm muted trill
+                    kind = n % 4
+                    if kind == 0:
+                        _sub(note, "Vibrato", "Wide")
+                    elif kind == 1:
+                        _sub(_sub(props, "Property", name="Slide"), "Flags", 2)
+                    elif kind == 2:
+                        _sub(_sub(props, "Property", name="HopoOrigin"), "Enable")
+                    else:
+                        _sub(note, "Trill", pitch + n + 2)
+                        _sub(_sub(props, "Property", name="PalmMuted"), "Enable")
+            _sub(_sub(voices, "Voice", id=str(voice_id)), "Beats", " ".join(beat_ids))
+        _sub(mb, "Bars", " ".join(bar_ids))
+
+    rhythms = _sub(root, "Rhythms")
+    _sub(_sub(rhythms, "Rhythm", id="0"), "NoteValue", "Quarter")
+
+    return ET.tostring(root, encoding="utf-8")
+
+
+def build_gp(**kwargs):
+    """Returns the bytes of a zipped .gp file wrapping build_gpif(**kwargs)."""
+    bio = io.BytesIO()
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Content/score.gpif", build_gpif(**kwargs))
+    return bio.getvalue()
+
+
+def build_bcfs(files):
+    """BCFS image (header included) holding `files`, a name -> bytes dict."""
+    sector = 0x1000
+    # Sector 0 is unused, file entries and their data follow
+    sectors = [bytes(sector)]
+    for name, data in files.items():
+        data_count = (len(data) + sector - 1) // sector
+        first = len(sectors) + 1
+        entry = bytearray(sector)
+        struct.pack_into("<i", entry, 0, 2)
+        entry[4:4 + len(name)] = name.encode("latin-1")
+        struct.pack_into("<i", entry, 0x8C, len(data))
+        for i in range(data_count):
+            struct.pack_into("<i", entry, 0x94 + 4 * i, first + i)
+        sectors.append(bytes(entry))
+        for i in range(data_count):
+            sectors.append(data[i * sector:(i + 1) * sector].ljust(sector, b"\x00"))
+    return b"BCFS" + b"".join(sectors)
+
+
+class _BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def write(self, value, count):
+        # Most significant bit first
+        self.bits.extend((value >> (count - 1 - i)) & 1 for i in range(count))
+
+    def write_reversed(self, value, count):
+        self.bits.extend((value >> i) & 1 for i in range(count))
+
+    def getvalue(self):
+        bits = self.bits + [0] * (-len(self.bits) % 8)
+        return bytes(
+            int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)
+        )
+
+
+def compress_bcfz(data):
+    """Greedy BCFZ encoder, good enough to exercise both chunk kinds."""
+    writer = _BitWriter()
+    last_seen = {}
+    literals = bytearray()
+
+    def flush_literals():
+        for i in range(0, len(literals), 3):
+            run = literals[i:i + 3]
+            writer.write(0, 1)
+            writer.write_reversed(len(run), 2)
+            for byte in run:
+                writer.write(byte, 8)
+        literals.clear()
+
+    i = 0
+    while i < len(data):
+        key = data[i:i + 4]
+        start = last_seen.get(key)
+        last_seen[key] = i
+        if start is not None and len(key) == 4 and 4 <= i - start < (1 << 15):
+            offset = i - start
+            size = 4
+            while (i + size < len(data) and size < offset and size < (1 << 15) - 1
+                   and data[start + size] == data[i + size]):
+                size += 1
+            flush_literals()
+            width = max(offset.bit_length(), size.bit_length())
+            writer.write(1, 1)
+            writer.write(width, 4)
+            writer.write_reversed(offset, width)
+            writer.write_reversed(size, width)
+            i += size
+        else:
+            literals.append(data[i])
+            i += 1
+    flush_literals()
+    return b"BCFZ" + struct.pack("<i", len(data)) + writer.getvalue()
+
+
+def build_gpx(compressed=True, extra_files=None, **kwargs):
+    """Returns the bytes of a GP6 .gpx file wrapping build_gpif(**kwargs)."""
+    files = {"score.gpif": build_gpif(**kwargs)}
+    files.update(extra_files or {})
+    image = build_bcfs(files)
+    return compress_bcfz(image) if compressed else image
@@ -0,0 +1,258 @@
+"""
+Load harness: replays a mix of analyze/convert/preview requests over a
+corpus of Guitar Pro files at a given concurrency and reports, per
+scenario, requests/sec, p50/p95/p99 latency, error rate and peak RSS.
+
+By default backend.main:app is driven in-process through httpx's ASGI
+transport (no lifespan: the embedded job workers aren't started). With
+--url the same requests go to a running server, e.g. a local uvicorn:
+
+    uvicorn backend.main:app --workers 2 &
+    python backend/tests/load_harness.py --url http://127.0.0.1:8000 --server-pid $!
+
+Peak RSS is sampled from /proc/<pid>/statm while a scenario runs: this
+process in-process, the --server-pid process (n/a without it) otherwise.
+Files repeat across requests like real re-conversions do, so later
+requests are served from the speculation and track caches.
+
+    python backend/tests/load_harness.py [FILE_OR_DIR ...] [--scenarios analyze,mixed]
+        [--concurrency 8] [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from differential import FIXTURES, corpus_files, synthetic_corpus
+
+# Request kind -> (path, query parameters)
+REQUESTS: Dict[str, Tuple[str, dict]] = {
+    "analyze": ("/api/analyze", {}),
+    "convert": ("/api/convert", {}),
+    "preview": ("/api/preview", {}),
+}
+
+# Scenario -> weight of each request kind
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    "analyze": {"analyze": 1},
+    "convert": {"convert": 1},
+    "preview": {"preview": 1},
+    "mixed": {"analyze": 2, "convert": 2, "preview": 1},
+}
+
+RSS_SAMPLE_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class ScenarioReport(NamedTuple):
+    name: str
+    concurrency: int
+    seconds: float
+    # Seconds per completed request, in completion order
+    latencies: List[float]
+    statuses: Counter  # HTTP status (or exception name) -> count
+    peak_rss: Optional[int]  # Bytes
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(n for status, n in self.statuses.items() if not _succeeded(status))
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def percentile(self, p: float) -> float:
+        return percentile(sorted(self.latencies), p)
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile (0-100) of sorted values, 0 when empty."""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[min(len(ordered), int(rank)) - 1]
+
+
+def _succeeded(status) -> bool:
+    return isinstance(status, int) and 200 <= status < 300
+
+
+def rss(pid: int) -> Optional[int]:
+    """Resident set size of `pid` in bytes, None if it can't be read."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        if pid == os.getpid():
+            # ru_maxrss is in kilobytes on Linux, the peak of the process
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return None
+
+
+def plan_requests(
+    mix: Dict[str, int], corpus: List[Tuple[str, bytes]], count: int, seed: int = 0
+) -> List[Tuple[str, str, bytes]]:
+    """(kind, filename, content) of `count` requests, the same for a seed."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(kind,) + corpus[i % len(corpus)] for i, kind in enumerate(kinds)]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    corpus: List[Tuple[str, bytes]],
+    concurrency: int = 8,
+    requests: int = 100,
+    seed: int = 0,
+    pid: Optional[int] = None,
+) -> ScenarioReport:
+    """Sends `requests` requests of scenario `name`, `concurrency` at a time."""
+    pending = iter(plan_requests(SCENARIOS[name], corpus, requests, seed))
+    latencies = []
+    statuses = Counter()
+    peak = [rss(pid) if pid else None]
+
+    async def worker():
+        for kind, filename, content in pending:
+            path, params = REQUESTS[kind]
+            started = time.perf_counter()
+            try:
+                files = {"file": (filename, content)}
+                response = await client.post(path, params=params, files=files)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    async def sample_rss():
+        while True:
+            current = rss(pid)
+            if current is not None:
+                peak[0] = max(peak[0] or 0, current)
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+    sampler = asyncio.ensure_future(sample_rss()) if pid else None
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        seconds = time.perf_counter() - started
+        if sampler:
+            sampler.cancel()
+    if pid:
+        current = rss(pid)
+        if current is not None:
+            peak[0] = max(peak[0] or 0, current)
+    return ScenarioReport(name, concurrency, seconds, latencies, statuses, peak[0])
+
+
+def client_for(url: Optional[str]) -> httpx.AsyncClient:
+    """A client for the server at `url`, or for the app in-process."""
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=None)
+    from backend.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://gp2midi", timeout=None
+    )
+
+
+async def run(
+    scenarios: List[str],
+    corpus: List[Tuple[str, bytes]],
+    url: Optional[str] = None,
+    server_pid: Optional[int] = None,
+    concurrency: int = 8,
+    requests: int = 100,
+    seed: int = 0,
+) -> List[ScenarioReport]:
+    pid = server_pid if url else os.getpid()
+    reports = []
+    async with client_for(url) as client:
+        for name in scenarios:
+            report = await run_scenario(
+                client, name, corpus, concurrency, requests, seed, pid
+            )
+            reports.append(report)
+    return reports
+
+
+def format_report(report: ScenarioReport) -> str:
+    peak = f"{report.peak_rss / 2**20:7.1f} MiB" if report.peak_rss else "    n/a    "
+    failures = ", ".join(
+        f"{status}: {n}" for status, n in sorted(report.statuses.items(), key=str)
+        if not _succeeded(status)
+    )
+    return (
+        f"{report.name:<10} c={report.concurrency:<3} n={report.requests:<5}"
+        f" {report.throughput:8.1f} req/s"
+        f"  p50 {report.percentile(50) * 1000:7.1f} ms"
+        f"  p95 {report.percentile(95) * 1000:7.1f} ms"
+        f"  p99 {report.percentile(99) * 1000:7.1f} ms"
+        f"  errors {report.error_rate:6.1%}  peak RSS {peak}"
+        + (f"  ({failures})" if failures else "")
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", help="Guitar Pro files or directories")
+    parser.add_argument("--url", help="server to load instead of the in-process app")
+    parser.add_argument(
+        "--server-pid", type=int, help="process whose RSS to sample with --url"
+    )
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS), help="of " + ", ".join(SCENARIOS)
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scale", type=int, default=1, help="size of the synthetic files"
+    )
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    corpus = list(corpus_files(args.paths or [FIXTURES]))
+    if not args.paths:
+        corpus += list(synthetic_corpus(args.scale))
+
+    reports = asyncio.run(run(
+        scenarios,
+        corpus,
+        args.url,
+        args.server_pid,
+        args.concurrency,
+        args.requests,
+        args.seed,
+    ))
+    for report in reports:
+        print(format_report(report))
+    return 1 if any(report.errors for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import asyncio
+import io
+import os
+import sys
+import unittest
+import zipfile
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api.admission import (
+    BYTES_PER_SLOT,
+    AdmissionController,
+    AdmissionRejected,
+    estimate_weight,
+)
+from backend.main import app
+from gpif_factory import build_gp
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_for_capacity_in_fifo_order(self):
+        controller = AdmissionController(capacity=2, max_waiting=4, timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def request(name, weight):
+            async with controller.admit(weight):
+                order.append(name)
+                await release.wait()
+
+        big = asyncio.create_task(request("big", 2))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(request(n, 1)) for n in ("a", "b")]
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(order, ["big"])
+        self.assertEqual(controller.metrics()["waiting"], 2)
+
+        release.set()
+        await asyncio.gather(big, *waiting)
+        self.assertEqual(order, ["big", "a", "b"])
+        self.assertEqual(controller.in_flight, 0)
+
+        metrics = controller.metrics()
+        self.assertEqual(metrics["admitted_total"], 3)
+        self.assertGreater(metrics["queue_wait_seconds_max"], 0)
+
+    async def test_rejects_when_queue_is_full(self):
+        controller = AdmissionController(capacity=1, max_waiting=0, timeout=5)
+        async with controller.admit(1):
+            with self.assertRaises(AdmissionRejected) as ctx:
+                async with controller.admit(1):
+                    pass
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(controller.metrics()["rejected_full_total"], 1)
+
+    async def test_timeout_leaves_queue_consistent(self):
+        controller = AdmissionController(capacity=2, max_waiting=4, timeout=0.05)
+        async with controller.admit(2):
+            with self.assertRaises(AdmissionRejected):
+                async with controller.admit(1):
+                    pass
+            self.assertEqual(controller.metrics()["waiting"], 0)
+        self.assertEqual(controller.in_flight, 0)
+        self.assertEqual(controller.metrics()["rejected_timeout_total"], 1)
+
+        # Oversized requests are clamped to the capacity instead of never running
+        async with controller.admit(100):
+            self.assertEqual(controller.in_flight, 2)
+
+    def test_estimate_weight(self):
+        self.assertEqual(estimate_weight(b"x" * 10, capacity=8), 1)
+        self.assertEqual(estimate_weight(b"x" * (BYTES_PER_SLOT * 3), capacity=8), 3)
+        self.assertEqual(estimate_weight(b"x" * (BYTES_PER_SLOT * 30), capacity=8), 8)
+        # Zipped GPIF is weighted by its uncompressed XML
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("Content/score.gpif", b" " * (BYTES_PER_SLOT * 12 * 5))
+        self.assertLess(len(buffer.getvalue()), BYTES_PER_SLOT)
+        self.assertEqual(estimate_weight(buffer.getvalue(), capacity=8), 5)
+
+
+class TestAdmissionApi(unittest.TestCase):
+    def test_busy_server_returns_503(self):
+        controller = AdmissionController(capacity=1, max_waiting=0, timeout=1)
+        controller.in_flight = 1
+        client = TestClient(app)
+        with mock.patch("backend.api.router.admission", controller):
+            response = client.post(
+                "/api/convert", files={"file": ("song.gp", build_gp(num_bars=2))}
+            )
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Retry-After", response.headers)
+
+            metrics = client.get("/api/metrics").json()["admission"]
+            self.assertEqual(metrics["rejected_full_total"], 1)
+
+            controller.in_flight = 0
+            response = client.post(
+                "/api/convert", files={"file": ("song.gp", build_gp(num_bars=2))}
+            )
+            self.assertEqual(response.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -94,11 +94,8 @@ class TestBendLogic(unittest.TestCase):
         
         # 3. Write MIDI
         writer = MidiWriter(song)
-        # We need check output. Writer doesn't return object easily unless we check internal midi_file
-        # but the `write` method populates `self.midi_file`
-        
-        # We can simulate write by calling _process_track directly or just writer method that saves to bio
-        # But `midi_writer.py` implementation of `write` populates `self.midi_file`
+        # write() only emits encoded bytes, the track's messages come from
+        # _process_track
         
         track = song.tracks[0]
         midi_track = writer._process_track(track)
@@ -0,0 +1,131 @@
+import io
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+import zipfile
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core import budget as budget_module
+from backend.core.budget import BudgetExceeded, ParseBudget
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from backend.models.song_model import (
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+from gpif_factory import build_gpif
+
+NS = "{http://www.guitar-pro.com/GPIF/1.0}"
+
+
+def zip_score(xml: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Content/score.gpif", xml)
+    return buffer.getvalue()
+
+
+def padded_score(padding: int) -> bytes:
+    # Valid GPIF followed by whitespace, compresses to almost nothing
+    return zip_score(build_gpif(num_bars=1) + b" " * padding)
+
+
+def repeated_beats_score(repeat: int) -> bytes:
+    # One Voice pointing at the same Beat `repeat` times
+    root = ET.fromstring(build_gpif(num_bars=1))
+    beats = root.find(f"{NS}Voices/{NS}Voice/{NS}Beats")
+    beats.text = " ".join([beats.text.split()[0]] * repeat)
+    return zip_score(ET.tostring(root))
+
+
+class TestParseBudget(unittest.TestCase):
+    def test_decompressed_bytes(self):
+        content = padded_score(1024 * 1024)
+        self.assertLess(len(content), 64 * 1024)
+        with self.assertRaises(BudgetExceeded) as ctx:
+            budget = ParseBudget(max_decompressed_bytes=512 * 1024)
+            XmlParser().parse_bytes(content, budget=budget)
+        self.assertEqual(ctx.exception.resource, "decompressed_bytes")
+
+        # Zip headers can't be trusted, the reader counts real bytes
+        budget = ParseBudget(max_decompressed_bytes=100)
+        with self.assertRaises(BudgetExceeded):
+            budget.reader(io.BytesIO(b"x" * 1000)).read()
+        self.assertLessEqual(budget.decompressed_bytes, 100 + budget_module.READ_CHUNK)
+
+    def test_element_count(self):
+        content = zip_score(build_gpif(num_tracks=2, num_bars=20))
+        with self.assertRaises(BudgetExceeded) as ctx:
+            XmlParser().parse_bytes(content, budget=ParseBudget(max_elements=500))
+        self.assertEqual(ctx.exception.resource, "xml_elements")
+
+        with self.assertRaises(BudgetExceeded):
+            budget = ParseBudget(max_elements=500)
+            XmlParser().parse_preview_bytes(content, 60, budget=budget)
+
+    def test_repeated_references(self):
+        content = repeated_beats_score(5000)
+        self.assertLess(len(content), 64 * 1024)
+        with self.assertRaises(BudgetExceeded) as ctx:
+            XmlParser().parse_bytes(content, budget=ParseBudget(max_notes=1000))
+        self.assertEqual(ctx.exception.resource, "notes")
+
+        # Within budget the same file parses fine
+        song = XmlParser().parse_bytes(repeated_beats_score(10))
+        self.assertEqual(len(song.tracks[0].measures[0].beats), 10)
+
+    def test_events_per_track(self):
+        bend = NoteEffect(
+            type=EffectType.BEND,
+            bend_points=[
+                BendPoint(position=0, value=0), BendPoint(position=100, value=100)
+            ],
+        )
+        note = Note(
+            string=1, fret=0, velocity=100, duration=1.0, type=NoteType.NORMAL,
+            effects=[bend],
+        )
+        track = Track(
+            number=1, name="Bomb", channel=0, program=0,
+            measures=[Measure(number=1, numerator=4, denominator=4, beats=[
+                Beat(start_time=0, duration=2**31, notes=[note]),
+            ])],
+        )
+        writer = MidiWriter(Song(tracks=[track]))
+        with self.assertRaises(BudgetExceeded) as ctx:
+            budget = ParseBudget(max_events_per_track=10000)
+            writer.write(file=io.BytesIO(), budget=budget)
+        self.assertEqual(ctx.exception.resource, "events_per_track")
+
+    def test_api_status_codes(self):
+        client = TestClient(app)
+        with mock.patch.object(budget_module, "MAX_DECOMPRESSED_BYTES", 512 * 1024):
+            response = client.post(
+                "/api/convert", files={"file": ("bomb.gp", padded_score(1024 * 1024))}
+            )
+        self.assertEqual(response.status_code, 413)
+
+        with mock.patch.object(budget_module, "MAX_NOTES", 1000):
+            response = client.post(
+                "/api/analyze", files={"file": ("refs.gp", repeated_beats_score(5000))}
+            )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["detail"]["limit"], "notes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import io
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import guitarpro
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api import common
+from backend.api.speculation import speculation
+from backend.core.cancellation import Cancelled, CancelToken, DeadlineExceeded
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.converter.track_cache import track_cache
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from gpif_factory import build_gp
+from test_native_binary_reader import build_song, encode
+
+
+class CancelAfter(CancelToken):
+    """Cancels itself after a number of checkpoints."""
+
+    def __init__(self, checks):
+        super().__init__()
+        self.remaining = checks
+
+    def check(self):
+        self.remaining -= 1
+        if self.remaining < 0:
+            self.cancel("stop")
+        super().check()
+
+
+class TestCancellation(unittest.TestCase):
+    def test_token(self):
+        token = CancelToken()
+        token.check()
+        token.cancel("Client disconnected")
+        with self.assertRaisesRegex(Cancelled, "Client disconnected"):
+            token.check()
+
+        expired = CancelToken(timeout=0.01)
+        time.sleep(0.02)
+        with self.assertRaises(DeadlineExceeded):
+            expired.check()
+
+    def test_xml_parser_checks_per_master_bar(self):
+        content = build_gp(num_tracks=2, num_bars=10)
+        token = CancelAfter(5)
+        with self.assertRaises(Cancelled):
+            XmlParser().parse_bytes(content, token)
+        # One check before the structure, then one per MasterBar
+        self.assertEqual(token.remaining, -1)
+
+        with self.assertRaises(Cancelled):
+            XmlParser().parse_preview_bytes(content, 10, cancel=CancelAfter(1))
+
+    def test_binary_parsers_do_not_fall_back_when_cancelled(self):
+        content = encode(build_song(), (5, 1, 0))
+        for native in (True, False):
+            with self.subTest(native=native):
+                with mock.patch("guitarpro.parse", wraps=guitarpro.parse) as gp_parse:
+                    with self.assertRaises(Cancelled):
+                        BinaryParser(native=native).parse_bytes(content, CancelAfter(1))
+                self.assertEqual(gp_parse.called, not native)
+
+    def test_writer_checks_per_track(self):
+        song = XmlParser().parse_bytes(build_gp(num_tracks=3, num_bars=2))
+        written = []
+        with self.assertRaises(Cancelled):
+            MidiWriter(song).write(
+                file=io.BytesIO(),
+                progress=lambda done, total, track: written.append(done),
+                cancel=CancelAfter(2),
+            )
+        self.assertEqual(written, [1, 2])
+
+    def test_disconnect_cancels_token(self):
+        class FakeRequest:
+            calls = 0
+
+            async def is_disconnected(self):
+                self.calls += 1
+                return self.calls >= 3
+
+        token = CancelToken()
+        with mock.patch.object(common, "DISCONNECT_POLL_SECONDS", 0):
+            asyncio.run(common._watch_disconnect(FakeRequest(), token))
+        self.assertTrue(token.cancelled)
+        self.assertEqual(token.reason, "Client disconnected")
+
+    def test_deadline_returns_504(self):
+        client = TestClient(app)
+        # Earlier conversions of the same file would be served from cache
+        track_cache.clear()
+        speculation.clear()
+        with mock.patch.object(common, "REQUEST_DEADLINE_SECONDS", 1e-9):
+            response = client.post(
+                "/api/convert", files={"file": ("song.gp", build_gp(num_bars=2))}
+            )
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(client.get("/api/metrics").json()["admission"]["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+import mido
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter import midi_writer as midi_writer_module
+from backend.core.converter.channel_plan import INTERVAL, MELODIC_CHANNELS
+from backend.core.converter.midi_writer import MidiWriter
+from backend.main import app
+from backend.models.song_model import (
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+from gpif_factory import build_gp
+
+BEND = NoteEffect(
+    type=EffectType.BEND,
+    bend_points=[BendPoint(position=0, value=0), BendPoint(position=50, value=100)],
+)
+
+
+def note(string, fret=5, bend=False, type=NoteType.NORMAL):
+    return Note(string=string, fret=fret, velocity=90, duration=0.25, type=type,
+                effects=[BEND] if bend else [])
+
+
+def track(number, beats, program=29, is_percussion=False):
+    return Track(
+        number=number, name=f"Track {number}", channel=0, program=program,
+        is_percussion=is_percussion, tuning=[64, 59, 55, 50, 45, 40],
+        measures=[Measure(number=1, numerator=4, denominator=4, beats=beats)],
+    )
+
+
+def write(tracks, allocation=INTERVAL, high_fidelity=True):
+    song = Song(title="Plan", artist="Tests", tempo=120, tracks=tracks)
+    buffer = io.BytesIO()
+    writer = MidiWriter(song, high_fidelity=high_fidelity, allocation=allocation)
+    writer.write(file=buffer)
+    return writer, mido.MidiFile(file=io.BytesIO(buffer.getvalue()))
+
+
+def timeline(midi):
+    # (channel, start, end, track index) of every note
+    notes = []
+    for index, midi_track in enumerate(midi.tracks[1:]):
+        now = 0
+        started = {}
+        for msg in midi_track:
+            now += msg.time
+            if msg.type == "note_on" and msg.velocity:
+                started[(msg.channel, msg.note)] = now
+            elif msg.type in ("note_on", "note_off"):
+                start = started.pop((msg.channel, msg.note))
+                notes.append((msg.channel, start, now, index))
+    return sorted(notes)
+
+
+def programs_at_notes(midi):
+    # Replays the merged file: program of the channel when each note starts
+    program = {}
+    heard = []
+    for msg in mido.merge_tracks(midi.tracks):
+        if msg.type == "program_change":
+            program[msg.channel] = msg.program
+        elif msg.type == "note_on" and msg.velocity:
+            heard.append((msg.channel, program.get(msg.channel)))
+    return heard
+
+
+class TestChannelPlan(unittest.TestCase):
+    def test_bent_notes_get_their_own_channel(self):
+        chord = [note(1, bend=True), note(2, bend=True), note(3), note(4)]
+        beat = Beat(start_time=0, duration=960, notes=chord)
+        writer, midi = write([track(1, [beat])])
+        plan = writer.plan[1]
+        # One lane per bent note, the unbent ones share a third one
+        self.assertEqual(len(plan.lanes), 3)
+        self.assertEqual(
+            plan.note_channels[id(chord[2])], plan.note_channels[id(chord[3])]
+        )
+        channels = [ch for ch, *_ in timeline(midi)]
+        self.assertEqual(sorted(set(channels)), plan.lanes)
+
+    def test_tracks_taking_turns_share_channels(self):
+        verse = track(
+            1, [Beat(start_time=0, duration=960, notes=[note(1, bend=True)])],
+            program=29,
+        )
+        chorus = track(
+            2, [Beat(start_time=1920, duration=960, notes=[note(1, bend=True)])],
+            program=30,
+        )
+        writer, midi = write([verse, chorus])
+        self.assertEqual(writer.plan[1].lanes, writer.plan[2].lanes)
+        # The second track sets the channel up right before its note
+        self.assertEqual(writer.plan[2].setups, [(1920, writer.plan[1].lanes[0])])
+        self.assertEqual([p for _, p in programs_at_notes(midi)], [29, 30])
+
+    def test_large_arrangement(self):
+        # 10 guitars bending 3 strings at once: 30 lanes for 15 channels
+        chord = [note(1, bend=True), note(2, bend=True), note(3, bend=True)]
+        tracks = [
+            track(n, [Beat(start_time=0, duration=960, notes=chord)], program=n)
+            for n in range(1, 11)
+        ]
+        drums = [Beat(start_time=0, duration=960, notes=[note(1, fret=36)])]
+        tracks.append(track(11, drums, is_percussion=True))
+        writer, midi = write(tracks)
+        lanes = [len(writer.plan[n].lanes) for n in range(1, 11)]
+        self.assertEqual(sum(lanes), len(MELODIC_CHANNELS))
+        self.assertTrue(all(1 <= count <= 2 for count in lanes))
+        self.assertEqual(writer.plan[11].lanes, [9])
+
+        # No channel is used by two tracks at once
+        notes = timeline(midi)
+        by_channel = {}
+        for channel, start, end, index in notes:
+            by_channel.setdefault(channel, set()).add(index)
+        self.assertTrue(all(len(indexes) == 1 for indexes in by_channel.values()))
+        heard = programs_at_notes(midi)
+        self.assertEqual(len(heard), 31)
+
+    def test_standard_fidelity_shares_across_time(self):
+        tracks = [
+            track(
+                n, [Beat(start_time=n * 960, duration=480, notes=[note(1)])], program=n
+            )
+            for n in range(1, 21)
+        ]
+        writer, midi = write(tracks, high_fidelity=False)
+        self.assertEqual({len(writer.plan[n].lanes) for n in range(1, 21)}, {1})
+        # Each note plays with its own track's program
+        self.assertEqual([p for _, p in programs_at_notes(midi)], list(range(1, 21)))
+
+    def test_tied_notes_stay_on_their_channel(self):
+        beats = [
+            Beat(start_time=0, duration=480, notes=[note(1), note(2, bend=True)]),
+            Beat(start_time=480, duration=480, notes=[
+                note(1, type=NoteType.TIE), note(2, bend=True, type=NoteType.TIE)
+            ]),
+        ]
+        writer, midi = write([track(1, beats)])
+        plan = writer.plan[1]
+        for beat_notes in zip(beats[0].notes, beats[1].notes):
+            first, tied = (plan.note_channels[id(n)] for n in beat_notes)
+            self.assertEqual(first, tied)
+        self.assertEqual(len(timeline(midi)), 2)
+
+    def test_doubled_tracks_are_copied(self):
+        chord = [note(1, bend=True), note(2, bend=True)]
+        beats = [Beat(start_time=0, duration=960, notes=chord)]
+        tracks = [track(1, beats), track(2, beats, program=30)]
+        counter = iter(range(10**6))
+        with mock.patch.object(
+            midi_writer_module,
+            "track_fingerprint",
+            side_effect=lambda t: next(counter),
+        ):
+            _, expected = write(tracks)
+        writer, midi = write(tracks)
+        self.assertEqual(writer.duplicates, 1)
+        self.assertEqual(
+            [list(t) for t in midi.tracks], [list(t) for t in expected.tracks]
+        )
+
+    def test_convert_endpoint(self):
+        content = build_gp(num_tracks=4, num_bars=4, bends=True)
+        files = {"file": ("song.gp", content)}
+        response = TestClient(app).post(
+            "/api/convert", params={"allocation": "interval"}, files=files
+        )
+        self.assertEqual(response.status_code, 200)
+        midi = mido.MidiFile(file=io.BytesIO(response.content))
+        self.assertEqual(len(midi.tracks), 5)
+        response = TestClient(app).post(
+            "/api/convert", params={"allocation": "nope"}, files=files
+        )
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+import mido
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter import midi_writer as midi_writer_module
+from backend.core.converter.compaction import (
+    CompactionError,
+    compact_events,
+    verify_compaction,
+)
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.converter.track_cache import TrackChunkCache
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from gpif_factory import build_gp
+
+
+def cc(control, value, channel=0, time=0):
+    return mido.Message(
+        "control_change", control=control, value=value, channel=channel, time=time
+    )
+
+
+def wheel(pitch, channel=0, time=0):
+    return mido.Message("pitchwheel", pitch=pitch, channel=channel, time=time)
+
+
+def on(note, channel=0, time=0):
+    return mido.Message("note_on", note=note, velocity=90, channel=channel, time=time)
+
+
+def off(note, channel=0, time=0):
+    return mido.Message("note_off", note=note, velocity=0, channel=channel, time=time)
+
+
+def bend_range(channel):
+    return [
+        cc(101, 0, channel), cc(100, 0, channel), cc(6, 12, channel),
+        cc(38, 0, channel), cc(101, 127, channel), cc(100, 127, channel),
+    ]
+
+
+def write(song, compact):
+    buffer = io.BytesIO()
+    writer = MidiWriter(song, compact=compact)
+    writer.write(file=buffer)
+    return writer, buffer.getvalue()
+
+
+class TestCompactEvents(unittest.TestCase):
+    def test_redundant_events_are_dropped(self):
+        track = [
+            mido.MetaMessage("track_name", name="Guitar", time=0),
+            *bend_range(0), *bend_range(1),
+            cc(7, 100, 1), cc(7, 100, 1),
+            on(60), wheel(2000, time=100), off(60, time=100),
+            wheel(0),  # reset, overridden by the next bend
+            wheel(3000, time=50),
+            on(62, time=10), off(62, time=100),
+            wheel(0),  # last one: kept
+            on(40, channel=1), off(40, channel=1, time=480),
+            mido.MetaMessage("end_of_track", time=0),
+        ]
+        compacted = compact_events(track)
+        verify_compaction(track, compacted)
+
+        self.assertEqual(len(compacted), len(track) - 8)
+        # The bend range of channel 1 is gone, channel 0 bends
+        ranges = [
+            (m.channel, m.control) for m in compacted if m.type == "control_change"
+        ]
+        self.assertEqual(
+            ranges, [(0, 101), (0, 100), (0, 6), (0, 38), (0, 101), (0, 100), (1, 7)]
+        )
+        pitches = [m.pitch for m in compacted if m.type == "pitchwheel"]
+        self.assertEqual(pitches, [2000, 3000, 0])
+        # Absolute times are kept
+        self.assertEqual(sum(m.time for m in compacted), sum(m.time for m in track))
+
+    def test_audible_resets_are_kept(self):
+        track = [
+            on(60), wheel(2000, time=100), wheel(0, time=100),
+            wheel(1000, time=10), off(60, time=100),
+            on(62, time=10), off(62, time=100),
+        ]
+        self.assertEqual(compact_events(track), track)
+
+    def test_verifier_catches_differences(self):
+        track = [
+            *bend_range(0), on(60), wheel(4000, time=10), off(60, time=100), wheel(0)
+        ]
+        with self.assertRaises(CompactionError):
+            # Without the bend range the bend is only 2 semitones
+            verify_compaction(track, track[6:])
+        with self.assertRaises(CompactionError):
+            verify_compaction(track, track[:7] + track[8:])
+        with self.assertRaises(CompactionError):
+            verify_compaction(track, track[:-1])
+        # Moving the reset is fine while nothing sounds
+        verify_compaction(track, track[:-1] + [wheel(0, time=20)])
+
+
+class TestCompactWriter(unittest.TestCase):
+    def setUp(self):
+        content = build_gp(num_tracks=2, num_bars=8, bends=True)
+        self.song = XmlParser().parse_bytes(content)
+
+    def test_compacted_file_plays_the_same(self):
+        _, full = write(self.song, compact=False)
+        with mock.patch.object(midi_writer_module, "VERIFY_COMPACTION", True):
+            _, compact = write(self.song, compact=True)
+        self.assertLess(len(compact), len(full))
+
+        full_tracks = mido.MidiFile(file=io.BytesIO(full)).tracks
+        compact_tracks = mido.MidiFile(file=io.BytesIO(compact)).tracks
+        self.assertEqual(len(full_tracks), len(compact_tracks))
+        for original, compacted in zip(full_tracks, compact_tracks):
+            verify_compaction(list(original), list(compacted))
+
+    def test_cached_separately(self):
+        cache = TrackChunkCache()
+        cache.remember_song("song", self.song)
+        buffer = io.BytesIO()
+        writer = MidiWriter(self.song, compact=True, cache=cache, song_key="song")
+        writer.write(file=buffer)
+        compact = buffer.getvalue()
+        buffer = io.BytesIO()
+        MidiWriter(self.song, cache=cache, song_key="song").write(file=buffer)
+        self.assertNotEqual(buffer.getvalue(), compact)
+        self.assertEqual(MidiWriter.from_cache(cache, "song", compact=True), compact)
+        self.assertEqual(MidiWriter.from_cache(cache, "song"), buffer.getvalue())
+
+    def test_convert_endpoint(self):
+        content = build_gp(num_tracks=1, num_bars=4, bends=True)
+        client = TestClient(app)
+        full = client.post("/api/convert", files={"file": ("song.gp", content)})
+        compact = client.post(
+            "/api/convert",
+            params={"compact": "true"},
+            files={"file": ("song.gp", content)},
+        )
+        self.assertEqual(compact.status_code, 200)
+        self.assertLess(len(compact.content), len(full.content))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.parser.xml_parser import XmlParser
+from differential import (
+    FIXTURES,
+    PAIRS,
+    corpus_files,
+    heard,
+    ir_divergence,
+    main,
+    midi_divergence,
+    run_file,
+    synthetic_corpus,
+)
+from gpif_factory import build_gp
+
+
+def midi_bytes(notes, pitch=0):
+    track = mido.MidiTrack([mido.MetaMessage("track_name", name="Guitar", time=0)])
+    track.append(mido.Message("pitchwheel", pitch=pitch, channel=0, time=0))
+    for note, velocity in notes:
+        track.append(
+            mido.Message("note_on", note=note, velocity=velocity, channel=0, time=0)
+        )
+        track.append(
+            mido.Message("note_off", note=note, velocity=0, channel=0, time=480)
+        )
+    midi = mido.MidiFile(ticks_per_beat=960)
+    midi.tracks.append(track)
+    buffer = io.BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+
+class TestDifferential(unittest.TestCase):
+    def test_corpus_has_no_divergence(self):
+        corpus = list(corpus_files([FIXTURES])) + list(synthetic_corpus())
+        self.assertGreaterEqual(len(corpus), 9)
+        for name, content in corpus:
+            for result in run_file(name, content, PAIRS):
+                with self.subTest(file=name, pair=result.pair):
+                    self.assertIsNone(result.divergence)
+                    self.assertGreater(result.speedup, 0)
+
+    def test_ir_divergence_names_the_field(self):
+        content = build_gp(num_tracks=2, num_bars=2)
+        expected = XmlParser().parse_bytes(content)
+        actual = XmlParser().parse_bytes(content)
+        self.assertIsNone(ir_divergence(expected, actual))
+        actual.tracks[1].measures[1].beats[2].notes[0].fret = 7
+        self.assertEqual(
+            ir_divergence(expected, actual),
+            f"song.tracks[1].measures[1].beats[2].notes[0].fret: "
+            f"{expected.tracks[1].measures[1].beats[2].notes[0].fret} != 7",
+        )
+        del actual.tracks[1].measures[1:]
+        self.assertEqual(
+            ir_divergence(expected, actual), "song.tracks[1].measures: 2 items != 1"
+        )
+
+    def test_midi_divergence(self):
+        reference = midi_bytes([(60, 90), (62, 90)])
+        self.assertIsNone(midi_divergence(reference, reference))
+        found = midi_divergence(reference, midi_bytes([(60, 90), (62, 80)]))
+        self.assertTrue(found.startswith("track 0 note 1:"))
+        bent = midi_bytes([(60, 90), (62, 90)], pitch=4096)
+        self.assertIsNotNone(midi_divergence(reference, bent))
+        notes, = [n for _, n in heard(reference)]
+        self.assertEqual([n[:4] for n in notes], [(0, 480, 60, 90), (480, 960, 62, 90)])
+
+    def test_cli(self):
+        path = os.path.join(FIXTURES, "oracle.gp5")
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            code = main([path, "--pairs", "binary,encoder", "--repeat", "1"])
+        self.assertEqual(code, 0)
+        lines = stdout.getvalue().splitlines()
+        pairs = [line.split()[1] for line in lines[:-1]]
+        self.assertEqual(pairs, ["binary", "encoder"])
+        self.assertEqual(lines[-1], "0 divergence(s)")
+
+
+if __name__ == "__main__":
+    unittest.main()
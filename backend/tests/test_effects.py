@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+import zipfile
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.budget import BudgetExceeded, ParseBudget
+from backend.core.converter import effects as effects_module
+from backend.core.converter.effects import (
+    NoteLinks,
+    articulate,
+    link_notes,
+    note_events,
+    pitch_events,
+    ramp_template,
+    semitones_to_pitch,
+    vibrato_template,
+)
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.xml_parser import XmlParser
+from backend.models.song_model import (
+    SLIDE_LEGATO,
+    SLIDE_OUT_DOWN,
+    VIBRATO_WIDE,
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+from gpif_factory import NS, build_gp, build_gpif
+
+NO_LINKS = NoteLinks(set(), {})
+
+
+def note(string=1, fret=5, effects=()):
+    return Note(
+        string=string, fret=fret, velocity=90, duration=0.25, type=NoteType.NORMAL,
+        effects=list(effects),
+    )
+
+
+def track(beats):
+    return Track(
+        number=1, name="Guitar", channel=0, program=29, is_percussion=False,
+        tuning=[64, 59, 55, 50, 45, 40],
+        measures=[Measure(number=1, numerator=4, denominator=4, beats=beats)],
+    )
+
+
+def pitch_of(note):
+    return 64 + note.fret
+
+
+def no_budget(count):
+    pass
+
+
+class TestEffects(unittest.TestCase):
+    def test_templates_are_cached(self):
+        self.assertIs(vibrato_template(8), vibrato_template(8))
+        self.assertIs(ramp_template(8), ramp_template(8))
+        effects_module._vibrato_curve.cache_clear()
+        wide = NoteEffect(type=EffectType.VIBRATO, value=VIBRATO_WIDE)
+        vibrato = note(effects=[wide])
+        for start in range(0, 9600, 960):
+            end = start + 960
+            pitch_events(vibrato, NO_LINKS, start, end, end, 0, no_budget)
+        info = effects_module._vibrato_curve.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 9)
+
+    def test_vibrato(self):
+        wide = NoteEffect(type=EffectType.VIBRATO, value=VIBRATO_WIDE)
+        vibrato = note(effects=[wide])
+        events = pitch_events(vibrato, NO_LINKS, 0, 960, 960, 3, no_budget)
+        pitches = [e["pitch"] for e in events]
+        self.assertEqual(max(pitches), semitones_to_pitch(VIBRATO_WIDE))
+        self.assertEqual(min(pitches), -semitones_to_pitch(VIBRATO_WIDE))
+        # Four periods in 960 ticks, then back to center
+        self.assertEqual(len(events), 4 * 8 + 1)
+        self.assertEqual(
+            events[-1], {"time": 960, "type": "pitchwheel", "pitch": 0, "channel": 3}
+        )
+        self.assertTrue(all(0 <= e["time"] <= 960 for e in events))
+
+    def test_slide_to_next_note(self):
+        legato = NoteEffect(type=EffectType.SLIDE, value=SLIDE_LEGATO)
+        slide = note(fret=5, effects=[legato])
+        target = note(fret=7)
+        links = link_notes(
+            track([Beat(start_time=0, duration=960, notes=[slide]),
+                   Beat(start_time=960, duration=960, notes=[target])]),
+            pitch_of,
+        )
+        self.assertEqual(links.slide_targets, {id(slide): 2})
+        self.assertEqual(links.legato, {id(target)})
+
+        events = pitch_events(slide, links, 0, 960, 960, 0, no_budget)
+        wheel = [e for e in events if e["time"] < 960]
+        # Held, then sliding up in the last SLIDE_TICKS
+        self.assertGreaterEqual(wheel[0]["time"], 960 - effects_module.SLIDE_TICKS)
+        self.assertLess(wheel[-1]["pitch"], semitones_to_pitch(2))
+        self.assertGreater(wheel[-1]["pitch"], semitones_to_pitch(1.5))
+        self.assertEqual(events[-1]["pitch"], 0)
+        # The target isn't picked again
+        self.assertLess(articulate(target, links, 100, 960, 1920)[0], 100)
+
+    def test_slide_out(self):
+        slide = note(effects=[NoteEffect(type=EffectType.SLIDE, value=SLIDE_OUT_DOWN)])
+        events = pitch_events(slide, NO_LINKS, 0, 960, 960, 0, no_budget)
+        self.assertTrue(all(e["pitch"] <= 0 for e in events))
+        self.assertLess(min(e["pitch"] for e in events), semitones_to_pitch(-4))
+
+    def test_palm_mute(self):
+        muted = note(effects=[NoteEffect(type=EffectType.PALM_MUTE)])
+        velocity, end = articulate(muted, NO_LINKS, 100, 0, 960)
+        self.assertLess(velocity, 100)
+        self.assertEqual(end, 480)
+        # Untouched otherwise
+        self.assertEqual(articulate(note(), NO_LINKS, 100, 0, 960), (100, 960))
+
+    def test_trill(self):
+        trill = note(fret=5, effects=[NoteEffect(type=EffectType.TRILL, value=7)])
+        events = note_events(trill, 69, 90, 0, 960, 0, no_budget)
+        ons = [e["note"] for e in events if e["type"] == "note_on"]
+        self.assertEqual(ons, [69, 71, 69, 71])
+        self.assertEqual(events[-1]["time"], 960)
+
+    def test_long_trill_is_budgeted(self):
+        trill = note(fret=5, effects=[NoteEffect(type=EffectType.TRILL, value=7)])
+        song = Song(title="Trill", artist="Tests", tempo=120, tracks=[
+            track([Beat(start_time=0, duration=960 * 10000, notes=[trill])])
+        ])
+        with self.assertRaises(BudgetExceeded):
+            budget = ParseBudget(max_events_per_track=1000)
+            MidiWriter(song).write(file=io.BytesIO(), budget=budget)
+
+    def test_bent_notes_keep_their_bend(self):
+        bent = note(effects=[
+            NoteEffect(type=EffectType.BEND, bend_points=[]),
+            NoteEffect(type=EffectType.VIBRATO, value=VIBRATO_WIDE),
+        ])
+        self.assertTrue(pitch_events(bent, NO_LINKS, 0, 960, 960, 0, no_budget))
+        bent.effects[0].bend_points = [BendPoint(position=0, value=100)]
+        self.assertEqual(pitch_events(bent, NO_LINKS, 0, 960, 960, 0, no_budget), [])
+
+    def test_gpif_articulations(self):
+        content = build_gp(num_tracks=1, num_bars=2, articulations=True)
+        song = XmlParser().parse_bytes(content)
+        effects = [
+            {e.type for e in n.effects}
+            for beat in song.tracks[0].measures[0].beats for n in beat.notes
+        ]
+        self.assertEqual(effects[:4], [
+            {EffectType.VIBRATO}, {EffectType.SLIDE}, {EffectType.HAMMER},
+            {EffectType.TRILL, EffectType.PALM_MUTE},
+        ])
+
+        buffer = io.BytesIO()
+        MidiWriter(song).write(file=buffer)
+        midi = mido.MidiFile(file=io.BytesIO(buffer.getvalue()))
+        messages = list(midi.tracks[1])
+        self.assertTrue(any(m.type == "pitchwheel" and m.pitch for m in messages))
+        velocities = {
+            m.velocity for m in messages if m.type == "note_on" and m.velocity
+        }
+        self.assertGreater(len(velocities), 1)
+
+    def test_gpif_trill_without_midi(self):
+        # Fret and String only: the trill is placed off the track's tuning
+        root = ET.fromstring(build_gpif(num_tracks=1, num_bars=1, articulations=True))
+        tuning = [40, 45, 50, 55, 59, 64]
+        track_elem = root.find(f"{{{NS}}}Tracks/{{{NS}}}Track")
+        track_props = ET.SubElement(track_elem, f"{{{NS}}}Properties")
+        prop = ET.SubElement(track_props, f"{{{NS}}}Property", name="Tuning")
+        ET.SubElement(prop, f"{{{NS}}}Pitches").text = " ".join(map(str, tuning))
+        for note in root.iter(f"{{{NS}}}Note"):
+            props = {p.get("name"): p for p in note.find(f"{{{NS}}}Properties")}
+            string = int(props["String"].findtext(f"{{{NS}}}String"))
+            number = props["Midi"].find(f"{{{NS}}}Number")
+            props["Midi"].set("name", "Fret")
+            number.text = str(int(number.text) - tuning[string])
+        bio = io.BytesIO()
+        with zipfile.ZipFile(bio, "w") as z:
+            z.writestr("Content/score.gpif", ET.tostring(root))
+
+        song = XmlParser().parse_bytes(bio.getvalue())
+        trilled = song.tracks[0].measures[0].beats[3].notes[0]
+        self.assertIsNone(trilled.midi_number)
+        [trill] = [e for e in trilled.effects if e.type == EffectType.TRILL]
+        # A whole tone up, as when the note has its Midi number
+        self.assertEqual(trill.value - trilled.fret, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import struct
+import sys
+import unittest
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.budget import BudgetExceeded, ParseBudget
+from backend.core.parser.gpx_container import (
+    SECTOR_SIZE,
+    GpxContainer,
+    GpxContainerError,
+    decompress_bcfz,
+)
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from gpif_factory import build_bcfs, build_gp, build_gpif, build_gpx, compress_bcfz
+
+
+class TestGpxContainer(unittest.TestCase):
+    def test_bcfz_round_trip(self):
+        samples = [
+            b"",
+            b"ab",
+            b"x" * 10000,
+            bytes(range(256)) * 40,
+            build_gpif(num_tracks=2, num_bars=8, bends=True),
+        ]
+        for data in samples:
+            with self.subTest(size=len(data)):
+                self.assertEqual(bytes(decompress_bcfz(compress_bcfz(data))), data)
+
+    def test_files_span_sectors(self):
+        score = build_gpif(num_tracks=3, num_bars=12)
+        self.assertGreater(len(score), 3 * SECTOR_SIZE)
+        files = {"score.gpif": score, "misc.xml": b"<Misc/>", "empty": b""}
+
+        for compressed in (True, False):
+            with self.subTest(compressed=compressed):
+                image = build_bcfs(files)
+                container = GpxContainer(compress_bcfz(image) if compressed else image)
+                self.assertEqual(container.names(), ["score.gpif", "misc.xml", "empty"])
+                self.assertEqual(container.read("score.gpif"), score)
+                self.assertEqual(container.read("misc.xml"), b"<Misc/>")
+                chunks = container.chunks("score.gpif")
+                self.assertTrue(all(isinstance(c, memoryview) for c in chunks))
+
+    def test_xml_parser_reads_gpx(self):
+        kwargs = dict(num_tracks=2, num_bars=6, bends=True)
+        expected = XmlParser().parse_bytes(build_gp(**kwargs))
+        self.assertEqual(XmlParser().parse_bytes(build_gpx(**kwargs)), expected)
+        uncompressed = build_gpx(compressed=False, **kwargs)
+        self.assertEqual(XmlParser().parse_bytes(uncompressed), expected)
+
+        # 4/4 at 120 BPM: measures start at 0s and 2s
+        preview = XmlParser().parse_preview_bytes(build_gpx(**kwargs), seconds=3)
+        self.assertEqual(preview.tracks[0].measures, expected.tracks[0].measures[:2])
+
+    def test_corrupt_containers(self):
+        content = build_gpx(num_bars=2)
+        with self.assertRaises(GpxContainerError):
+            GpxContainer(content[:len(content) // 2])
+        with self.assertRaises(GpxContainerError):
+            XmlParser().parse_bytes(b"BCFS")
+
+        # A sector pointer past the end of the image
+        image = bytearray(build_bcfs({"score.gpif": b"<a/>"}))
+        struct.pack_into("<i", image, 4 + SECTOR_SIZE + 0x94, 999)
+        with self.assertRaises(GpxContainerError):
+            GpxContainer(bytes(image))
+
+        with self.assertRaises(GpxContainerError):
+            XmlParser().parse_bytes(build_bcfs({"other.gpif": b"<a/>"}))
+
+    def test_declared_size_is_checked_before_allocating(self):
+        bomb = b"BCFZ" + struct.pack("<i", 2**31 - 1) + b"\x00" * 16
+        with self.assertRaises(BudgetExceeded):
+            budget = ParseBudget(max_decompressed_bytes=1024 * 1024)
+            XmlParser().parse_bytes(bomb, budget=budget)
+
+    def test_convert_gpx_upload(self):
+        client = TestClient(app)
+        response = client.post(
+            "/api/convert", files={"file": ("song.gpx", build_gpx(num_bars=2))}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "audio/midi")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend import inspect_gp as inspector
+from backend.core.budget import ParseBudget
+from backend.core.parser.xml_parser import XmlParser
+from differential import FIXTURES
+from gpif_factory import build_bcfs, build_gp, build_gpif
+
+NS = "{http://www.guitar-pro.com/GPIF/1.0}"
+
+
+class TestInspectGp(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _file(self, content, name="song.gp"):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_matches_the_parser(self):
+        content = build_gp(num_tracks=3, num_bars=6, bends=True)
+        inspection = inspector.inspect_gp(self._file(content))
+
+        budget = ParseBudget()
+        song = XmlParser().parse_bytes(content, budget=budget)
+        self.assertEqual(inspection.container, "zip")
+        self.assertEqual(inspection.decompressed_bytes, budget.decompressed_bytes)
+        self.assertEqual(inspection.elements, budget.elements)
+        self.assertEqual(inspection.resolved_notes, budget.notes)
+        self.assertEqual(inspection.tags["MasterBar"], 6)
+
+        self.assertEqual(
+            [t.name for t in inspection.tracks], [t.name for t in song.tracks]
+        )
+        for stats, track in zip(inspection.tracks, song.tracks):
+            notes = [n for m in track.measures for b in m.beats for n in b.notes]
+            self.assertEqual(stats.bars, len(track.measures))
+            self.assertEqual(stats.notes, len(notes))
+            self.assertEqual(
+                stats.bend_points,
+                sum(len(e.bend_points) for n in notes for e in n.effects),
+            )
+        self.assertTrue(all(s.reused == 0 for s in inspection.reuse.values()))
+
+    def test_reused_references(self):
+        # One Voice pointing at the same Beat 5000 times
+        root = ET.fromstring(build_gpif(num_bars=1))
+        beats = root.find(f"{NS}Voices/{NS}Voice/{NS}Beats")
+        first_beat = beats.text.split()[0]
+        beats.text = " ".join([first_beat] * 5000)
+        path = self._file(build_bcfs({"score.gpif": ET.tostring(root)}), "song.gpx")
+
+        inspection = inspector.inspect_gp(path)
+        self.assertEqual(inspection.container, "gpx")
+        beat = inspection.reuse["Beat"]
+        self.assertEqual(
+            (beat.reused, beat.reused_references, beat.max_references),
+            (1, 5000, 5000),
+        )
+        self.assertEqual(beat.unreferenced, beat.defined - 1)
+        self.assertEqual(inspection.tracks[0].beats, 5000)
+        self.assertEqual(inspection.exceeded_limits(), [])
+        with mock.patch.object(inspector, "MAX_NOTES", 1000):
+            self.assertEqual(inspection.exceeded_limits(), ["notes"])
+
+    def test_cli(self):
+        path = self._file(build_gp(num_tracks=2, num_bars=2))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(inspector.main([path, "--json"]), 0)
+        report = json.loads(output.getvalue())
+        self.assertEqual(len(report["tracks"]), 2)
+        self.assertEqual(set(report["reuse"]), {"Bar", "Voice", "Beat", "Note"})
+
+        output = io.StringIO()
+        binary = os.path.join(FIXTURES, "oracle.gp5")
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(stderr):
+            # GP3-5 files have no score.gpif
+            self.assertEqual(inspector.main([path, binary, "--top", "3"]), 1)
+        self.assertIn("estimated parse time", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
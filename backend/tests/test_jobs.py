@@ -0,0 +1,195 @@
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import mido
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api.jobs import get_job_store
+from backend.jobs import worker as worker_module
+from backend.jobs.store import JobStore
+from backend.jobs.worker import ConversionWorker, WorkerPool
+from backend.main import app
+from backend.models.job_model import JobOptions, JobStatus
+from gpif_factory import build_gp
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "jobs.sqlite3")
+        self.store = JobStore(self.db_path, max_depth=2)
+        app.dependency_overrides[get_job_store] = lambda: self.store
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.tmp.cleanup()
+
+    def _submit(self, content=None, filename="song.gp", **params):
+        content = content if content is not None else build_gp(num_tracks=3, num_bars=4)
+        return self.client.post(
+            "/api/jobs", params=params, files={"file": (filename, content)}
+        )
+
+    def test_submit_run_and_fetch_result(self):
+        response = self._submit(selected_tracks="1,3")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        status = self.client.get(f"/api/jobs/{job_id}").json()["status"]
+        self.assertEqual(status, "queued")
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}/result").status_code, 409)
+
+        self.assertTrue(ConversionWorker(self.store).run_once())
+        self.assertFalse(ConversionWorker(self.store).run_once())
+
+        status = self.client.get(f"/api/jobs/{job_id}").json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual((status["progress_done"], status["progress_total"]), (2, 2))
+
+        result = self.client.get(f"/api/jobs/{job_id}/result")
+        self.assertEqual(result.status_code, 200)
+        midi = mido.MidiFile(file=io.BytesIO(result.content))
+        # Tempo track + the 2 selected tracks
+        self.assertEqual(len(midi.tracks), 3)
+
+    def test_events_stream_progress(self):
+        job_id = self._submit().json()["job_id"]
+        ConversionWorker(self.store).run_once()
+
+        body = self.client.get(f"/api/jobs/{job_id}/events").text
+        events = [
+            line[len("event: "):]
+            for line in body.splitlines()
+            if line.startswith("event: ")
+        ]
+        self.assertEqual(
+            events, ["status", "status", "progress", "progress", "progress", "done"]
+        )
+        self.assertIn('"done": 3, "total": 3', body)
+
+        # Reconnecting resumes after the last seen event
+        last_id = self.store.events_since(job_id)[-2].id
+        body = self.client.get(
+            f"/api/jobs/{job_id}/events", headers={"Last-Event-ID": str(last_id)}
+        ).text
+        self.assertEqual(body.count("event: "), 1)
+
+    def test_full_queue_is_rejected(self):
+        self.assertEqual(self._submit().status_code, 202)
+        self.assertEqual(self._submit().status_code, 202)
+        response = self._submit()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+        ConversionWorker(self.store).run_once()
+        self.assertEqual(self._submit().status_code, 202)
+
+    def test_failed_job(self):
+        job_id = self._submit(content=b"not a zip").json()["job_id"]
+        ConversionWorker(self.store).run_once()
+
+        job = self.store.get(job_id)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertTrue(job.error)
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}/result").status_code, 422)
+        response = self._submit(content=b"plain text", filename="song.txt")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/api/jobs/missing").status_code, 404)
+
+    def test_claims_are_exclusive_and_expired_leases_requeue(self):
+        first = self.store.submit("a.gp", b"a", JobOptions())
+        second = self.store.submit("b.gp", b"b", JobOptions())
+
+        job_a, content_a = self.store.claim("w1")
+        job_b, content_b = self.store.claim("w2")
+        self.assertEqual((job_a.id, content_a), (first.id, b"a"))
+        self.assertEqual((job_b.id, content_b), (second.id, b"b"))
+        self.assertIsNone(self.store.claim("w3"))
+
+        # w1 died: its heartbeat is older than the lease
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (first.id,))
+        job, _ = self.store.claim("w3")
+        self.assertEqual(job.id, first.id)
+        self.assertEqual(job.attempts, 2)
+
+    def test_workers_that_lost_their_job_change_nothing(self):
+        job = self.store.submit("song.gp", b"content", JobOptions())
+        self.store.claim("w1")
+        # w1 stalls past its lease, w2 takes the job over
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job.id,))
+        claimed, content = self.store.claim("w2")
+        self.assertEqual((claimed.id, content), (job.id, b"content"))
+
+        events = len(self.store.events_since(job.id))
+        self.assertFalse(self.store.report_progress(job.id, "w1", 1, 2))
+        self.assertFalse(self.store.complete(job.id, "w1", b"stale"))
+        self.assertFalse(self.store.fail(job.id, "w1", "stale"))
+        self.assertEqual(len(self.store.events_since(job.id)), events)
+        self.assertEqual(self.store.get(job.id).status, JobStatus.RUNNING)
+
+        self.assertTrue(self.store.complete(job.id, "w2", b"MThd"))
+        self.assertEqual(self.store.get_result(job.id), b"MThd")
+        self.assertEqual(
+            [e.event for e in self.store.events_since(job.id)].count("done"), 1
+        )
+
+        # Failed for good after too many lost leases: a late result is dropped
+        lost = self.store.submit("lost.gp", b"content", JobOptions())
+        with mock.patch("backend.jobs.store.MAX_ATTEMPTS", 1):
+            self.store.claim("w1")
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (lost.id,)
+                )
+            self.assertIsNone(self.store.claim("w2"))
+        self.assertFalse(self.store.complete(lost.id, "w1", b"MThd"))
+        self.assertEqual(self.store.get(lost.id).status, JobStatus.FAILED)
+
+    def test_long_jobs_keep_their_lease(self):
+        job = self.store.submit("song.gp", b"content", JobOptions())
+        heartbeats = []
+
+        def slow_convert(*args):
+            # One long track: no progress is reported for a while
+            for _ in range(3):
+                time.sleep(0.05)
+                with sqlite3.connect(self.db_path) as conn:
+                    heartbeats.append(conn.execute(
+                        "SELECT heartbeat_at FROM jobs WHERE id = ?", (job.id,)
+                    ).fetchone()[0])
+            return b"MThd"
+
+        with mock.patch.object(worker_module, "HEARTBEAT_INTERVAL", 0.01), \
+                mock.patch.object(worker_module, "convert", slow_convert):
+            self.assertTrue(ConversionWorker(self.store, "w1").run_once())
+        self.assertEqual(len(set(heartbeats)), 3)
+        self.assertEqual(self.store.get(job.id).status, JobStatus.DONE)
+
+    def test_worker_processes(self):
+        content = build_gp(num_tracks=1, num_bars=2)
+        job = self.store.submit("song.gp", content, JobOptions())
+        pool = WorkerPool(1, self.db_path)
+        pool.start()
+        try:
+            deadline = time.monotonic() + 30
+            while not self.store.get(job.id).finished and time.monotonic() < deadline:
+                time.sleep(0.1)
+        finally:
+            pool.stop()
+        self.assertEqual(self.store.get(job.id).status, JobStatus.DONE)
+        self.assertEqual(pool.processes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api.library import get_library_store
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.xml_parser import XmlParser
+from backend.library.ingest import IngestReport, ingest, library_files
+from backend.library.store import LibraryStore
+from backend.main import app
+from differential import FIXTURES
+from gpif_factory import build_gp
+
+
+class TestLibrary(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.music = os.path.join(self.tmp.name, "music")
+        shutil.copytree(FIXTURES, self.music)
+        self.store = LibraryStore(os.path.join(self.tmp.name, "library.sqlite3"))
+        app.dependency_overrides[get_library_store] = lambda: self.store
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.music, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_ingest_indexes_every_file(self):
+        self._write("broken.gp5", b"not a guitar pro file")
+        report = ingest(self.store, [self.music])
+        self.assertEqual(
+            report, IngestReport(added=3, updated=0, unchanged=0, failed=1, removed=0)
+        )
+
+        oracle = self.store.get_by_path(os.path.join(self.music, "oracle.gp5"))
+        self.assertEqual((oracle.title, oracle.artist), ("Differential", "Oracle"))
+        self.assertEqual(
+            [(t.number, t.name, t.program, t.is_percussion) for t in oracle.tracks],
+            [(1, "Lead", 25, False), (2, "Drums", 0, True)],
+        )
+        # Failed files are kept (so they aren't parsed again) but not listed
+        self.assertEqual(len(self.store.search()), 3)
+        # gp3 and gp5 differ, one packed song per content
+        self.assertEqual(len(os.listdir(self.store.songs_dir)), 3)
+
+    def test_reingest_is_incremental(self):
+        ingest(self.store, [self.music])
+        self.assertEqual(ingest(self.store, [self.music]).unchanged, 3)
+
+        # Touched but identical: not parsed again
+        path = os.path.join(self.music, "oracle.gp3")
+        os.utime(path, (1, 1))
+        self.assertEqual(ingest(self.store, [self.music]), IngestReport(0, 0, 3, 0, 0))
+
+        # Modified: parsed again, the old IR goes
+        old_hash = self.store.get_by_path(path).content_hash
+        with open(os.path.join(FIXTURES, "articulations.gp"), "rb") as f:
+            self._write("oracle.gp3", f.read())
+        self.assertEqual(ingest(self.store, [self.music]), IngestReport(0, 1, 2, 0, 0))
+        self.assertEqual(self.store.get_by_path(path).title, "Untitled")
+        self.assertFalse(os.path.exists(self.store.ir_path(old_hash)))
+
+        os.remove(path)
+        self.assertEqual(ingest(self.store, [self.music]).removed, 0)
+        self.assertEqual(ingest(self.store, [self.music], prune=True).removed, 1)
+        # Still used by articulations.gp
+        self.assertEqual(len(self.store.search()), 2)
+        self.assertEqual(len(os.listdir(self.store.songs_dir)), 2)
+
+    def test_prune_keeps_other_roots(self):
+        other = os.path.join(self.tmp.name, "other")
+        os.makedirs(other)
+        shutil.copy(
+            os.path.join(FIXTURES, "articulations.gp"), os.path.join(other, "x.gp")
+        )
+        ingest(self.store, [other])
+        self.assertEqual(ingest(self.store, [self.music], prune=True).removed, 0)
+        song = self.store.get_by_path(os.path.join(other, "x.gp"))
+        self.assertTrue(os.path.exists(self.store.ir_path(song.content_hash)))
+
+        os.remove(os.path.join(other, "x.gp"))
+        self.assertEqual(ingest(self.store, [self.music], prune=True).removed, 1)
+        self.assertIsNone(self.store.get_by_path(os.path.join(other, "x.gp")))
+
+    def test_force_rewrites_packed_songs(self):
+        ingest(self.store, [self.music])
+        song = self.store.get_by_path(os.path.join(self.music, "oracle.gp5"))
+        ir_path = self.store.ir_path(song.content_hash)
+        # As left by an older parser or song_codec version
+        with open(ir_path, "wb") as f:
+            f.write(b"stale")
+        self.assertEqual(ingest(self.store, [self.music]).unchanged, 3)
+        self.assertEqual(open(ir_path, "rb").read(), b"stale")
+        self.assertEqual(ingest(self.store, [self.music], force=True).updated, 3)
+        self.assertEqual(self.store.load_song(song).title, "Differential")
+
+    def test_vanished_file_fails_alone(self):
+        # Listed, then gone before it's read
+        missing = os.path.join(self.music, "missing.gp5")
+        files = list(library_files([self.music])) + [missing]
+        with mock.patch("backend.library.ingest.library_files", return_value=files):
+            report = ingest(self.store, [self.music])
+        self.assertEqual(
+            report, IngestReport(added=3, updated=0, unchanged=0, failed=1, removed=0)
+        )
+        self.assertIsNone(self.store.get_by_path(missing))
+
+    def test_parallel_ingest(self):
+        for i in range(3):
+            self._write(f"synthetic{i}.gp", build_gp(num_tracks=i + 1, num_bars=4))
+        report = ingest(self.store, [self.music], workers=2)
+        self.assertEqual(report.added, 6)
+        song = self.store.get_by_path(os.path.join(self.music, "synthetic2.gp"))
+        self.assertEqual(len(song.tracks), 3)
+        self.assertEqual(len(self.store.load_song(song).tracks), 3)
+
+    def test_search(self):
+        ingest(self.store, [self.music])
+        self.assertEqual(len(self.store.search("oracle")), 2)
+        self.assertEqual(len(self.store.search(artist="ORACLE")), 2)
+        self.assertEqual(len(self.store.search("drums")), 2)
+        self.assertEqual(len(self.store.search(program=29)), 1)
+        self.assertEqual(len(self.store.search("%")), 0)
+        self.assertEqual(len(self.store.search(limit=1, offset=1)), 1)
+
+        response = self.client.get("/api/library/songs", params={"q": "untitled"})
+        self.assertEqual(response.status_code, 200)
+        [song] = response.json()["songs"]
+        self.assertEqual([t["id"] for t in song["tracks"]], [1, 2])
+
+    def test_convert_by_id(self):
+        ingest(self.store, [self.music])
+        song = self.store.get_by_path(os.path.join(self.music, "articulations.gp"))
+        content = open(os.path.join(self.music, "articulations.gp"), "rb").read()
+
+        parsed = XmlParser().parse_bytes(content)
+        parsed.tracks = parsed.tracks[1:]
+        buffer = io.BytesIO()
+        MidiWriter(parsed).write(file=buffer)
+
+        for _ in range(2):  # Written, then from the track cache
+            response = self.client.post(
+                f"/api/library/songs/{song.id}/convert", params={"selected_tracks": "2"}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["content-type"], "audio/midi")
+            self.assertEqual(response.content, buffer.getvalue())
+
+        response = self.client.get(f"/api/library/songs/{song.id}")
+        self.assertEqual(response.json()["title"], "Untitled")
+
+    def test_notes_from_the_packed_song(self):
+        ingest(self.store, [self.music])
+        song = self.store.get_by_path(os.path.join(self.music, "oracle.gp5"))
+        response = self.client.get(
+            f"/api/library/songs/{song.id}/tracks/1/notes", params={"measures": 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual((page["first_measure"], page["end_measure"]), (0, 1))
+        self.assertEqual(page["notes"]["start"][0], 960)
+        response = self.client.get(f"/api/library/songs/{song.id}/tracks/5/notes")
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_and_failed_songs(self):
+        self._write("broken.gp5", b"not a guitar pro file")
+        ingest(self.store, [self.music])
+        self.assertEqual(self.client.get("/api/library/songs/999").status_code, 404)
+        response = self.client.post("/api/library/songs/999/convert")
+        self.assertEqual(response.status_code, 404)
+        broken = self.store.get_by_path(os.path.join(self.music, "broken.gp5"))
+        response = self.client.post(f"/api/library/songs/{broken.id}/convert")
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from gpif_factory import build_gp
+from load_harness import SCENARIOS, format_report, percentile, plan_requests, run
+
+
+class TestLoadHarness(unittest.TestCase):
+    def test_percentile(self):
+        ordered = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(ordered, 50), 50.0)
+        self.assertEqual(percentile(ordered, 99), 99.0)
+        self.assertEqual(percentile(ordered, 100), 100.0)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_plan_is_reproducible(self):
+        corpus = [("a.gp", b"a"), ("b.gp", b"b")]
+        plan = plan_requests(SCENARIOS["mixed"], corpus, 50, seed=3)
+        self.assertEqual(plan, plan_requests(SCENARIOS["mixed"], corpus, 50, seed=3))
+        kinds = {kind for kind, _, _ in plan}
+        self.assertEqual(kinds, {"analyze", "convert", "preview"})
+        self.assertEqual([name for _, name, _ in plan[:3]], ["a.gp", "b.gp", "a.gp"])
+
+    def test_in_process_scenarios(self):
+        corpus = [
+            ("song.gp", build_gp(num_tracks=2, num_bars=4)),
+            ("bends.gp", build_gp(bends=True)),
+        ]
+        reports = asyncio.run(
+            run(["analyze", "mixed"], corpus, concurrency=2, requests=12)
+        )
+        self.assertEqual([r.name for r in reports], ["analyze", "mixed"])
+        for report in reports:
+            self.assertEqual(report.requests, 12)
+            self.assertEqual(report.errors, 0, report.statuses)
+            self.assertGreater(report.throughput, 0)
+            self.assertLessEqual(report.percentile(50), report.percentile(95))
+            self.assertLessEqual(report.percentile(95), report.percentile(99))
+            self.assertGreater(report.peak_rss, 0)
+            self.assertIn("req/s", format_report(report))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import io
+import os
+import sys
+import unittest
+
+import guitarpro
+from guitarpro import models as gp
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.native_binary_reader import (
+    NativeBinaryReader,
+    NativeReaderError,
+)
+from backend.models.song_model import SLIDE_LEGATO, VIBRATO_SLIGHT, EffectType, NoteType
+
+VERSIONS = [(3, 0, 0), (4, 0, 0), (4, 0, 6), (5, 0, 0), (5, 1, 0)]
+
+
+def _add_beat(
+    voice, notes=(), value=4, dotted=False, tuplet=None, status=gp.BeatStatus.normal
+):
+    beat = gp.Beat(voice, status=status)
+    beat.duration = gp.Duration(value=value, isDotted=dotted)
+    if tuplet:
+        beat.duration.tuplet = gp.Tuplet(*tuplet)
+    for string, fret, kwargs in notes:
+        note_type = kwargs.pop("type", gp.NoteType.normal)
+        note = gp.Note(beat, value=fret, string=string, type=note_type)
+        for key, val in kwargs.items():
+            target = note if key == "velocity" else note.effect
+            setattr(target, key, val)
+        beat.notes.append(note)
+    voice.beats.append(beat)
+    return beat
+
+
+def build_song():
+    """A PyGuitarPro song exercising most of what the IR keeps."""
+    song = gp.Song()
+    song.title = "Differential"
+    song.artist = "Oracle"
+    song.tempo = 97
+
+    # Second measure in 3/4 with a marker
+    header = gp.MeasureHeader(number=2)
+    header.timeSignature.numerator = 3
+    header.marker = gp.Marker(title="Chorus")
+    song.addMeasureHeader(header)
+
+    guitar = song.tracks[0]
+    guitar.name = "Lead"
+    guitar.measures.append(gp.Measure(guitar, header))
+
+    drums = gp.Track(song, number=2, name="Drums", isPercussionTrack=True)
+    drums.strings = [gp.GuitarString(i + 1, 0) for i in range(6)]
+    drums.channel = gp.MidiChannel(channel=9, effectChannel=9, instrument=0)
+    drums.measures = [gp.Measure(drums, h) for h in song.measureHeaders]
+    song.tracks.append(drums)
+
+    bend = gp.BendEffect(
+        type=gp.BendType.bend,
+        value=50,
+        points=[gp.BendPoint(0, 0), gp.BendPoint(6, 4), gp.BendPoint(12, 4)],
+    )
+
+    # Measure 1: bend, dotted eighths, a chord with a text, a triplet
+    v1 = guitar.measures[0].voices[0]
+    _add_beat(v1, [(3, 7, {"bend": bend, "velocity": gp.Velocities.fortissimo})])
+    _add_beat(v1, [(2, 5, {}), (1, 3, {})], value=8, dotted=True)
+    chord_beat = _add_beat(v1, [(6, 0, {}), (5, 2, {}), (4, 2, {})], value=16)
+    chord_beat.text = "E5"
+    chord_beat.effect.chord = gp.Chord(
+        6, name="E5", firstFret=1, strings=[-1, -1, -1, 2, 2, 0]
+    )
+    for _ in range(3):
+        harmonic = {"harmonic": gp.NaturalHarmonic()}
+        _add_beat(v1, [(1, 12, harmonic)], value=8, tuplet=(3, 2))
+    _add_beat(v1, value=4, status=gp.BeatStatus.rest)
+
+    # Measure 2: tied note across beats, dead note, mix table tempo change
+    v2 = guitar.measures[1].voices[0]
+    first = _add_beat(v2, [(3, 9, {})], value=2)
+    first.effect.mixTableChange = gp.MixTableChange(
+        tempo=gp.MixTableItem(120, duration=0), volume=gp.MixTableItem(100, duration=2)
+    )
+    _add_beat(v2, [(3, 0, {"type": gp.NoteType.tie})])
+    _add_beat(v2, [(4, 0, {"type": gp.NoteType.dead})])
+
+    for measure in drums.measures:
+        voice = measure.voices[0]
+        for _ in range(measure.header.timeSignature.numerator):
+            _add_beat(voice, [(1, 36, {}), (2, 42, {})])
+
+    return song
+
+
+def encode(song, version):
+    stream = io.BytesIO()
+    guitarpro.write(song, stream, version=version)
+    return stream.getvalue()
+
+
+class TestNativeBinaryReader(unittest.TestCase):
+    def test_matches_pyguitarpro_oracle(self):
+        oracle = BinaryParser(native=False)
+        for version in VERSIONS:
+            with self.subTest(version=version):
+                content = encode(build_song(), version)
+                expected = oracle.parse_bytes(content)
+                actual = NativeBinaryReader(content).read_song()
+                self.assertEqual(actual.model_dump(), expected.model_dump())
+
+    def test_second_voice_gp5(self):
+        song = build_song()
+        voice = song.tracks[0].measures[0].voices[1]
+        _add_beat(voice, [(6, 3, {})], value=1)
+        content = encode(song, (5, 1, 0))
+
+        expected = BinaryParser(native=False).parse_bytes(content)
+        actual = BinaryParser(native=True).parse_bytes(content)
+        self.assertEqual(actual.model_dump(), expected.model_dump())
+        self.assertEqual(actual.tracks[0].measures[0].beats[-1].duration, 3840)
+
+    def test_articulations(self):
+        song = build_song()
+        voice = song.tracks[0].measures[1].voices[1]
+        _add_beat(voice, [(2, 5, {"hammer": True})])
+        slide = [gp.SlideType.legatoSlideTo]
+        _add_beat(voice, [(2, 7, {"slides": slide, "vibrato": True})])
+        trill = gp.TrillEffect(fret=11, duration=gp.Duration(value=16))
+        _add_beat(voice, [(2, 9, {"palmMute": True, "trill": trill})])
+
+        for version in VERSIONS:
+            with self.subTest(version=version):
+                content = encode(song, version)
+                expected = BinaryParser(native=False).parse_bytes(content)
+                actual = NativeBinaryReader(content).read_song()
+                self.assertEqual(actual.model_dump(), expected.model_dump())
+
+        notes = [b.notes[0] for b in actual.tracks[0].measures[1].beats if b.voice == 1]
+        self.assertEqual(
+            [[(e.type, e.value) for e in n.effects] for n in notes],
+            [
+                [(EffectType.HAMMER, None)],
+                [
+                    (EffectType.SLIDE, SLIDE_LEGATO),
+                    (EffectType.VIBRATO, VIBRATO_SLIGHT),
+                ],
+                [(EffectType.TRILL, 11), (EffectType.PALM_MUTE, None)],
+            ],
+        )
+
+    def test_bends_durations_and_pitches(self):
+        content = encode(build_song(), (5, 1, 0))
+        song = NativeBinaryReader(content).read_song()
+        beats = song.tracks[0].measures[0].beats
+
+        bend = beats[0].notes[0].effects[0]
+        self.assertEqual(bend.type, EffectType.BEND)
+        self.assertEqual(
+            [(p.position, p.value) for p in bend.bend_points],
+            [(0, 0), (50, 100), (100, 100)],
+        )
+        # Open G string + 7 frets
+        self.assertEqual(beats[0].notes[0].midi_number, 62)
+        self.assertEqual(beats[0].duration, 960)
+        self.assertEqual(beats[1].duration, 720)
+        self.assertEqual(beats[3].duration, 320)
+        self.assertEqual(song.tracks[0].tuning, [40, 45, 50, 55, 59, 64])
+
+        tied = song.tracks[0].measures[1].beats[1].notes[0]
+        self.assertEqual(tied.type, NoteType.TIE)
+        self.assertEqual(tied.fret, 9)
+
+    def test_preview_stops_after_window(self):
+        content = encode(build_song(), (4, 0, 6))
+        # 4/4 at 97 BPM is ~2.47s, only the first measure starts before 1s
+        song = BinaryParser(native=True).parse_preview_bytes(content, seconds=1.0)
+        self.assertEqual([len(t.measures) for t in song.tracks], [1, 1])
+
+    def test_falls_back_on_unknown_data(self):
+        with self.assertRaises(NativeReaderError):
+            NativeBinaryReader(b"\x05hello" + b"\x00" * 40).read_song()
+
+        content = encode(build_song(), (3, 0, 0))
+        truncated = content[:-10]
+        with self.assertRaises(NativeReaderError):
+            NativeBinaryReader(truncated).read_song()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import json
+import os
+import struct
+import sys
+import unittest
+from array import array
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.xml_parser import XmlParser
+from backend.core.storage.note_index import (
+    BEND_COLUMNS,
+    MAX_PAGE_MEASURES,
+    NOTE_COLUMNS,
+    NoteIndex,
+    NoteIndexCache,
+    estimated_bytes,
+    note_index_cache,
+)
+from backend.main import app
+from backend.models.song_model import EffectType, NoteType
+from differential import FIXTURES
+from gpif_factory import build_gp
+
+
+def expected_notes(song, track):
+    # (start, duration, pitch, velocity, string, tie, bend points) walking the IR
+    writer = MidiWriter(song)
+    notes = []
+    for measure in track.measures:
+        for beat in measure.beats:
+            for note in beat.notes:
+                if note.type in (NoteType.REST, NoteType.DEAD):
+                    continue
+                bends = [
+                    (p.position, p.value)
+                    for e in note.effects
+                    if e.type == EffectType.BEND
+                    for p in e.bend_points
+                ]
+                notes.append((
+                    beat.start_time, beat.duration, writer._note_pitch(track, note),
+                    min(127, max(0, note.velocity)), note.string,
+                    note.type == NoteType.TIE, bends,
+                ))
+    return notes
+
+
+def page_notes(page):
+    rows = []
+    begin = 0
+    for i, end in enumerate(page.bend_end):
+        bends = list(zip(
+            page.bends["position"][begin:end], page.bends["value"][begin:end]
+        ))
+        rows.append(tuple(page.notes[name][i] for name in NOTE_COLUMNS[:5])
+                    + (bool(page.notes["tie"][i]), bends))
+        begin = end
+    return rows
+
+
+def parse_oracle():
+    with open(os.path.join(FIXTURES, "oracle.gp5"), "rb") as f:
+        return BinaryParser().parse_bytes(f.read())
+
+
+class TestNoteIndex(unittest.TestCase):
+    def setUp(self):
+        content = build_gp(num_tracks=2, num_bars=40, bends=True)
+        self.song = XmlParser().parse_bytes(content)
+        self.index = NoteIndex.from_song(self.song)
+
+    def test_pages_match_the_song(self):
+        for song in (self.song, parse_oracle()):
+            index = NoteIndex.from_song(song)
+            for track in song.tracks:
+                notes = []
+                first = 0
+                while first is not None:
+                    page = index.page(track.number, first, 7)
+                    notes += page_notes(page)
+                    first = page.next_measure
+                self.assertEqual(notes, expected_notes(song, track))
+        first_page = page_notes(self.index.page(1, 0, 40))
+        self.assertTrue(any(bends for *_, bends in first_page))
+
+    def test_tick_windows(self):
+        track = self.song.tracks[1]
+        everything = expected_notes(self.song, track)
+        ticks = self.index.measure_ticks(2)
+        self.assertEqual(ticks[:3], [0, 3840, 7680])
+        for start, end in [(0, 1), (5000, 9000), (3840 * 39, 3840 * 50), (9000, 5000)]:
+            page = self.index.page(2, start_tick=start, end_tick=end)
+            self.assertEqual(
+                page_notes(page),
+                [n for n in everything if n[0] < end and n[0] + n[1] > start],
+            )
+
+        # Binary files start at 960
+        binary = NoteIndex.from_song(parse_oracle())
+        self.assertEqual(binary.measure_ticks(1)[0], 960)
+
+    def test_page_bounds(self):
+        self.assertEqual(self.index.page(1, 38, 10)[1:4], (38, 40, 40))
+        self.assertIsNone(self.index.page(1, 38, 10).next_measure)
+        self.assertEqual(len(self.index.page(1, 100).bend_end), 0)
+        self.assertEqual(
+            self.index.page(1, 0, 10 ** 6).end_measure, min(40, MAX_PAGE_MEASURES)
+        )
+        with self.assertRaises(KeyError):
+            self.index.page(3)
+
+    def test_binary_format(self):
+        page = self.index.page(1, 2, 3)
+        data = page.to_bytes()
+        magic, version, _, header_len = struct.unpack_from("<4sHHI", data)
+        self.assertEqual((magic, version), (b"GP2N", 1))
+        header = json.loads(data[12:12 + header_len])
+        self.assertEqual(
+            header["columns"], list(NOTE_COLUMNS) + ["bend_end"] + list(BEND_COLUMNS)
+        )
+        columns = array("i", data[12 + header_len:])
+        notes, bends = header["note_count"], header["bend_count"]
+        self.assertEqual(
+            len(columns),
+            notes * (len(NOTE_COLUMNS) + 1) + bends * len(BEND_COLUMNS),
+        )
+        self.assertEqual(
+            columns[notes * 2:notes * 3].tolist(), page.notes["pitch"].tolist()
+        )
+        self.assertEqual(columns[-bends:].tolist(), page.bends["value"].tolist())
+
+    def test_cache_is_bounded(self):
+        cache = NoteIndexCache(max_bytes=self.index.nbytes * 5)
+        for i in range(8):
+            cache.remember_song(f"song{i}", self.song)
+        self.assertIsNone(cache.get("song0"))
+        self.assertIsNotNone(cache.get("song7"))
+        self.assertLessEqual(cache.metrics()["bytes"], cache.max_bytes)
+        # More than a quarter of the cache
+        small = NoteIndexCache(max_bytes=self.index.nbytes * 2)
+        small.remember_song("big", self.song)
+        self.assertIsNone(small.get("big"))
+
+    def test_oversized_songs_are_not_packed(self):
+        self.assertLessEqual(estimated_bytes(self.song), self.index.nbytes)
+        cache = NoteIndexCache(max_bytes=estimated_bytes(self.song) * 3)
+        with mock.patch.object(NoteIndex, "from_song", side_effect=AssertionError):
+            cache.remember_song("big", self.song)
+        self.assertIsNone(cache.get("big"))
+
+
+class TestNotesApi(unittest.TestCase):
+    def setUp(self):
+        note_index_cache.clear()
+        self.client = TestClient(app)
+
+    def test_notes_after_analyze(self):
+        content = build_gp(num_tracks=2, num_bars=8, bends=True)
+        response = self.client.post(
+            "/api/analyze",
+            params={"speculate": "false"},
+            files={"file": ("song.gp", content)},
+        )
+        song_key = response.json()["song_key"]
+
+        response = self.client.get(
+            f"/api/songs/{song_key}/tracks/2/notes", params={"measures": 4}
+        )
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual((page["first_measure"], page["next_measure"]), (0, 4))
+        self.assertEqual(len(page["notes"]["pitch"]), page["note_count"])
+
+        response = self.client.get(
+            f"/api/songs/{song_key}/tracks/2/notes",
+            params={"start_tick": 0, "end_tick": 3840, "format": "binary"},
+        )
+        self.assertEqual(response.headers["content-type"], "application/octet-stream")
+        self.assertEqual(response.content[:4], b"GP2N")
+
+        response = self.client.get(f"/api/songs/{song_key}/tracks/9/notes")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/songs/unknown/tracks/1/notes")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
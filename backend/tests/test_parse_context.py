@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.budget import BudgetExceeded, ParseBudget
+from backend.core.parser import registry
+from backend.core.parser.xml_parser import XmlParser, gpif_tags
+from gpif_factory import build_gp, build_gpx
+
+
+class TestParseContext(unittest.TestCase):
+    def setUp(self):
+        self.files = [
+            build_gp(num_tracks=2, num_bars=12, bends=True),
+            build_gp(num_tracks=3, num_bars=6, articulations=True),
+            build_gpx(num_tracks=1, num_bars=20),
+        ]
+        self.expected = [XmlParser().parse_bytes(content) for content in self.files]
+
+    def test_interleaved_parses_on_one_instance(self):
+        # Before per-parse contexts the second iter_tracks() replaced the
+        # id map the first one was still reading
+        parser = XmlParser()
+        song_a, tracks_a = parser.iter_tracks(self.files[0])
+        song_b, tracks_b = parser.iter_tracks(self.files[1])
+        for track_a, track_b in zip(tracks_a, tracks_b):
+            pass
+        list(tracks_b)
+        self.assertEqual(song_a, self.expected[0])
+        self.assertEqual(song_b, self.expected[1])
+
+    def test_concurrent_parses(self):
+        parser = registry.load_parser("xml")
+        self.assertIs(parser, registry.parser_for_content(self.files[0]))
+        work = self.files * 8
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            songs = list(pool.map(parser.parse_bytes, work))
+        self.assertEqual(songs, self.expected * 8)
+
+    def test_budgets_stay_per_parse(self):
+        parser = XmlParser()
+        with self.assertRaises(BudgetExceeded):
+            parser.parse_bytes(self.files[0], budget=ParseBudget(max_notes=10))
+        # The next parse on the same instance gets its own default budget
+        self.assertEqual(parser.parse_bytes(self.files[0]), self.expected[0])
+
+    def test_tags_are_shared_per_namespace(self):
+        ns = "{http://www.guitar-pro.com/GPIF/1.0}"
+        self.assertIs(gpif_tags(ns), gpif_tags(ns))
+        self.assertEqual(gpif_tags(ns).Notes, f"{ns}Notes")
+        self.assertEqual(gpif_tags("").property_values["Velocity"], ("Number", "Int"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.budget import BudgetExceeded, ParseBudget
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.xml_parser import XmlParser
+from backend.core.pipeline import convert_pipelined, run_ahead
+from differential import build_binary
+from gpif_factory import build_gp
+
+
+def sequential(parser, content, track_numbers=None, **options):
+    song = parser.parse_bytes(content)
+    if track_numbers:
+        song.tracks = [t for t in song.tracks if t.number in track_numbers]
+    buffer = io.BytesIO()
+    MidiWriter(song, **options).write(file=buffer)
+    return buffer.getvalue()
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.content = build_gp(num_tracks=4, num_bars=16, bends=True)
+
+    def test_tracks_come_out_complete_and_in_order(self):
+        song, tracks = XmlParser().iter_tracks(self.content)
+        expected = XmlParser().parse_bytes(self.content)
+        self.assertEqual([t.measures for t in song.tracks], [[]] * 4)
+        for i, track in enumerate(tracks):
+            self.assertIs(track, song.tracks[i])
+            self.assertEqual(track.model_dump(), expected.tracks[i].model_dump())
+            # Later tracks aren't parsed yet
+            self.assertTrue(all(not t.measures for t in song.tracks[i + 1:]))
+
+    def test_same_output_as_sequential(self):
+        parser = XmlParser()
+        self.assertEqual(
+            convert_pipelined(parser, self.content), sequential(parser, self.content)
+        )
+        options = dict(compact=True, high_fidelity=False)
+        self.assertEqual(
+            convert_pipelined(parser, self.content, [2, 4], **options),
+            sequential(parser, self.content, [2, 4], **options),
+        )
+        # Parsers without a streaming mode parse first, then stream
+        binary = build_binary(num_tracks=2, num_bars=4, bends=True)
+        parser = BinaryParser()
+        self.assertEqual(
+            convert_pipelined(parser, binary), sequential(parser, binary)
+        )
+
+    def test_progress(self):
+        done = []
+        convert_pipelined(
+            XmlParser(), self.content, progress=lambda d, t, track: done.append((d, t))
+        )
+        self.assertEqual(done, [(1, 4), (2, 4), (3, 4), (4, 4)])
+
+    def test_parser_errors_reach_the_caller(self):
+        with self.assertRaises(BudgetExceeded):
+            budget = ParseBudget(max_notes=100)
+            convert_pipelined(XmlParser(), self.content, budget=budget)
+
+    def test_interval_allocation_is_not_streamed(self):
+        song, tracks = XmlParser().iter_tracks(self.content)
+        with self.assertRaises(ValueError):
+            writer = MidiWriter(song, allocation="interval")
+            writer.write(file=io.BytesIO(), tracks=tracks)
+
+    def test_run_ahead_is_bounded(self):
+        produced = []
+
+        def items():
+            for i in range(20):
+                produced.append(i)
+                yield i
+
+        stream = run_ahead(items(), depth=2)
+        self.assertEqual(next(stream), 0)
+        time.sleep(0.2)
+        # One handed out, two queued, one waiting to be queued
+        self.assertLessEqual(len(produced), 4)
+        self.assertEqual(list(stream), list(range(1, 20)))
+
+    def test_closing_stops_the_producer(self):
+        def items():
+            i = 0
+            while True:
+                yield i
+                i += 1
+
+        stream = run_ahead(items(), depth=1)
+        next(stream)
+        stream.close()
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and any(
+            t.name == "gp2midi-pipeline" for t in threading.enumerate()
+        ):
+            time.sleep(0.05)
+        names = [t.name for t in threading.enumerate()]
+        self.assertNotIn("gp2midi-pipeline", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
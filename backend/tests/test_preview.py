@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import unittest
+import zipfile
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.gpif_stream import load_preview_root
+from backend.core.parser.xml_parser import XmlParser
+from gpif_factory import build_gp
+
+
+class TestPreview(unittest.TestCase):
+    def test_preview_keeps_only_leading_measures(self):
+        # 4/4 at 120 BPM -> 2 seconds per measure
+        content = build_gp(num_tracks=2, num_bars=50, tempo=120)
+        song = XmlParser().parse_preview_bytes(content, seconds=5)
+
+        self.assertEqual(len(song.tracks), 2)
+        for track in song.tracks:
+            # Measures starting at 0s, 2s and 4s
+            self.assertEqual(len(track.measures), 3)
+            self.assertTrue(all(len(m.beats) == 4 for m in track.measures))
+
+    def test_preview_matches_full_parse_prefix(self):
+        content = build_gp(num_tracks=2, num_bars=10, bends=True)
+        full = XmlParser().parse_bytes(content)
+        preview = XmlParser().parse_preview_bytes(content, seconds=4, track_numbers=[2])
+
+        self.assertEqual([t.number for t in preview.tracks], [2])
+        self.assertEqual(preview.tracks[0].measures, full.tracks[1].measures[:2])
+
+    def test_unselected_tracks_are_not_retained(self):
+        with zipfile.ZipFile(io.BytesIO(build_gp(num_tracks=3, num_bars=10))) as z:
+            with z.open("Content/score.gpif") as f:
+                root = load_preview_root(f, seconds=2, track_indices=[0])
+
+        ns = "{http://www.guitar-pro.com/GPIF/1.0}"
+        self.assertEqual(len(root.find(f"{ns}MasterBars")), 1)
+        self.assertEqual(len(root.find(f"{ns}Bars")), 1)
+        self.assertEqual(len(root.find(f"{ns}Notes")), 4)
+
+    def test_preview_writes_small_midi(self):
+        content = build_gp(num_tracks=1, num_bars=40)
+        song = XmlParser().parse_preview_bytes(content, seconds=2)
+        buffer = io.BytesIO()
+        MidiWriter(song, high_fidelity=False).write(file=buffer)
+
+        buffer.seek(0)
+        midi = mido.MidiFile(file=buffer)
+        note_ons = [m for m in midi.tracks[1] if m.type == "note_on"]
+        self.assertEqual(len(note_ons), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import io
+import os
+import subprocess
+import sys
+import unittest
+
+import guitarpro
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.imports import import_timings, timed_import
+from backend.core.parser import registry
+from backend.core.parser.binary_parser import BinaryParser
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from gpif_factory import build_bcfs, build_gp, build_gpx
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+def build_gp5(version=(5, 1, 0)) -> bytes:
+    stream = io.BytesIO()
+    guitarpro.write(guitarpro.models.Song(), stream, version=version)
+    return stream.getvalue()
+
+
+class TestParserRegistry(unittest.TestCase):
+    def test_sniff_format(self):
+        self.assertEqual(registry.sniff_format(build_gp(num_bars=1)), registry.ZIP)
+        self.assertEqual(registry.sniff_format(build_gpx(num_bars=1)), registry.GPX)
+        bcfs = build_bcfs({"score.gpif": b"<a/>"})
+        self.assertEqual(registry.sniff_format(bcfs), registry.GPX)
+        for version in ((3, 0, 0), (4, 0, 0), (5, 0, 0)):
+            with self.subTest(version=version):
+                content = build_gp5(version)
+                self.assertEqual(registry.sniff_format(content), registry.BINARY)
+        for version in (b"CLIPBOARD GUITAR PRO 4.0 [c6]", b"CLIPBOARD GP 5.2"):
+            with self.subTest(version=version):
+                header = bytes([len(version)]) + version.ljust(30, b"\x00")
+                self.assertEqual(registry.sniff_format(header), registry.BINARY)
+                parser = registry.parser_for_content(header, "clip.gp")
+                self.assertIsInstance(parser, BinaryParser)
+        self.assertIsNone(registry.sniff_format(b""))
+        self.assertIsNone(registry.sniff_format(b"MThd\x00\x00\x00\x06"))
+
+    def test_content_wins_over_extension(self):
+        parser = registry.parser_for_content(build_gp(num_bars=1), "song.gp5")
+        self.assertIsInstance(parser, XmlParser)
+        parser = registry.parser_for_content(build_gp5(), "song.gp")
+        self.assertIsInstance(parser, BinaryParser)
+
+        # Unknown bytes: the extension decides, or nothing does
+        parser = registry.parser_for_content(b"garbage", "song.gp4")
+        self.assertIsInstance(parser, BinaryParser)
+        self.assertIsNone(registry.parser_for_content(b"garbage", "song.txt"))
+        self.assertIsNone(registry.parser_for_content(b"garbage"))
+
+    def test_renamed_upload_is_converted(self):
+        client = TestClient(app)
+        content = build_gp(num_tracks=2, num_bars=2)
+        response = client.post("/api/analyze", files={"file": ("song.gp3", content)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["tracks"]), 2)
+
+        response = client.post("/api/convert", files={"file": ("notes.txt", b"hello")})
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_timings(self):
+        module = timed_import("backend.tests.gpif_factory")
+        self.assertTrue(hasattr(module, "build_gpif"))
+        self.assertIn("backend.tests.gpif_factory", import_timings())
+        # Already imported modules are returned as they are
+        self.assertIs(timed_import("backend.tests.gpif_factory"), module)
+
+        response = TestClient(app).get("/api/metrics")
+        self.assertIn("imports", response.json())
+
+    def test_startup_does_not_import_parsers(self):
+        heavy = [
+            "guitarpro",
+            "mido",
+            "backend.core.parser.xml_parser",
+            "backend.core.parser.binary_parser",
+        ]
+        code = (
+            "import sys, backend.main; "
+            f"print(','.join(m for m in {heavy!r} if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.parser.xml_parser import XmlParser
+from backend.core.storage.shared_song import (
+    SharedSong,
+    SongDescriptor,
+    read_song,
+    share_song,
+)
+from gpif_factory import build_gp
+
+
+def midi_digest(song):
+    buffer = io.BytesIO()
+    MidiWriter(song).write(file=buffer)
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+def convert_shared(descriptor, results):
+    # Runs in a spawned process: only the descriptor was pickled
+    results.put(midi_digest(read_song(SongDescriptor(*descriptor), unlink=True)))
+
+
+class TestSharedSong(unittest.TestCase):
+    def setUp(self):
+        content = build_gp(num_tracks=2, num_bars=8, bends=True)
+        self.song = XmlParser().parse_bytes(content)
+
+    def test_round_trip(self):
+        with share_song(self.song) as shared:
+            try:
+                with SharedSong.attach(shared.descriptor) as attached:
+                    self.assertEqual(
+                        attached.to_song().model_dump(), self.song.model_dump()
+                    )
+            finally:
+                shared.unlink()
+
+    def test_columns_read_the_shared_pages(self):
+        shared = share_song(self.song)
+        try:
+            attached = SharedSong.attach(shared.descriptor)
+            frets = attached.packed.columns["note_fret"]
+            notes = sum(
+                len(b.notes)
+                for t in self.song.tracks
+                for m in t.measures
+                for b in m.beats
+            )
+            self.assertEqual(len(frets), notes)
+            # A write through the owner's mapping shows in the other one
+            shared.packed.columns["note_fret"][0] = 99
+            self.assertEqual(frets[0], 99)
+            attached.close()
+        finally:
+            shared.close()
+            shared.unlink()
+        with self.assertRaises(FileNotFoundError):
+            SharedSong.attach(shared.descriptor)
+
+    def test_handoff_to_another_process(self):
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        shared = share_song(self.song)
+        shared.close()
+        process = context.Process(
+            target=convert_shared, args=(tuple(shared.descriptor), results)
+        )
+        process.start()
+        try:
+            self.assertEqual(results.get(timeout=60), midi_digest(self.song))
+        finally:
+            process.join(10)
+        # The receiver took ownership and freed the block
+        with self.assertRaises(FileNotFoundError):
+            SharedSong.attach(shared.descriptor)
+
+
+if __name__ == "__main__":
+    unittest.main()
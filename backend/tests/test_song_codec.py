@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.parser.xml_parser import XmlParser
+from backend.core.storage import song_codec
+from backend.core.storage.song_codec import PackedSong, SongCodecError
+from backend.models.song_model import (
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+from gpif_factory import build_gp
+
+
+def build_song():
+    bend = NoteEffect(
+        type=EffectType.BEND,
+        bend_points=[BendPoint(position=0, value=0), BendPoint(position=60, value=100)],
+    )
+    notes = [
+        Note(string=3, fret=7, velocity=111, duration=0.5, type=NoteType.NORMAL,
+             effects=[bend, NoteEffect(type=EffectType.VIBRATO, value=0.25)],
+             duration_percent=0.75, midi_number=62),
+        Note(string=1, fret=0, velocity=95, duration=1 / 3, type=NoteType.TIE),
+    ]
+    lead = Track(
+        number=1, name="Lead é", channel=0, program=29, bank_msb=0,
+        tuning=[40, 45, 50, 55, 59, 64],
+        measures=[
+            Measure(number=1, numerator=4, denominator=4, beats=[
+                Beat(start_time=0, duration=480, notes=notes, text="Intro"),
+                Beat(start_time=480, duration=320, text="Intro", voice=1),
+                Beat(start_time=2**40, duration=1920),
+            ]),
+            Measure(number=2, numerator=7, denominator=8),
+        ],
+    )
+    empty = Track(number=2, name="Empty", channel=9, program=0, is_percussion=True)
+    return Song(title="Codec", artist="Tests", tempo=133, tracks=[lead, empty])
+
+
+class TestSongCodec(unittest.TestCase):
+    def test_round_trip_is_exact(self):
+        song = build_song()
+        self.assertEqual(song_codec.loads(song_codec.dumps(song)), song)
+
+    def test_round_trip_parsed_song(self):
+        song = XmlParser().parse_bytes(build_gp(num_tracks=3, num_bars=20, bends=True))
+        data = song_codec.dumps(song)
+        self.assertEqual(song_codec.loads(data).model_dump(), song.model_dump())
+        # Far smaller than the pydantic JSON of the same song
+        self.assertLess(len(data), len(song.model_dump_json()) / 2)
+
+    def test_mmap_columns_are_not_copied(self):
+        song = build_song()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "song.gp2s")
+            song_codec.dump(song, path)
+
+            with PackedSong.open(path) as packed:
+                frets = packed.columns["note_fret"]
+                self.assertIsInstance(frets, memoryview)
+                self.assertTrue(frets.readonly)
+                self.assertEqual(frets.tolist(), [7, 0])
+                self.assertEqual(packed.columns["bend_value"].tolist(), [0, 100])
+                self.assertEqual(packed.to_song(), song)
+
+            self.assertEqual(song_codec.load(path), song)
+
+    def test_rejects_bad_data(self):
+        data = song_codec.dumps(build_song())
+        with self.assertRaises(SongCodecError):
+            song_codec.loads(b"JUNK" + data[4:])
+        with self.assertRaises(SongCodecError):
+            song_codec.loads(data[:4] + b"\x63\x00" + data[6:])
+        with self.assertRaises(SongCodecError):
+            song_codec.loads(data[:-64])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend import main
+from backend.api import router as router_module
+from backend.api.admission import AdmissionController, admission
+from backend.api.speculation import SpeculativeConverter
+from backend.main import app
+from gpif_factory import build_gp
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestSpeculativeConverter(unittest.TestCase):
+    def test_result_is_reused(self):
+        async def scenario():
+            spec = SpeculativeConverter(AdmissionController(capacity=2))
+            calls = []
+
+            def render(token):
+                calls.append(token)
+                return b"midi"
+
+            self.assertTrue(spec.schedule(b"file", render))
+            # Already running, not started twice
+            self.assertFalse(spec.schedule(b"file", render))
+            self.assertEqual(await spec.get(b"file"), b"midi")
+            self.assertEqual(await spec.get(b"file"), b"midi")
+            self.assertIsNone(await spec.get(b"other"))
+            return spec, calls
+
+        spec, calls = run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((spec.hits, spec.misses, spec.completed), (2, 1, 1))
+
+    def test_no_idle_capacity(self):
+        async def scenario():
+            controller = AdmissionController(capacity=1)
+            spec = SpeculativeConverter(controller)
+            async with controller.admit(1):
+                spec.schedule(b"file", lambda token: b"midi")
+                result = await spec.get(b"file")
+            return spec, controller, result
+
+        spec, controller, result = run(scenario())
+        self.assertIsNone(result)
+        self.assertEqual(spec.dropped, 1)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_dropped_when_requests_wait(self):
+        started = threading.Event()
+
+        def slow_render(token):
+            started.set()
+            while True:
+                token.check()
+                time.sleep(0.01)
+
+        async def scenario():
+            controller = AdmissionController(capacity=2, timeout=5)
+            spec = SpeculativeConverter(controller)
+            spec.schedule(b"file", slow_render)
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+
+            async def request():
+                async with controller.admit(1):
+                    await asyncio.sleep(0.05)
+
+            # The first request takes the last idle slot, the second one
+            # has to wait: speculation gives its slot up
+            await asyncio.wait_for(asyncio.gather(request(), request()), 5)
+            return spec, controller, await spec.get(b"file")
+
+        spec, controller, result = run(scenario())
+        self.assertIsNone(result)
+        self.assertEqual(spec.dropped, 1)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_cache_is_bounded(self):
+        async def scenario():
+            spec = SpeculativeConverter(AdmissionController(capacity=1), max_bytes=1000)
+            for i in range(5):
+                spec.schedule(bytes([i]), lambda token: b"x" * 200)
+                await spec.get(bytes([i]))
+            # More than a quarter of the cache: not kept
+            spec.schedule(b"big", lambda token: b"x" * 300)
+            await spec.get(b"big")
+            return spec
+
+        spec = run(scenario())
+        self.assertEqual(spec.metrics()["cached_bytes"], 1000)
+        self.assertEqual(spec.metrics()["cached"], 5)
+        self.assertIsNone(run(spec.get(b"big")))
+
+    def test_analyze_then_convert(self):
+        content = build_gp(num_tracks=2, num_bars=4)
+        spec = SpeculativeConverter(admission)
+        with mock.patch.object(main, "EMBEDDED_WORKERS", 0), \
+                mock.patch.object(router_module, "speculation", spec), \
+                TestClient(app) as client:
+            expected = client.post(
+                "/api/convert", files={"file": ("song.gp", content)}
+            ).content
+            self.assertEqual(spec.misses, 1)
+
+            response = client.post("/api/analyze", files={"file": ("song.gp", content)})
+            self.assertEqual(response.status_code, 200)
+            response = client.post("/api/convert", files={"file": ("song.gp", content)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected)
+            self.assertEqual(spec.hits, 1)
+
+            # Other options always convert for real
+            client.post(
+                "/api/convert",
+                params={"high_fidelity": False},
+                files={"file": ("song.gp", content)},
+            )
+            self.assertEqual(spec.hits, 1)
+            metrics = client.get("/api/metrics").json()
+            self.assertEqual(metrics["speculation"]["hits_total"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
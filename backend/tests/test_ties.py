@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+import unittest
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.converter.ties import resolve_ties
+from backend.models.song_model import (
+    Beat,
+    BendPoint,
+    EffectType,
+    Measure,
+    Note,
+    NoteEffect,
+    NoteType,
+    Song,
+    Track,
+)
+
+TUNING = [64, 59, 55, 50, 45, 40]
+
+
+def note(fret, string=3, type=NoteType.NORMAL, effects=()):
+    return Note(
+        string=string, fret=fret, velocity=90, duration=0.25, type=type,
+        effects=list(effects),
+    )
+
+
+def track(*beats):
+    return Track(
+        number=1, name="Guitar", channel=0, program=29, tuning=TUNING,
+        measures=[Measure(number=1, numerator=4, denominator=4, beats=list(beats))],
+    )
+
+
+def events(track_model, high_fidelity=False):
+    song = Song(title="Ties", artist="Tests", tempo=120, tracks=[track_model])
+    buffer = io.BytesIO()
+    MidiWriter(song, high_fidelity=high_fidelity).write(file=buffer)
+    now = 0
+    out = []
+    for msg in mido.MidiFile(file=io.BytesIO(buffer.getvalue())).tracks[1]:
+        now += msg.time
+        if msg.type in ("note_on", "note_off", "pitchwheel"):
+            out.append((now, msg))
+    return out
+
+
+def notes_on(output):
+    return [(t, m.note) for t, m in output if m.type == "note_on" and m.velocity]
+
+
+def notes_off(output):
+    return [
+        (t, m.note)
+        for t, m in output
+        if m.type == "note_off" or (m.type == "note_on" and not m.velocity)
+    ]
+
+
+class TestTies(unittest.TestCase):
+    def test_chain_is_one_note(self):
+        chained = track(
+            Beat(start_time=0, duration=480, notes=[note(5)]),
+            Beat(start_time=480, duration=480, notes=[note(5, type=NoteType.TIE)]),
+            Beat(start_time=960, duration=960, notes=[note(5, type=NoteType.TIE)]),
+            Beat(start_time=1920, duration=480, notes=[note(7)]),
+        )
+        output = events(chained)
+        self.assertEqual(notes_on(output), [(0, 60), (1920, 62)])
+        self.assertEqual(notes_off(output), [(1920, 60), (2400, 62)])
+
+        chains = resolve_ties(chained, lambda n: n.fret)
+        self.assertEqual(len(chains.continuations), 2)
+        self.assertEqual(set(chains.ends.values()), {1920})
+
+    def test_tied_bend_is_kept(self):
+        bend = NoteEffect(
+            type=EffectType.BEND,
+            bend_points=[
+                BendPoint(position=0, value=100), BendPoint(position=100, value=0)
+            ],
+        )
+        tied = note(5, type=NoteType.TIE, effects=[bend])
+        output = events(track(
+            Beat(start_time=0, duration=480, notes=[note(5)]),
+            Beat(start_time=480, duration=480, notes=[tied]),
+        ), high_fidelity=True)
+        self.assertEqual(notes_on(output), [(0, 60)])
+        bends = [(t, m.pitch) for t, m in output if m.type == "pitchwheel"]
+        # Release during the tied note, back to center when the chain ends
+        self.assertEqual(bends[0][0], 480)
+        self.assertGreater(bends[0][1], 0)
+        self.assertEqual(bends[-1], (960, 0))
+        self.assertTrue(all(t <= 960 for t, _ in bends))
+
+    def test_only_matching_notes_continue(self):
+        output = events(track(
+            Beat(start_time=0, duration=480, notes=[note(5)]),
+            # Other pitch: played again
+            Beat(start_time=480, duration=480, notes=[note(6, type=NoteType.TIE)]),
+            # After a gap: played again
+            Beat(start_time=1440, duration=480, notes=[note(6, type=NoteType.TIE)]),
+            # After a rest on that string: played again
+            Beat(start_time=1920, duration=240, notes=[note(0, type=NoteType.REST)]),
+            Beat(start_time=2160, duration=240, notes=[note(6, type=NoteType.TIE)]),
+        ))
+        self.assertEqual([t for t, _ in notes_on(output)], [0, 480, 1440, 2160])
+
+    def test_voices_and_strings_are_separate(self):
+        chained = track(
+            Beat(start_time=0, duration=960, notes=[note(5), note(0, string=1)]),
+            Beat(start_time=0, duration=480, notes=[note(5)], voice=1),
+            Beat(
+                start_time=480, duration=480, notes=[note(5, type=NoteType.TIE)],
+                voice=1,
+            ),
+            Beat(start_time=960, duration=960, notes=[
+                note(5, type=NoteType.TIE), note(0, string=1, type=NoteType.TIE)
+            ]),
+        )
+        output = events(chained)
+        self.assertEqual(sorted(notes_on(output)), [(0, 60), (0, 60), (0, 64)])
+        self.assertEqual(sorted(notes_off(output)), [(960, 60), (1920, 60), (1920, 64)])
+
+    def test_tuplet_rounding_is_tolerated(self):
+        output = events(track(
+            Beat(start_time=0, duration=320, notes=[note(5)]),
+            Beat(start_time=321, duration=320, notes=[note(5, type=NoteType.TIE)]),
+        ))
+        self.assertEqual(notes_on(output), [(0, 60)])
+        self.assertEqual(notes_off(output), [(641, 60)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api import router as router_module
+from backend.api.speculation import speculation
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.converter.track_cache import TrackChunkCache, chunk_key, track_cache
+from backend.core.parser.xml_parser import XmlParser
+from backend.main import app
+from gpif_factory import build_gp
+
+
+def render(song, high_fidelity=True, cache=None, song_key=None):
+    buffer = io.BytesIO()
+    writer = MidiWriter(
+        song, high_fidelity=high_fidelity, cache=cache, song_key=song_key
+    )
+    writer.write(file=buffer)
+    return writer, buffer.getvalue()
+
+
+class TestTrackChunkCache(unittest.TestCase):
+    def setUp(self):
+        content = build_gp(num_tracks=3, num_bars=4, bends=True)
+        self.song = XmlParser().parse_bytes(content)
+
+    def test_cached_tracks_are_reused(self):
+        _, expected = render(self.song)
+        cache = TrackChunkCache()
+        writer, first = render(self.song, cache=cache, song_key="song")
+        self.assertEqual(first, expected)
+        # Tracks 1 and 3: track 2 doubles track 1 on as many channels and
+        # is copied from it
+        self.assertEqual((writer.rendered, writer.duplicates), (2, 1))
+
+        writer, second = render(self.song, cache=cache, song_key="song")
+        self.assertEqual(second, expected)
+        # Nothing was rendered
+        self.assertEqual((writer.rendered, writer.duplicates), (0, 0))
+        self.assertEqual(cache.hits, 3)
+
+        # Other fidelity, other chunks
+        _, standard = render(
+            self.song, high_fidelity=False, cache=cache, song_key="song"
+        )
+        self.assertEqual(standard, render(self.song, high_fidelity=False)[1])
+        self.assertEqual(cache.metrics()["chunks"], 6)
+
+    def test_from_cache(self):
+        cache = TrackChunkCache()
+        self.assertIsNone(MidiWriter.from_cache(cache, "song"))
+        cache.remember_song("song", self.song)
+        self.assertIsNone(MidiWriter.from_cache(cache, "song"))
+
+        render(self.song, cache=cache, song_key="song")
+        self.assertEqual(MidiWriter.from_cache(cache, "song"), render(self.song)[1])
+
+        # Dropping the last track keeps the channels of the others
+        subset = self.song.model_copy(update={"tracks": self.song.tracks[:2]})
+        cached = MidiWriter.from_cache(cache, "song", track_numbers=[1, 2])
+        self.assertEqual(cached, render(subset)[1])
+        # Dropping the first one moves the others to new channels
+        self.assertIsNone(MidiWriter.from_cache(cache, "song", track_numbers=[2, 3]))
+
+    def test_bounded_in_bytes(self):
+        cache = TrackChunkCache(max_bytes=100)
+        for i in range(5):
+            cache.put(chunk_key("song", i, True, [0]), b"x" * 40)
+        self.assertEqual(cache.metrics()["bytes"], 80)
+        self.assertIsNone(cache.get(chunk_key("song", 0, True, [0])))
+        self.assertIsNotNone(cache.get(chunk_key("song", 4, True, [0])))
+
+    def test_reconversion_skips_parsing(self):
+        content = build_gp(num_tracks=3, num_bars=4)
+        client = TestClient(app)
+        track_cache.clear()
+        speculation.clear()
+
+        full = client.post("/api/convert", files={"file": ("song.gp", content)})
+        self.assertEqual(full.status_code, 200)
+        subset = {"selected_tracks": "1,2"}
+        files = {"file": ("song.gp", content)}
+        fresh = client.post("/api/convert", params=subset, files=files).content
+        track_cache.clear()
+        client.post("/api/convert", files={"file": ("song.gp", content)})
+
+        with mock.patch.object(
+            router_module, "_parse_file_content", side_effect=AssertionError
+        ):
+            response = client.post("/api/convert", params=subset, files=files)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, fresh)
+
+            response = client.post("/api/convert", files={"file": ("song.gp", content)})
+            self.assertEqual(response.content, full.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+import mido
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.converter import midi_writer as midi_writer_module
+from backend.core.converter.fingerprint import track_fingerprint
+from backend.core.converter.midi_writer import MidiWriter
+from backend.core.converter.mtrk import encode_messages, remap_channels
+from backend.core.parser.xml_parser import XmlParser
+from gpif_factory import build_gp
+
+
+def write(song, high_fidelity=True):
+    buffer = io.BytesIO()
+    writer = MidiWriter(song, high_fidelity=high_fidelity)
+    writer.write(file=buffer)
+    return writer, buffer.getvalue()
+
+
+class TestTrackDedup(unittest.TestCase):
+    def setUp(self):
+        content = build_gp(num_tracks=1, num_bars=4, bends=True)
+        song = XmlParser().parse_bytes(content)
+        lead = song.tracks[0]
+        # Rhythm L/R doubling the lead, plus a part playing something else
+        left = lead.model_copy(
+            update={"number": 2, "name": "Rhythm L", "program": 30, "bank_msb": 1}
+        )
+        right = lead.model_copy(update={"number": 3, "name": "Rhythm R", "program": 29})
+        other = lead.model_copy(deep=True, update={"number": 4, "name": "Other"})
+        other.measures[0].beats[0].notes[0].velocity = 10
+        self.song = song.model_copy(update={"tracks": [lead, left, right, other]})
+
+    def test_fingerprint(self):
+        lead, left, right, other = self.song.tracks
+        self.assertEqual(track_fingerprint(lead), track_fingerprint(left))
+        self.assertEqual(track_fingerprint(lead), track_fingerprint(right))
+        self.assertNotEqual(track_fingerprint(lead), track_fingerprint(other))
+
+    def test_duplicates_match_a_full_render(self):
+        for high_fidelity in (True, False):
+            with self.subTest(high_fidelity=high_fidelity):
+                counter = iter(range(10**6))
+                with mock.patch.object(
+                    midi_writer_module,
+                    "track_fingerprint",
+                    side_effect=lambda t: next(counter),
+                ):
+                    full_writer, expected = write(self.song, high_fidelity)
+                self.assertEqual(full_writer.duplicates, 0)
+
+                writer, output = write(self.song, high_fidelity)
+                self.assertEqual(output, expected)
+                self.assertGreaterEqual(writer.duplicates, 1)
+
+                tracks = mido.MidiFile(file=io.BytesIO(output)).tracks[1:]
+                names = [t.name for t in tracks]
+                self.assertEqual(names, ["Track 1", "Rhythm L", "Rhythm R", "Other"])
+
+    def test_remap_channels(self):
+        messages = [
+            mido.MetaMessage("track_name", name="x", time=0),
+            mido.Message("note_on", note=60, velocity=90, channel=0, time=0),
+            # Running status
+            mido.Message("note_on", note=64, velocity=90, channel=0, time=10),
+            mido.Message("pitchwheel", pitch=-200, channel=1, time=200),
+            mido.Message("program_change", program=3, channel=1, time=0),
+            mido.Message("sysex", data=[1, 2, 3], time=0),
+            mido.Message("note_off", note=60, velocity=0, channel=1, time=300),
+            mido.Message("note_off", note=64, velocity=0, channel=0, time=0),
+            mido.MetaMessage("end_of_track", time=0),
+        ]
+        mapping = {0: 7, 1: 3}
+        remapped = [
+            m.copy(channel=mapping[m.channel]) if hasattr(m, "channel") else m
+            for m in messages
+        ]
+        self.assertEqual(
+            remap_channels(encode_messages(messages), mapping),
+            encode_messages(remapped),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
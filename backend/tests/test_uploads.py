@@ -0,0 +1,102 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.api.jobs import get_job_store
+from backend.core import budget as budget_module
+from backend.jobs.store import JobStore
+from backend.main import app
+from gpif_factory import build_gp
+
+RAW = {"Content-Type": "application/octet-stream"}
+GZIP = {**RAW, "Content-Encoding": "gzip"}
+
+
+class TestRawUploads(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.content = build_gp(num_tracks=2, num_bars=4)
+        self.multipart = self.client.post(
+            "/api/convert", files={"file": ("song.gp", self.content)}
+        )
+        self.assertEqual(self.multipart.status_code, 200)
+
+    def test_octet_stream_body(self):
+        response = self.client.post(
+            "/api/convert",
+            params={"filename": "Song.gp"},
+            content=self.content,
+            headers=RAW,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.multipart.content)
+        self.assertIn("Song.gp.mid", response.headers["content-disposition"])
+
+        # Name from a header, or none at all: the format is sniffed
+        response = self.client.post(
+            "/api/analyze", content=self.content, headers={**RAW, "X-Filename": "a.gp"}
+        )
+        self.assertEqual(len(response.json()["tracks"]), 2)
+        response = self.client.post("/api/preview", content=self.content, headers=RAW)
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip_body(self):
+        # Two members, as written by some streaming compressors
+        half = len(self.content) // 2
+        body = gzip.compress(self.content[:half]) + gzip.compress(self.content[half:])
+        response = self.client.post("/api/convert", content=body, headers=GZIP)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.multipart.content)
+
+        response = self.client.post("/api/convert", content=body[:-10], headers=GZIP)
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_bomb(self):
+        bomb = gzip.compress(b"\x00" * (4 * 1024 * 1024))
+        self.assertLess(len(bomb), 16 * 1024)
+        with mock.patch.object(budget_module, "MAX_DECOMPRESSED_BYTES", 1024 * 1024):
+            response = self.client.post("/api/analyze", content=bomb, headers=GZIP)
+        self.assertEqual(response.status_code, 413)
+
+    def test_rejected_bodies(self):
+        response = self.client.post(
+            "/api/convert",
+            content=self.content,
+            headers={**RAW, "Content-Encoding": "br"},
+        )
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post(
+            "/api/convert", content=b"{}", headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post("/api/convert", content=b"", headers=RAW)
+        self.assertEqual(response.status_code, 400)
+
+    def test_raw_job_submission(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = JobStore(os.path.join(tmp, "jobs.sqlite3"))
+            app.dependency_overrides[get_job_store] = lambda: store
+            try:
+                response = self.client.post(
+                    "/api/jobs",
+                    params={"filename": "song.gp"},
+                    content=gzip.compress(self.content),
+                    headers={**RAW, "Content-Encoding": "gzip"},
+                )
+            finally:
+                app.dependency_overrides.clear()
+            self.assertEqual(response.status_code, 202)
+            job = store.get(response.json()["job_id"])
+            self.assertEqual(job.filename, "song.gp")
+
+
+if __name__ == "__main__":
+    unittest.main()